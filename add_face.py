@@ -1,11 +1,15 @@
 import face_recognition
 import cv2, os, json
 
+from dependencies.Gallery import Gallery
+
 
 with open(os.path.join(os.path.dirname(__file__), "config.json"), "r") as conf_file:
     config = json.load(conf_file)
 
 cam = config["camera"]["main"]
+gallery = Gallery(os.path.join(os.path.dirname(__file__), "images"))
+enroll_quality = {key: value for key, value in config.get("enrollment", {}).items() if key in ("min_face", "min_sharpness")}
 
 name = input("enter the name of the person your taking a photo of: ")
 video_capture = cv2.VideoCapture(cam)
@@ -15,7 +19,6 @@ face_locations = []
 face_encodings = []
 face_names = []
 process_this_frame = True
-img_num=0
 while True:
     # Grab a single frame of video
     ret, frame = video_capture.read()
@@ -56,9 +59,12 @@ while True:
     # Hit 'q' on the keyboard to quit!
     if cv2.waitKey(1) & 0xFF == ord(' '):
         if face_locations != []:
-            img_num += 1
-            cv2.imwrite(os.path.join(os.path.dirname(__file__), f"images\{name}_photo{img_num}.jpg"), base)
-            print("img saved.")
+            # checked, encoded and saved as the next <name>_photoN, main.py picks it up from the gallery
+            result = gallery.enroll_batch([(name, [cv2.imencode(".jpg", base)[1].tobytes()])], **enroll_quality)[0]
+            if result.ok:
+                print("img saved.")
+            else:
+                print(f"img not saved, {result.reason}")
         else:
             print("no face detected")
     if cv2.waitKey(1) & 0xFF == ord('q'):
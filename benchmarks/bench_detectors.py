@@ -0,0 +1,109 @@
+import os, sys, time, json, glob, argparse
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dependencies.FaceDetectors import create_detector
+from dependencies.Tracker import iou
+
+DEFAULT_DETECTORS = [
+	{"backend": "hog", "scale": 1.0, "upsample": 1},
+	{"backend": "hog", "scale": 1.0, "upsample": 0},
+	{"backend": "dnn", "scale": 1.0},
+	{"backend": "haar", "scale": 1.0},
+	{"backend": "haar", "scale": 0.5},
+]
+
+
+def load_images(folder):
+	paths = sorted(p for ext in ("*.jpg", "*.jpeg", "*.png") for p in glob.glob(os.path.join(folder, ext)))
+	images = {}
+	for path in paths:
+		img = cv2.imread(path)
+		if img is not None:
+			images[os.path.basename(path)] = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+	return images
+
+
+def load_labels(folder, images, reference):
+	"""
+	labels.json in the folder maps file name to [[top, right, bottom, left], ...],
+	without it the reference detector's boxes are used as ground truth
+	"""
+	path = os.path.join(folder, "labels.json")
+	if os.path.exists(path):
+		with open(path, "r") as f:
+			labels = json.load(f)
+		return {name: [tuple(box) for box in labels.get(name, [])] for name in images}, "labels.json"
+	detector = create_detector(reference)
+	return {name: detector.detect(rgb) for name, rgb in images.items()}, f"reference {json.dumps(reference)}"
+
+
+def evaluate(detector, images, labels, min_iou, repeat):
+	latencies, found, matched, false_positives, total = [], 0, 0, 0, 0
+	for name, rgb in images.items():
+		detector.detect(rgb)
+		for _ in range(repeat):
+			start = time.perf_counter()
+			boxes = detector.detect(rgb)
+			latencies.append(time.perf_counter() - start)
+		truth = labels[name]
+		total += len(truth)
+		found += len(boxes)
+		used = set()
+		for box in truth:
+			best = max(((iou(box, b), i) for i, b in enumerate(boxes) if i not in used), default=(0.0, None))
+			if best[0] >= min_iou:
+				used.add(best[1])
+				matched += 1
+		false_positives += len(boxes) - len(used)
+	ms = np.array(latencies) * 1000
+	return {
+		"mean_ms": round(float(ms.mean()), 2),
+		"p50_ms": round(float(np.percentile(ms, 50)), 2),
+		"p95_ms": round(float(np.percentile(ms, 95)), 2),
+		"recall": round(matched / total, 3) if total else None,
+		"false_positives": false_positives,
+		"faces": total,
+		"found": found,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Latency and recall of the face detector backends on a folder of labelled images")
+	parser.add_argument("folder", help="images, with an optional labels.json of (top, right, bottom, left) boxes per file")
+	parser.add_argument("--detector", action="append", type=json.loads, help='detector config as JSON, e.g. \'{"backend": "haar", "scale": 0.5}\', can be repeated')
+	parser.add_argument("--reference", type=json.loads, default={"backend": "hog", "upsample": 2}, help="detector labelling the images when there is no labels.json")
+	parser.add_argument("--iou", type=float, default=0.3, help="overlap a detection needs with a labelled face to count, backends draw their boxes differently")
+	parser.add_argument("--repeat", type=int, default=3, help="timed runs per image")
+	parser.add_argument("--frame-scale", type=float, default=0.5, help="resize the images first, 0.5 is what Facerec hands the detector")
+	parser.add_argument("--output", help="write the report here instead of stdout")
+	args = parser.parse_args()
+
+	images = load_images(args.folder)
+	if not images:
+		raise SystemExit(f"no images in {args.folder}")
+	labels, source = load_labels(args.folder, images, args.reference)
+	if args.frame_scale != 1.0:
+		images = {name: cv2.resize(rgb, (0, 0), fx=args.frame_scale, fy=args.frame_scale, interpolation=cv2.INTER_AREA) for name, rgb in images.items()}
+		labels = {name: [tuple(int(v * args.frame_scale) for v in box) for box in boxes] for name, boxes in labels.items()}
+
+	report = {"folder": args.folder, "images": len(images), "labels": source, "iou": args.iou, "detectors": []}
+	for conf in args.detector or DEFAULT_DETECTORS:
+		try:
+			detector = create_detector(conf)
+		except (FileNotFoundError, ImportError) as e:
+			report["detectors"].append({"detector": conf, "error": str(e)})
+			continue
+		report["detectors"].append(dict({"detector": conf}, **evaluate(detector, images, labels, args.iou, args.repeat)))
+
+	out = json.dumps(report, indent=4)
+	if args.output:
+		with open(args.output, "w") as f:
+			f.write(out)
+	else:
+		print(out)
+
+
+if __name__ == "__main__":
+	main()
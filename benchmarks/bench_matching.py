@@ -0,0 +1,54 @@
+import os, sys, time, argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dependencies.Facerec import Facerec
+import face_recognition
+
+
+def legacy_match(known_encodings, known_names, face_encodings):
+	# the per-face compare_faces + face_distance loop detect_known_faces used before
+	names = []
+	for face_encoding in face_encodings:
+		matches = face_recognition.compare_faces(known_encodings, face_encoding)
+		name = "Unknown"
+		face_distances = face_recognition.face_distance(known_encodings, face_encoding)
+		best_match_index = np.argmin(face_distances)
+		if matches[best_match_index]:
+			name = known_names[best_match_index]
+		names.append(name)
+	return names
+
+
+def timeit(fn, repeat):
+	fn()
+	start = time.perf_counter()
+	for _ in range(repeat):
+		fn()
+	return (time.perf_counter() - start) / repeat
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Face matching cost against gallery size")
+	parser.add_argument("--sizes", default="10,100,1000,10000", help="comma separated gallery sizes")
+	parser.add_argument("--faces", type=int, default=3, help="faces per frame")
+	parser.add_argument("--photos", type=int, default=3, help="images per identity")
+	parser.add_argument("--repeat", type=int, default=50)
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(0)
+	print(f"{'gallery':>8} {'vectorized ms':>14} {'legacy ms':>10}")
+	for size in [int(s) for s in args.sizes.split(",")]:
+		encodings = list(rng.normal(0, 0.1, (size, 128)))
+		names = [f"person{i // args.photos}_photo{i % args.photos}" for i in range(size)]
+		faces = rng.normal(0, 0.1, (args.faces, 128))
+
+		fr = Facerec()
+		fr.set_gallery(encodings, names)
+		vectorized = timeit(lambda: fr.match_encodings(faces), args.repeat)
+		legacy = timeit(lambda: legacy_match(encodings, names, faces), max(1, args.repeat // 10))
+		print(f"{size:>8} {vectorized * 1000:>14.3f} {legacy * 1000:>10.3f}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,67 @@
+import os, sys, time, argparse
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dependencies.Motion import MotionDetector
+
+
+def legacy_motion(frame, frame2):
+	# the full-resolution absdiff path main.py used before the motion engine
+	diff = cv2.absdiff(frame, frame2)
+	gray = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+	blur = cv2.GaussianBlur(gray, (5,5), 0)
+	_, thresh = cv2.threshold(blur, 20, 255, cv2.THRESH_BINARY)
+	dilated = cv2.dilate(thresh, None, iterations=3)
+	contours, _ = cv2.findContours(dilated, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+	# main.py set motion on any contour at all
+	return contours != ()
+
+
+def synthetic_frames(count, width, height, noise, walking=True, seed=0):
+	# static textured background with sensor noise, optionally a box walking across it
+	rng = np.random.default_rng(seed)
+	background = rng.integers(40, 200, (height, width, 3), dtype=np.uint8)
+	background = cv2.GaussianBlur(background, (21, 21), 0)
+	for i in range(count):
+		frame = background.copy()
+		if walking:
+			x = int((i * 15) % (width - 200))
+			cv2.rectangle(frame, (x, height // 3), (x + 200, height // 3 + 300), (20, 20, 20), -1)
+		if noise:
+			frame = cv2.add(frame, rng.integers(0, noise, frame.shape, dtype=np.uint8))
+		yield frame
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Per-frame cost of the legacy motion path vs MotionDetector")
+	parser.add_argument("--frames", type=int, default=200)
+	parser.add_argument("--width", type=int, default=1280)
+	parser.add_argument("--height", type=int, default=720)
+	parser.add_argument("--noise", type=int, default=8, help="max per-pixel sensor noise")
+	args = parser.parse_args()
+
+	print(f"{'scene':>8} {'path':>8} {'ms/frame':>9} {'speedup':>8} {'motion frames':>14}")
+	for scene in ("walking", "static"):
+		frames = list(synthetic_frames(args.frames, args.width, args.height, args.noise, walking=scene == "walking"))
+
+		start = time.perf_counter()
+		legacy_hits = 0
+		for prev, frame in zip(frames, frames[1:]):
+			legacy_hits += legacy_motion(frame, prev)
+		legacy = (time.perf_counter() - start) / (len(frames) - 1)
+		print(f"{scene:>8} {'legacy':>8} {legacy * 1000:>9.3f} {1.0:>8.1f} {legacy_hits:>14}")
+
+		for model in ("average", "mog2"):
+			detector = MotionDetector(model=model)
+			detector.detect(frames[0])
+			start = time.perf_counter()
+			hits = 0
+			for frame in frames[1:]:
+				hits += detector.detect(frame).motion
+			cost = (time.perf_counter() - start) / (len(frames) - 1)
+			print(f"{scene:>8} {model:>8} {cost * 1000:>9.3f} {legacy / cost:>8.1f} {hits:>14}")
+
+
+if __name__ == "__main__":
+	main()
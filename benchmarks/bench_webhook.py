@@ -0,0 +1,56 @@
+import os, sys, time, threading, argparse, tempfile, http.server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dependencies.Webhook import WebhookBuilder
+
+
+class StandIn(http.server.BaseHTTPRequestHandler):
+	# local stand-in for the Discord webhook endpoint, every fail_every'th request gets a 429
+	fail_every = 0
+	requests = 0
+
+	def do_POST(self):
+		self.rfile.read(int(self.headers.get("Content-Length", 0)))
+		StandIn.requests += 1
+		limited = self.fail_every and StandIn.requests % self.fail_every == 0
+		self.send_response(429 if limited else 204)
+		self.send_header("Content-Type", "application/json")
+		self.end_headers()
+		if limited:
+			self.wfile.write(b'{"retry_after": 0.05}')
+
+	def log_message(self, *args):
+		pass
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Webhook dispatcher delivery against a local stand-in server")
+	parser.add_argument("--events", type=int, default=50)
+	parser.add_argument("--size", type=int, default=200_000, help="attachment size in bytes")
+	parser.add_argument("--fail-every", type=int, default=5, help="answer every Nth request with 429 (0 for never)")
+	args = parser.parse_args()
+
+	StandIn.fail_every = args.fail_every
+	server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		img = os.path.join(tmp, "snapshot.jpg")
+		with open(img, "wb") as f:
+			f.write(os.urandom(args.size))
+		webhook = WebhookBuilder(f"http://127.0.0.1:{server.server_port}/webhook", tmp, backoff=0.05, queue_size=args.events)
+		start = time.perf_counter()
+		for i in range(args.events):
+			webhook.thread("intruder", img)
+		webhook.close(timeout=60)
+		elapsed = time.perf_counter() - start
+	server.shutdown()
+
+	stats = webhook.stats()
+	print(f"{args.events} events in {elapsed:.2f}s ({StandIn.requests} requests)")
+	for key, value in stats.items():
+		print(f"{key:>13}: {value:.4f}" if isinstance(value, float) else f"{key:>13}: {value}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,184 @@
+import os, sys, time, json, argparse
+import numpy as np
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from dependencies.Motion import MotionDetector
+from dependencies.Scheduler import InferenceScheduler
+from dependencies.StateMachine import DetectionSession
+from dependencies.Pipeline import face_stage, run_face, run_pose, empty_locations
+from bench_motion import synthetic_frames
+
+
+def video_frames(path):
+	cap = cv2.VideoCapture(path)
+	if not cap.isOpened():
+		raise SystemExit(f"Could not open {path}")
+	try:
+		while True:
+			ret, frame = cap.read()
+			if not ret:
+				break
+			yield frame
+	finally:
+		cap.release()
+
+
+def video_fps(path, default):
+	cap = cv2.VideoCapture(path)
+	fps = cap.get(cv2.CAP_PROP_FPS)
+	cap.release()
+	return fps or default
+
+
+def percentiles(samples):
+	if not samples:
+		return {"count": 0}
+	ms = np.array(samples) * 1000
+	return {
+		"count": len(samples),
+		"mean": round(float(ms.mean()), 3),
+		"p50": round(float(np.percentile(ms, 50)), 3),
+		"p95": round(float(np.percentile(ms, 95)), 3),
+		"p99": round(float(np.percentile(ms, 99)), 3),
+	}
+
+
+def build_stages(conf, args):
+	camera = conf["camera"]
+	motion_conf = conf.get("motion", {})
+	zones = motion_conf.get("zones", {})
+	scheduler_conf = conf.get("scheduler", {})
+	tracking_conf = conf.get("tracking", {})
+	face_conf = conf.get("face", {})
+
+	motion = MotionDetector(
+		width=motion_conf.get("width", 320),
+		model=motion_conf.get("model", "average"),
+		learning_rate=motion_conf.get("learning_rate", 0.05),
+		threshold=motion_conf.get("threshold", 25),
+		min_area=motion_conf.get("min_area", 5000),
+		min_score=motion_conf.get("min_score", 0.0),
+		include=zones.get("include") or None,
+		exclude=zones.get("exclude") or None)
+	scheduler = InferenceScheduler(
+		enabled=scheduler_conf.get("enabled", True) and not args.no_scheduler,
+		idle_interval=scheduler_conf.get("idle_interval", 15),
+		wake_frames=scheduler_conf.get("wake_frames", 30))
+	session = DetectionSession(camera["body_inc"], camera["face_inc"], camera["motion_inc"], camera["undetected_time"],
+		conf["settings"]["motion_detection"], notifications=True)
+
+	face = None
+	if not args.no_face:
+		tracking_kwargs = None
+		if tracking_conf.get("enabled", True):
+			tracking_kwargs = {key: tracking_conf[key] for key in ("detect_interval", "max_misses", "reencode_below", "decay", "match_margin", "confirm") if key in tracking_conf}
+		face = face_stage({"tolerance": face_conf.get("tolerance", 0.6), "aggregate": face_conf.get("aggregate", "min"), "detector": face_conf.get("detector", {})}, tracking_kwargs)
+		# only reads the published gallery, a benchmark must not rewrite the one main.py uses
+		face.load_encoding_images(args.images, sync=False)
+	pose = None
+	if not args.no_pose:
+		from dependencies.Presence import PresenceDetector
+		presence_conf = conf.get("presence", {})
+		pose = PresenceDetector(**{key: presence_conf[key] for key in ("width", "model_complexity", "motion_regions", "skip_on_face", "escalate") if key in presence_conf})
+	return motion, scheduler, session, face, pose
+
+
+def replay(frames, stages, fps):
+	"""
+	Run frames through motion -> scheduler -> face/pose -> state machine the way main.py does
+	:param fps: source frame rate, used for the event times
+	:return: (stage latencies, events)
+	"""
+	motion_detector, scheduler, session, face, pose = stages
+	timings = {"motion": [], "face": [], "face_detect": [], "face_encode": [], "pose": [], "session": [], "frame": []}
+	events = []
+	for index, frame in enumerate(frames):
+		t0 = time.perf_counter()
+		if frame.shape[:2] != (720, 1280):
+			frame = cv2.resize(frame, (1280, 720))
+
+		t = time.perf_counter()
+		moved = motion_detector.detect(frame)
+		timings["motion"].append(time.perf_counter() - t)
+
+		face_locations, face_names, body, identity = empty_locations(), [], False, None
+		if scheduler.should_run(moved.motion, session.open):
+			if face is not None:
+				face_locations, face_names, identity, face_timings = run_face(face, frame)
+				for stage, seconds in face_timings.items():
+					timings[stage].append(seconds)
+			if pose is not None:
+				bbox, seconds = run_pose(pose, frame, moved.boxes, face_locations)
+				body = bbox is not None
+				timings["pose"].append(seconds)
+
+		t = time.perf_counter()
+		actions = session.update(moved.motion, face_names, body, identity)
+		timings["session"].append(time.perf_counter() - t)
+		for action in actions:
+			event = {"frame": index, "time": round(index / fps, 3), "kind": action.kind}
+			for field in ("text", "prefix", "notify"):
+				if getattr(action, field) is not None:
+					event[field] = getattr(action, field)
+			events.append(event)
+
+		timings["frame"].append(time.perf_counter() - t0)
+	return timings, events
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Replay recorded or synthetic frames through the detection pipeline, headless")
+	parser.add_argument("--video", action="append", default=[], help="video file to replay, can be repeated")
+	parser.add_argument("--synthetic", type=int, default=0, help="replay N synthetic frames (a box walking across a noisy scene)")
+	parser.add_argument("--fps", type=float, default=30.0, help="source frame rate for synthetic frames")
+	parser.add_argument("--config", default=os.path.join(ROOT, "config.json"))
+	parser.add_argument("--images", default=os.path.join(ROOT, "images"), help="face gallery directory")
+	parser.add_argument("--no-face", action="store_true", help="skip the face stage")
+	parser.add_argument("--no-pose", action="store_true", help="skip the person presence (pose) stage")
+	parser.add_argument("--no-scheduler", action="store_true", help="run face and pose on every frame")
+	parser.add_argument("--output", help="write the report here instead of stdout")
+	args = parser.parse_args()
+	if not args.video and not args.synthetic:
+		parser.error("give --video and/or --synthetic")
+
+	with open(args.config, "r") as f:
+		conf = json.load(f)
+
+	sources = [(path, video_frames(path), video_fps(path, args.fps)) for path in args.video]
+	if args.synthetic:
+		sources.append(("synthetic", synthetic_frames(args.synthetic, 1280, 720, 8), args.fps))
+
+	report = {"config": args.config, "stages": {"face": not args.no_face, "pose": not args.no_pose}, "runs": []}
+	for name, frames, fps in sources:
+		# fresh stages per source so one clip's background model and session don't leak into the next
+		stages = build_stages(conf, args)
+		timings, events = replay(frames, stages, fps)
+		# decoding/generating the source is not part of the pipeline, fps is over the per-frame time only
+		elapsed = sum(timings["frame"])
+		run = {
+			"source": name,
+			"frames": len(timings["frame"]),
+			"fps": round(len(timings["frame"]) / elapsed, 2) if elapsed else 0.0,
+			"latency_ms": {stage: percentiles(samples) for stage, samples in timings.items()},
+			"scheduler": stages[1].stats(),
+			"events": events,
+		}
+		if hasattr(stages[3], "stats"):
+			run["tracker"] = stages[3].stats()
+		if stages[4] is not None:
+			run["presence"] = stages[4].stats()
+		report["runs"].append(run)
+
+	out = json.dumps(report, indent=4)
+	if args.output:
+		with open(args.output, "w") as f:
+			f.write(out)
+	else:
+		print(out)
+
+
+if __name__ == "__main__":
+	main()
@@ -1,8 +1,9 @@
-import discord, os, asyncio, logging, sys, traceback, requests, random, colorama, glob
+import discord, os, asyncio, logging, sys, traceback, requests, random, colorama, io, cv2
+import numpy as np
 from discord.ext import commands
 import json
 
-from dependencies.Facedet import FaceDet
+from dependencies.Gallery import Gallery
 
 colorama.init()
 
@@ -20,8 +21,8 @@ with open(os.path.join(os.path.dirname(__file__), "config.json"), "r") as conf_f
 bot_token = config.get("discord", {}).get("bot_token", "")
 
 TOKEN = bot_token
-facedet = FaceDet(os.path.dirname(__file__))
-images_path = os.path.join(os.path.dirname(__file__), "images\\")
+gallery = Gallery(os.path.join(os.path.dirname(__file__), "images"))
+enroll_quality = {key: value for key, value in config.get("enrollment", {}).items() if key in ("min_face", "min_sharpness")}
 bot = commands.Bot(command_prefix='.', intents=discord.Intents.all())
 bot.remove_command('help')
 @bot.event
@@ -42,72 +43,43 @@ async def on_message(message):
 
 @bot.command()
 async def addface(ctx, name):
-    f_types = (os.path.join(images_path,"*.jpg"), os.path.join(images_path,'*.png'))
-    faces = []
-    for files in f_types:
-        faces.extend(glob.glob(files))
-    for i, face in enumerate(faces):
-        _, face = os.path.split(face)
-        faces[i] = face
-    for i, face in enumerate(faces):
-        face = face.split(".")[0]
-        faces[i] = face
-    if name in faces:
+    if name in gallery.users():
         await ctx.send(f"**{name}** is already in the database.")
     else:
         if len(ctx.message.attachments) > 0:
             attachment = ctx.message.attachments[0]
             if (attachment.filename.endswith(".jpg") or attachment.filename.endswith(".jpeg") or attachment.filename.endswith(".png")):
                 img_data = requests.get(attachment.url).content
-                with open(os.getenv("TEMP") + fr"\ud_{name}.jpg", "wb") as handler:
-                    handler.write(img_data)
-                detector = facedet.findface(os.getenv("TEMP") + fr"\ud_{name}.jpg", name)
-                if detector:
-                    await ctx.send(f"**{name}** added to database.", file=discord.File(detector[2]))
-                    os.remove(detector[2])
+                # checked and encoded once, off the event loop, main.py picks the encoding up from the gallery
+                result = await asyncio.to_thread(gallery.enroll, name, img_data, **enroll_quality)
+                if result.ok:
+                    image = cv2.imdecode(np.frombuffer(img_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                    top, right, bottom, left = result.box
+                    cv2.rectangle(image, (left, top), (right, bottom), (0, 255, 0), 1)
+                    preview = io.BytesIO(cv2.imencode(".jpg", image)[1].tobytes())
+                    await ctx.send(f"**{name}** added to database.", file=discord.File(preview, filename=f"{name}_det.jpg"))
                 else:
-                    await ctx.send(f"**No face detected in image**, please try again in good lighting with your face in the centre of the screen.")
+                    await ctx.send(f"**Not added, {result.reason}**, please try again in good lighting with your face in the centre of the screen.")
 
         else:
             await ctx.send("No **image** attached to command.")
 
 @bot.command()
 async def delface(ctx, name):
-    f_types = (os.path.join(images_path,"*.jpg"), os.path.join(images_path,'*.png'))
-    faces = []
-    for files in f_types:
-        faces.extend(glob.glob(files))
-    for i, face in enumerate(faces):
-        _, face = os.path.split(face)
-        faces[i] = face
-    for i, face in enumerate(faces):
-        face = face.split(".")[0]
-        faces[i] = face
-    if name in faces:
-        os.remove(os.path.join(os.path.dirname(__file__), fr"images\{name}.jpg"))
+    if gallery.remove(name):
         await ctx.send(f"**{name}** removed from database.")
     else:
         await ctx.send(f"**{name}** is not in the database.")
 
 @bot.command()
 async def listfaces(ctx):
-    f_types = (os.path.join(images_path,"*.jpg"), os.path.join(images_path,'*.png'))
-    faces = []
-    for files in f_types:
-        faces.extend(glob.glob(files))
-    for i, face in enumerate(faces):
-        _, face = os.path.split(face)
-        faces[i] = face
-    message = ""
-    for face in faces:
-        face = face.split(".")[0]
-        message += f"{face}, "
-    message = message[:-2]
+    faces = gallery.users()
+    message = ", ".join(faces)
     images = []
-    for image in faces:
-        image = os.path.join(os.path.dirname(__file__), f"images\{image}")
-        image = discord.File(image)
-        images.append(image)
+    for face in faces:
+        image = gallery.image_path(face)
+        if image is not None:
+            images.append(discord.File(image))
     try:
         if len(faces) > 1:
             await ctx.send(message + " (in order)", files=images)
@@ -0,0 +1,193 @@
+import threading, collections, time, os, cv2
+from datetime import datetime
+
+from dependencies.Pipeline import InferenceResult, empty_locations
+
+
+class CameraUnit:
+	"""
+	One camera's loop: capture, motion, face/pose through its inference
+	handle, the detection session, recording and notifications. Runs on its
+	own thread, several units can share one InferencePool and webhook.
+	:param speak: called with the text to announce
+	:param publish: called with (frame, Frame, meta) for the live feed, or None
+	:param label: prefix for prints and speech, tells cameras apart
+	:param events: EventStore the detections are logged to, or None
+	:param snapshots: SnapshotWriter shared by the cameras
+	:param heartbeat: called with the camera name after every frame that made it through, or None
+	"""
+	def __init__(self, name, cap, inference, motion_detector, scheduler, session, recorder, metrics, clip_dir, speak, webhook, snapshots, publish=None, label="", events=None, heartbeat=None):
+		self.name = name
+		self.cap = cap
+		self.inference = inference
+		self.motion_detector = motion_detector
+		self.scheduler = scheduler
+		self.session = session
+		self.recorder = recorder
+		self.metrics = metrics
+		self.clip_dir = clip_dir
+		self.speak = speak
+		self.webhook = webhook
+		self.snapshots = snapshots
+		self.publish = publish
+		self.label = label
+		self.events = events
+		self.heartbeat = heartbeat
+		self.running = False
+		self.thread = None
+		self.error = None
+		self.changes = collections.deque()
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self._run, name=f"Camera-{self.name}", daemon=True)
+		self.thread.start()
+		return self
+
+	def _run(self):
+		try:
+			while self.running:
+				self.step()
+		except BaseException as e:
+			self.error = e
+			raise
+
+	def between_frames(self, change):
+		"""
+		Call change() on the camera's thread before its next frame, settings never change halfway through one
+		"""
+		self.changes.append(change)
+
+	def step(self):
+		while self.changes:
+			self.changes.popleft()()
+		frame_start = time.perf_counter()
+		pair = self.cap.latest_pair()
+		if pair is None:
+			print(f"{self.label}Error: Could not read frames from camera.")
+			return
+		frame = pair[0].image
+		if frame.shape[:2] != (720, 1280):
+			frame = cv2.resize(frame, (1280, 720))
+		stage_start = time.perf_counter()
+		self.metrics.observe("capture", stage_start - frame_start)
+		moved = self.motion_detector.detect(frame)
+		motion = moved.motion
+		self.metrics.observe("motion", time.perf_counter() - stage_start)
+
+		# face and pose only run while something moves or a session is open
+		frame_index = None
+		if self.scheduler.should_run(motion, self.session.open):
+			frame_index = self.inference.submit(frame, active=motion or self.session.open, regions=moved.boxes)
+
+		## face
+		if frame_index is not None:
+			stage_start = time.perf_counter()
+			result = self.inference.collect(frame_index)
+			# time the loop waited for face and pose, the stages themselves report their own time
+			self.metrics.observe("inference", time.perf_counter() - stage_start)
+			for stage, seconds in result.timings.items():
+				self.metrics.observe(stage, seconds)
+		else:
+			result = InferenceResult(None, empty_locations(), [], False, None, None)
+
+		# drawn after collect, the frame may still be in use by the inference workers until then
+		for (x, y, w, h) in moved.boxes:
+			cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 225, 225), 1)
+		if motion:
+			cv2.putText(frame, "Status: {}".format('Movement'), (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 225, 225), 2)
+		face_names = result.face_names
+		for face_loc, name in zip(result.face_locations, face_names):
+			if name == "Unknown":
+				color = (0, 0, 225)
+			else:
+				color = (0, 225, 0)
+			y1, x2, y2, x1 = face_loc[0], face_loc[1], face_loc[2], face_loc[3]
+
+			cv2.putText(frame, name,(x1, y1 - 10), cv2.FONT_HERSHEY_DUPLEX, 1, color, 1)
+			cv2.rectangle(frame, (x1, y1), (x2, y2), color, 1)
+		body = result.body
+		if body:
+			cv2.rectangle(frame, result.body_bbox, (255, 0, 255), 3)
+
+		## recorder
+		# frames before a session opens become the next clip's pre-roll
+		stage_start = time.perf_counter()
+		self.recorder.push(frame, pair[0].timestamp)
+
+		## notification
+		actions = self.session.update(motion, face_names, body, result.identity)
+		if actions:
+			# file names only when something is saved, the writers create the hour folders
+			now = datetime.now()
+			file_t = now.strftime("%d-%m-%Y_%H-%M-%S")
+			path = os.path.join(self.clip_dir, now.strftime("%d-%m-%Y_%H"))
+		for action in actions:
+			media = None
+			if action.kind == "speak":
+				self.speak(self.label + action.text)
+			elif action.kind == "snapshot":
+				media = os.path.join(path, f"{action.prefix}_{file_t}.jpg")
+				# the webhook gets the JPEG bytes straight from the writer
+				notify = None
+				if action.notify:
+					notify = lambda filename, jpeg, args=action.notify: self.webhook.thread(*args, (filename, jpeg))
+				self.snapshots.save(frame, media, on_encoded=notify)
+			elif action.kind == "record_start":
+				# the clip starts with the pre-roll so the moment someone walks in is kept
+				self.recorder.start(os.path.join(path, f"recording_{file_t}.avi"))
+			elif action.kind == "record_stop":
+				# the clip is logged and sent once the writer has closed it
+				self.recorder.stop(on_finished=lambda clip, send=action.notify: self._clip_finished(clip, send))
+			elif action.kind == "reset":
+				print(f"{self.label}Camera reset. ({self.cap.dropped} frames dropped, {self.scheduler.skipped} inference frames skipped)")
+				if self.events is not None:
+					self.events.add("session_end", self.name)
+			if action.event and self.events is not None:
+				self.events.add(action.event, self.name, action.identity, media)
+		self.metrics.observe("record", time.perf_counter() - stage_start)
+
+		if self.publish is not None:
+			stage_start = time.perf_counter()
+			self.publish(frame, pair[0], {
+				"camera": self.name,
+				"motion": motion,
+				"motion_score": round(moved.score, 4),
+				"body": body,
+				"faces": face_names,
+			})
+			self.metrics.observe("publish", time.perf_counter() - stage_start)
+
+		self.metrics.observe("frame", time.perf_counter() - frame_start)
+		self.metrics.inc("frames")
+		if self.heartbeat is not None:
+			self.heartbeat(self.name)
+
+	def _clip_finished(self, clip, send):
+		if self.events is not None:
+			self.events.add("recording", self.name, media=clip)
+		if send:
+			self.webhook.thread("recording", clip)
+
+	def report(self):
+		"""
+		Copy the camera's component counters into its metrics, called about once a second
+		"""
+		self.metrics.collect("capture", self.cap.stats())
+		self.metrics.collect("inference", self.scheduler.stats())
+		self.metrics.collect("presence", self.inference.presence_stats())
+		self.metrics.collect("recorder", {"dropped": self.recorder.dropped, "skipped": self.recorder.skipped, "clips": self.recorder.clips})
+		self.metrics.gauge("session_open", int(self.session.open))
+		# the recorder already keeps a smoothed loop rate for its clips
+		self.metrics.gauge("fps", round(self.recorder.fps, 2))
+
+	def stop(self):
+		self.running = False
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join(timeout=5)
+
+	def close(self):
+		self.stop()
+		self.recorder.close()
+		self.inference.close()
+		self.cap.release()
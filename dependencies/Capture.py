@@ -0,0 +1,80 @@
+import threading, collections, time, cv2
+
+# A captured frame, index counts every successful read from the camera
+Frame = collections.namedtuple("Frame", ["index", "timestamp", "image"])
+
+
+class FrameGrabber:
+	"""
+	Reads the camera on its own thread into a small ring buffer so the
+	detection loop always works on the newest frame instead of chaining
+	blocking cap.read() calls.
+	"""
+	def __init__(self, source, width=1280, height=720, buffer_size=4):
+		self.source = source
+		self.cap = cv2.VideoCapture(source)
+		self.cap.set(3, width)
+		self.cap.set(4, height)
+		self.buffer = collections.deque(maxlen=max(2, buffer_size))
+		self.cond = threading.Condition()
+		self.running = False
+		self.thread = None
+
+		# counters
+		self.captured = 0
+		self.dropped = 0
+		self.failed = 0
+		self._last_index = 0
+
+	def start(self):
+		self.running = True
+		self.thread = threading.Thread(target=self._run, name="FrameGrabber", daemon=True)
+		self.thread.start()
+		return self
+
+	def _run(self):
+		while self.running:
+			ret, img = self.cap.read()
+			if not ret or img is None:
+				self.failed += 1
+				time.sleep(0.01)
+				continue
+			with self.cond:
+				self.captured += 1
+				self.buffer.append(Frame(self.captured, time.time(), img))
+				self.cond.notify_all()
+
+	def latest_pair(self, timeout=1.0):
+		"""
+		Wait for a frame newer than the last one handed out
+		:return: (current, previous) Frames, current.image is a copy the caller may draw on,
+		         or None if no new frame arrived within timeout
+		"""
+		with self.cond:
+			if not self.cond.wait_for(lambda: self.buffer and self.buffer[-1].index > self._last_index, timeout):
+				return None
+			current = self.buffer[-1]
+			previous = self.buffer[-2] if len(self.buffer) > 1 else current
+			if self._last_index:
+				self.dropped += current.index - self._last_index - 1
+			self._last_index = current.index
+		return current._replace(image=current.image.copy()), previous
+
+	def resize(self, buffer_size):
+		"""
+		Change the ring buffer size without reopening the camera
+		"""
+		with self.cond:
+			self.buffer = collections.deque(self.buffer, maxlen=max(2, buffer_size))
+
+	def get(self, prop):
+		return self.cap.get(prop)
+
+	def stats(self):
+		return {"captured": self.captured, "dropped": self.dropped, "failed": self.failed}
+
+	def release(self):
+		self.running = False
+		if self.thread is not None:
+			self.thread.join(timeout=2)
+		self.cap.release()
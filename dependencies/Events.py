@@ -0,0 +1,172 @@
+import sqlite3, threading, queue, json, time, os, re
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+	id INTEGER PRIMARY KEY,
+	ts REAL NOT NULL,
+	kind TEXT NOT NULL,
+	camera TEXT NOT NULL DEFAULT '',
+	identity TEXT,
+	media TEXT,
+	meta TEXT
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_kind_ts ON events (kind, ts);
+CREATE INDEX IF NOT EXISTS events_camera_ts ON events (camera, ts);
+CREATE INDEX IF NOT EXISTS events_identity_ts ON events (identity, ts);
+CREATE UNIQUE INDEX IF NOT EXISTS events_media ON events (media) WHERE media IS NOT NULL;
+"""
+
+# <prefix>_<dd-mm-YYYY_HH-MM-SS>.<ext> files written under clipped/[<camera>/]<dd-mm-YYYY_HH>/
+MEDIA_NAME = re.compile(r"^(?P<prefix>.+)_(?P<time>\d{2}-\d{2}-\d{4}_\d{2}-\d{2}-\d{2})\.(jpg|avi)$")
+PREFIX_KINDS = {"body": "person", "body_1": "person", "body_nf": "no_face", "body_nf2": "intruder", "unknown_face": "face", "recording": "recording"}
+
+
+def kind_of(prefix):
+	"""
+	Event kind and identity for a snapshot/clip file name prefix
+	:return: (kind, identity) or None if it is not a known prefix
+	"""
+	if prefix in PREFIX_KINDS:
+		return PREFIX_KINDS[prefix], None
+	match = re.match(r"^verification_(.+)_face$", prefix)
+	if match:
+		name = match.group(1)
+		return ("unknown" if name == "Unknown" else "login"), name
+	return None
+
+
+def connect(path, readonly=False):
+	if readonly:
+		conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+	else:
+		conn = sqlite3.connect(path, check_same_thread=False)
+	conn.row_factory = sqlite3.Row
+	return conn
+
+
+def query(conn, kind=None, camera=None, identity=None, since=None, until=None, cursor=None, limit=50):
+	"""
+	Newest first, keyset paginated
+	:param cursor: "next" of the previous page
+	:return: (list of event dicts, cursor for the next page or None)
+	"""
+	where, args = [], []
+	for column, value in (("kind", kind), ("camera", camera), ("identity", identity)):
+		if value is not None:
+			where.append(f"{column} = ?")
+			args.append(value)
+	if since is not None:
+		where.append("ts >= ?")
+		args.append(since)
+	if until is not None:
+		where.append("ts < ?")
+		args.append(until)
+	if cursor:
+		ts, event_id = cursor.split("_")
+		where.append("(ts < ? OR (ts = ? AND id < ?))")
+		args += [float(ts), float(ts), int(event_id)]
+	sql = "SELECT * FROM events"
+	if where:
+		sql += " WHERE " + " AND ".join(where)
+	sql += " ORDER BY ts DESC, id DESC LIMIT ?"
+	rows = conn.execute(sql, args + [limit + 1]).fetchall()
+	events = [dict(row, meta=json.loads(row["meta"]) if row["meta"] else {}, time=datetime.fromtimestamp(row["ts"]).isoformat(timespec="seconds")) for row in rows[:limit]]
+	next_cursor = None
+	if len(rows) > limit:
+		last = events[-1]
+		next_cursor = f"{last['ts']!r}_{last['id']}"
+	return events, next_cursor
+
+
+class EventStore:
+	"""
+	SQLite log of detections with pointers to their snapshots and clips.
+	add() only queues the event, one writer thread inserts them in batches
+	so the frame loop never waits on the disk. The database runs in WAL
+	mode, so run.py can read while the pipeline writes.
+	"""
+	def __init__(self, path, queue_size=1000, batch=64):
+		self.path = path
+		self.batch = batch
+		self.queue = queue.Queue(maxsize=queue_size)
+		new = not os.path.exists(path)
+		conn = connect(path)
+		conn.execute("PRAGMA journal_mode=WAL")
+		conn.executescript(SCHEMA)
+		conn.close()
+		self.created = new
+
+		# counters
+		self.written = 0
+		self.dropped = 0
+
+		self.worker = threading.Thread(target=self._run, name="EventStore", daemon=True)
+		self.worker.start()
+
+	def add(self, kind, camera="", identity=None, media=None, ts=None, meta=None):
+		try:
+			self.queue.put_nowait((time.time() if ts is None else ts, kind, camera, identity, media, json.dumps(meta) if meta else None))
+		except queue.Full:
+			self.dropped += 1
+
+	def backfill(self, clip_dir, camera=""):
+		"""
+		Queue events for the snapshots and clips already under clip_dir, media
+		that is already in the store is skipped
+		:param camera: camera of the files directly under clip_dir/<hour>, files under clip_dir/<camera>/<hour> get that camera
+		"""
+		self.queue.put(("backfill", clip_dir, camera))
+
+	def _scan(self, clip_dir, default_camera):
+		for root, _, files in os.walk(clip_dir):
+			parent = os.path.relpath(root, clip_dir).split(os.sep)
+			camera = parent[0] if len(parent) == 2 else default_camera
+			for filename in files:
+				match = MEDIA_NAME.match(filename)
+				event = match and kind_of(match.group("prefix"))
+				if not event:
+					continue
+				ts = datetime.strptime(match.group("time"), "%d-%m-%Y_%H-%M-%S").timestamp()
+				yield (ts, event[0], camera, event[1], os.path.join(root, filename), None)
+
+	def _run(self):
+		conn = connect(self.path)
+		conn.execute("PRAGMA synchronous=NORMAL")
+		insert = "INSERT OR IGNORE INTO events (ts, kind, camera, identity, media, meta) VALUES (?, ?, ?, ?, ?, ?)"
+		try:
+			while True:
+				job = self.queue.get()
+				if job is None:
+					break
+				before = conn.total_changes
+				if job[0] == "backfill":
+					conn.executemany(insert, self._scan(job[1], job[2]))
+					conn.commit()
+					self.written += conn.total_changes - before
+					print(f"Event store backfilled {conn.total_changes - before} files")
+					continue
+				rows = [job]
+				while len(rows) < self.batch:
+					try:
+						job = self.queue.get_nowait()
+					except queue.Empty:
+						break
+					if job is None or job[0] == "backfill":
+						# handled after this batch is written
+						self.queue.put(job)
+						break
+					rows.append(job)
+				conn.executemany(insert, rows)
+				conn.commit()
+				self.written += conn.total_changes - before
+		finally:
+			conn.close()
+
+	def stats(self):
+		return {"queue_depth": self.queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+	def close(self, timeout=5):
+		self.queue.put(None)
+		self.worker.join(timeout=timeout)
@@ -0,0 +1,137 @@
+import os, cv2
+import numpy as np
+
+# OpenCV's res10 SSD face detector, not shipped with opencv-python
+DNN_FILES = {
+	"deploy.prototxt": "https://raw.githubusercontent.com/opencv/opencv/master/samples/dnn/face_detector/deploy.prototxt",
+	"res10_300x300_ssd_iter_140000.caffemodel": "https://raw.githubusercontent.com/opencv/opencv_3rdparty/dnn_samples_face_detector_20170830/res10_300x300_ssd_iter_140000.caffemodel",
+}
+
+
+class FaceDetector:
+	"""
+	Finds faces in an RGB frame, returns (top, right, bottom, left) boxes in
+	that frame's coordinates, the format face_recognition encodes from.
+	:param scale: the frame is resized by this factor before detecting, smaller is faster but misses small faces
+	:param upsample: how many times the frame is doubled on top of scale, finds smaller faces at 4x the cost each
+	"""
+	name = None
+
+	def __init__(self, scale=1.0, upsample=0):
+		self.scale = scale
+		self.upsample = upsample
+
+	def _input_factor(self):
+		return self.scale * (2 ** self.upsample)
+
+	def detect(self, rgb):
+		factor = self._input_factor()
+		if factor != 1.0:
+			image = cv2.resize(rgb, (0, 0), fx=factor, fy=factor, interpolation=cv2.INTER_AREA if factor < 1.0 else cv2.INTER_LINEAR)
+		else:
+			image = rgb
+		boxes = self._detect(image)
+		if not boxes:
+			return []
+		height, width = rgb.shape[:2]
+		boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4) / factor
+		boxes = np.clip(boxes, 0, [height, width, height, width]).astype(int)
+		return [tuple(int(v) for v in box) for box in boxes if box[2] > box[0] and box[1] > box[3]]
+
+	def _detect(self, image):
+		raise NotImplementedError
+
+
+class HogDetector(FaceDetector):
+	"""
+	dlib's HOG detector through face_recognition, what Facerec always used.
+	upsample is dlib's own pyramid upsampling, the face_recognition default is 1.
+	"""
+	name = "hog"
+
+	def __init__(self, scale=1.0, upsample=1):
+		super().__init__(scale, upsample)
+		import face_recognition
+		self.face_locations = face_recognition.face_locations
+
+	def _input_factor(self):
+		return self.scale
+
+	def _detect(self, image):
+		return self.face_locations(image, number_of_times_to_upsample=self.upsample, model="hog")
+
+
+class DnnDetector(FaceDetector):
+	"""
+	OpenCV's res10 300x300 SSD, usually the most accurate of the three on
+	side and tilted faces. The network always sees size x size pixels.
+	:param confidence: minimum detection score (0-1)
+	:param model_dir: folder holding the files in DNN_FILES
+	"""
+	name = "dnn"
+
+	def __init__(self, scale=1.0, upsample=0, confidence=0.5, size=300, model_dir="models"):
+		super().__init__(scale, upsample)
+		self.confidence = confidence
+		self.size = size
+		if not os.path.isabs(model_dir):
+			model_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), model_dir)
+		missing = [name for name in DNN_FILES if not os.path.exists(os.path.join(model_dir, name))]
+		if missing:
+			raise FileNotFoundError(f"the dnn face detector needs {', '.join(missing)} in {model_dir}: " + ", ".join(DNN_FILES[name] for name in missing))
+		self.net = cv2.dnn.readNetFromCaffe(os.path.join(model_dir, "deploy.prototxt"), os.path.join(model_dir, "res10_300x300_ssd_iter_140000.caffemodel"))
+
+	def _detect(self, image):
+		height, width = image.shape[:2]
+		# the model was trained on BGR with these channel means, the frame is RGB
+		blob = cv2.dnn.blobFromImage(image, 1.0, (self.size, self.size), (104.0, 177.0, 123.0), swapRB=True)
+		self.net.setInput(blob)
+		detections = self.net.forward()[0, 0]
+		detections = detections[detections[:, 2] >= self.confidence]
+		# (x1, y1, x2, y2) relative -> (top, right, bottom, left) in pixels
+		boxes = detections[:, 3:7] * [width, height, width, height]
+		return [(y1, x2, y2, x1) for x1, y1, x2, y2 in boxes]
+
+
+class HaarDetector(FaceDetector):
+	"""
+	OpenCV's frontal face Haar cascade, the fastest and the least accurate,
+	only finds faces looking at the camera.
+	:param min_neighbors: higher gives fewer false positives and fewer faces
+	:param min_size: smallest face in pixels, after scaling
+	"""
+	name = "haar"
+
+	def __init__(self, scale=1.0, upsample=0, min_neighbors=5, min_size=30, cascade="haarcascade_frontalface_default.xml"):
+		super().__init__(scale, upsample)
+		self.min_neighbors = min_neighbors
+		self.min_size = min_size
+		# OpenCV 5 moved the cascades out of the main package
+		factory = getattr(cv2, "CascadeClassifier", None)
+		if factory is None:
+			raise ImportError("the haar face detector needs OpenCV 4 (opencv-python)")
+		self.cascade = factory(os.path.join(cv2.data.haarcascades, cascade))
+		if self.cascade.empty():
+			raise FileNotFoundError(f"could not load the Haar cascade {cascade}")
+
+	def _detect(self, image):
+		gray = cv2.equalizeHist(cv2.cvtColor(image, cv2.COLOR_RGB2GRAY))
+		faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=self.min_neighbors, minSize=(self.min_size, self.min_size))
+		return [(y, x + w, y + h, x) for x, y, w, h in faces]
+
+
+BACKENDS = {backend.name: backend for backend in (HogDetector, DnnDetector, HaarDetector)}
+
+
+def create_detector(conf=None):
+	"""
+	Detector from a config dict like {"backend": "dnn", "scale": 1.0, ...}
+	:param conf: dict, None for the HOG default, or an existing FaceDetector which is returned as is
+	"""
+	if isinstance(conf, FaceDetector):
+		return conf
+	conf = dict(conf or {})
+	backend = conf.pop("backend", "hog")
+	if backend not in BACKENDS:
+		raise ValueError(f"unknown face detector {backend!r}, use one of {', '.join(BACKENDS)}")
+	return BACKENDS[backend](**conf)
@@ -1,79 +1,170 @@
-import os, glob, cv2, face_recognition
+import cv2, face_recognition, threading, time, copy
 import numpy as np
-import logging
+
+from dependencies.Gallery import Gallery, identity_of
+from dependencies.FaceDetectors import create_detector
 
 class Facerec:
-		def __init__(self):
+		def __init__(self, tolerance=0.6, aggregate="min", detector=None):
+			if aggregate not in ("min", "mean"):
+				raise ValueError(f"aggregate must be 'min' or 'mean', not {aggregate!r}")
 			self.known_face_encodings = []
 			self.known_face_names = []
 
 			# Resize frame for a faster speed
 			self.frame_resizing = 0.5
 
-		def load_encoding_images(self, images_path):
-			self.__init__()
+			# Face detector backend, a FaceDetectors config dict (HOG by default)
+			self.detector = create_detector(detector)
+
+			# Matching settings, distances above tolerance are "Unknown"
+			self.tolerance = tolerance
+			self.aggregate = aggregate
+			self.set_gallery([], [])
+
+			# Stats from the last gallery sync and the version loaded
+			self.last_load = {}
+			self.gallery_version = 0
+
+			# Seconds spent locating/encoding faces since the last take_timings(),
+			# kept per thread as the workers of an InferencePool share one Facerec
+			self.local = threading.local()
+
+		def load_encoding_images(self, images_path, sync=True):
 			"""
-			Load encoding images from path
+			Load the published gallery of images_path, memory mapped
 			:param images_path:
+			:param sync: publish added or changed images first, readers that only follow a writer pass False
 			:return:
 			"""
-			# Load Images
-			f_types = (os.path.join(images_path,"*.jpg"), os.path.join(images_path,'*.png'))
-			images_path = []
-			for files in f_types:
-				images_path.extend(glob.glob(files))
-
-			print("{} encoding images found.".format(len(images_path)))
-
-			# Store image encoding and names
-			for img_path in images_path:
-				img = cv2.imread(img_path)
-				rgb_img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-				# Get the filename only from the initial file path.
-				basename = os.path.basename(img_path)
-				(filename, ext) = os.path.splitext(basename)
-				# Get encoding
-				try:
-					img_encoding = face_recognition.face_encodings(rgb_img)[0]
-				except IndexError:
-					print(f"no face detected on {filename}")
-
-				# Store file name and file encoding
-				try:
-					self.known_face_encodings.append(img_encoding)
-				except UnboundLocalError:
-					logging.warning("no face detected in any of the images, please check your users folder")
-				self.known_face_names.append(filename)
-			print("Encoding images loaded")
+			start = time.perf_counter()
+			gallery = Gallery(images_path)
+			if sync:
+				self.last_load = gallery.sync()
+			state = gallery.read()
+			self.known_face_encodings = state.encodings
+			self.known_face_names = state.names
+			self.set_gallery(state.encodings, state.names)
+			self.gallery_version = state.version
+			print("{} encoding images loaded in {:.2f}s (gallery v{})".format(len(state.names), time.perf_counter() - start, state.version))
 
-		def detect_known_faces(self, frame):
+		def with_detector(self, detector):
+			"""
+			Facerec sharing this one's gallery but detecting faces with another backend
+			:param detector: FaceDetectors config dict or detector
+			"""
+			fr = copy.copy(self)
+			fr.detector = create_detector(detector)
+			fr.local = threading.local()
+			return fr
+
+		def reloaded(self, images_path):
+			"""
+			Copy of this Facerec (settings and detector) with the current published
+			gallery, built while this one keeps matching. set_gallery replaces the
+			matching arrays one by one, so a Facerec in use is swapped, not reloaded.
+			"""
+			fr = copy.copy(self)
+			fr.local = threading.local()
+			fr.load_encoding_images(images_path, sync=False)
+			return fr
+
+		def set_gallery(self, encodings, names):
+			"""
+			Build the matching matrix from per-image encodings and names.
+			Rows are grouped by identity so per-person aggregation is a reduceat
+			over contiguous slices.
+			:param encodings: per-image 128-d encodings, a list or an (images, 128) array
+			:param names: image file names, <name>_photoN images share an identity
+			"""
+			identities = [identity_of(name) for name in names]
+			self.identity_names = sorted(set(identities))
+			index = {name: i for i, name in enumerate(self.identity_names)}
+			order = sorted(range(len(identities)), key=lambda i: index[identities[i]])
+
+			gallery = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+			# a Gallery matrix is already grouped and is used in place, without a copy
+			if order != list(range(len(order))):
+				gallery = gallery[order]
+			self.gallery = np.ascontiguousarray(gallery)
+			self.gallery_sq = np.einsum("ij,ij->i", self.gallery, self.gallery)
+
+			counts = np.bincount(np.array([index[identities[i]] for i in order], dtype=np.intp), minlength=len(self.identity_names))
+			self.identity_counts = counts.astype(np.float32)
+			self.identity_starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp)
+
+		def distance_matrix(self, face_encodings):
+			"""
+			Euclidean distances between frame faces and every gallery image
+			:return: float32 array of shape (faces, gallery images)
+			"""
+			faces = np.ascontiguousarray(face_encodings, dtype=np.float32).reshape(-1, 128)
+			sq = np.einsum("ij,ij->i", faces, faces)
+			d2 = sq[:, None] + self.gallery_sq[None, :] - 2.0 * (faces @ self.gallery.T)
+			np.maximum(d2, 0.0, out=d2)
+			return np.sqrt(d2, out=d2)
+
+		def match_encodings(self, face_encodings):
+			"""
+			Match frame encodings against the gallery, one distance matrix per call
+			:return: names and the distance to the chosen identity for each face
+			"""
+			if len(face_encodings) == 0:
+				return [], np.zeros(0, dtype=np.float32)
+			if len(self.identity_names) == 0:
+				return ["Unknown"] * len(face_encodings), np.full(len(face_encodings), np.inf, dtype=np.float32)
+
+			distances = self.distance_matrix(face_encodings)
+			if self.aggregate == "min":
+				per_identity = np.minimum.reduceat(distances, self.identity_starts, axis=1)
+			else:
+				per_identity = np.add.reduceat(distances, self.identity_starts, axis=1) / self.identity_counts
+
+			best = np.argmin(per_identity, axis=1)
+			best_distances = per_identity[np.arange(len(best)), best]
+			face_names = [self.identity_names[i] if d <= self.tolerance else "Unknown" for i, d in zip(best, best_distances)]
+			return face_names, best_distances
+
+		def prepare_frame(self, frame):
+			"""
+			Resize frame for a faster speed and convert the image from BGR color
+			(which OpenCV uses) to RGB color (which face_recognition uses)
+			"""
 			small_frame = cv2.resize(frame, (0, 0), fx=self.frame_resizing, fy=self.frame_resizing)
-			# Find all the faces and face encodings in the current frame of video
-			# Convert the image from BGR color (which OpenCV uses) to RGB color (which face_recognition uses)
-			rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-			face_locations = face_recognition.face_locations(rgb_small_frame)
-			face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+			return cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
 
-			face_names = []
-			for face_encoding in face_encodings:
-				# See if the face is a match for the known face(s)
-				matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding)
-				name = "Unknown"
+		def locate_faces(self, rgb_small_frame):
+			start = time.perf_counter()
+			face_locations = self.detector.detect(rgb_small_frame)
+			self._add_timing("face_detect", time.perf_counter() - start)
+			return face_locations
+
+		def encode_faces(self, rgb_small_frame, face_locations):
+			start = time.perf_counter()
+			face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
+			self._add_timing("face_encode", time.perf_counter() - start)
+			return face_encodings
 
-				# # If a match was found in known_face_encodings, just use the first one.
-				# if True in matches:
-				#     first_match_index = matches.index(True)
-				#     name = known_face_names[first_match_index]
+		def _add_timing(self, stage, seconds):
+			timings = self.local.__dict__.setdefault("timings", {})
+			timings[stage] = timings.get(stage, 0.0) + seconds
 
-				# Or instead, use the known face with the smallest distance to the new face
-				face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-				best_match_index = np.argmin(face_distances)
-				if matches[best_match_index]:
-					name = self.known_face_names[best_match_index]
-				face_names.append(name)
+		def take_timings(self):
+			timings = getattr(self.local, "timings", {})
+			self.local.timings = {}
+			return timings
 
+		def scale_locations(self, face_locations):
 			# Convert to numpy array to adjust coordinates with frame resizing quickly
-			face_locations = np.array(face_locations)
+			face_locations = np.array(face_locations).reshape(-1, 4)
 			face_locations = face_locations / self.frame_resizing
-			return face_locations.astype(int), face_names
+			return face_locations.astype(int)
+
+		def detect_known_faces(self, frame):
+			# Find all the faces and face encodings in the current frame of video
+			rgb_small_frame = self.prepare_frame(frame)
+			face_locations = self.locate_faces(rgb_small_frame)
+			face_encodings = self.encode_faces(rgb_small_frame, face_locations)
+
+			face_names, _ = self.match_encodings(face_encodings)
+			return self.scale_locations(face_locations), face_names
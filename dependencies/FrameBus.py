@@ -0,0 +1,152 @@
+import struct, json, time, os
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# Shared memory ring buffer carrying processed frames from main.py to run.py.
+# Layout: header | slot 0 header | slot 0 metadata | slot 0 frame | slot 1 header | ...
+MAGIC = b"SHFB"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIIIQd")      # magic, version, width, height, channels, slots, write_seq, updated
+SLOT_HEADER = struct.Struct("<QQdI")      # seq (0 while being written), frame index, timestamp, metadata length
+HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 32
+META_SIZE = 2048
+
+
+def _layout(shape, slots):
+	frame_size = int(np.prod(shape))
+	slot_size = SLOT_HEADER_SIZE + META_SIZE + frame_size
+	return frame_size, slot_size, HEADER_SIZE + slot_size * slots
+
+
+class FrameBusPublisher:
+	"""
+	Writer side, owns the shared memory block.
+	"""
+	def __init__(self, name, shape, slots=3):
+		self.name = name
+		self.shape = tuple(shape)
+		self.slots = slots
+		self.frame_size, self.slot_size, size = _layout(self.shape, slots)
+		try:
+			self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+		except FileExistsError:
+			# left behind by a crashed run or still held open by a subscriber
+			existing = shared_memory.SharedMemory(name=name)
+			if existing.size == size:
+				self.shm = existing
+			else:
+				existing.close()
+				existing.unlink()
+				self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+		self.seq = 0
+		h, w, c = self.shape
+		HEADER.pack_into(self.shm.buf, 0, MAGIC, VERSION, w, h, c, slots, 0, time.time())
+
+	def publish(self, frame, index=0, timestamp=None, meta=None):
+		"""
+		Copy a frame (resized to the bus shape if needed) and its metadata into the next slot
+		"""
+		if frame.shape != self.shape:
+			import cv2
+			frame = cv2.resize(frame, (self.shape[1], self.shape[0]))
+		meta_bytes = json.dumps(meta or {}).encode()[:META_SIZE]
+		self.seq += 1
+		offset = HEADER_SIZE + ((self.seq - 1) % self.slots) * self.slot_size
+		buf = self.shm.buf
+		SLOT_HEADER.pack_into(buf, offset, 0, 0, 0.0, 0)
+		buf[offset + SLOT_HEADER_SIZE:offset + SLOT_HEADER_SIZE + len(meta_bytes)] = meta_bytes
+		frame_offset = offset + SLOT_HEADER_SIZE + META_SIZE
+		np.copyto(np.ndarray(self.shape, dtype=np.uint8, buffer=buf, offset=frame_offset), frame)
+		ts = time.time() if timestamp is None else timestamp
+		SLOT_HEADER.pack_into(buf, offset, self.seq, index, ts, len(meta_bytes))
+		struct.pack_into("<Qd", buf, HEADER.size - 16, self.seq, time.time())
+
+	def close(self):
+		self.shm.close()
+		try:
+			self.shm.unlink()
+		except FileNotFoundError:
+			pass
+
+
+class FrameBusSubscriber:
+	"""
+	Reader side, attaches to the publisher's block when it appears and
+	re-attaches if the publisher restarts.
+	"""
+	def __init__(self, name, stale_after=3.0):
+		self.name = name
+		self.stale_after = stale_after
+		self.shm = None
+		self.last_change = 0.0
+		self.last_attempt = 0.0
+
+	def attach(self):
+		self.detach()
+		try:
+			shm = shared_memory.SharedMemory(name=self.name)
+		except FileNotFoundError:
+			return False
+		if os.name == "posix":
+			# the publisher owns the block, don't let this process's resource tracker unlink it on exit
+			resource_tracker.unregister(shm._name, "shared_memory")
+		magic, version, w, h, c, slots, _, _ = HEADER.unpack_from(shm.buf, 0)
+		if magic != MAGIC or version != VERSION:
+			shm.close()
+			return False
+		self.shm = shm
+		self.shape = (h, w, c)
+		self.slots = slots
+		self.frame_size, self.slot_size, _ = _layout(self.shape, slots)
+		self.last_change = time.monotonic()
+		return True
+
+	def detach(self):
+		if self.shm is not None:
+			self.shm.close()
+			self.shm = None
+
+	def read(self, last_seq=0):
+		"""
+		Newest frame if it is newer than last_seq
+		:return: (seq, frame, index, timestamp, meta) or None
+		"""
+		now = time.monotonic()
+		if self.shm is None:
+			if now - self.last_attempt < 1.0:
+				return None
+			self.last_attempt = now
+			if not self.attach():
+				return None
+		buf = self.shm.buf
+		seq = struct.unpack_from("<Q", buf, HEADER.size - 16)[0]
+		if seq == 0 or seq == last_seq:
+			if now - self.last_change > self.stale_after:
+				# publisher gone or restarted with a new block
+				self.detach()
+			return None
+		self.last_change = now
+		offset = HEADER_SIZE + ((seq - 1) % self.slots) * self.slot_size
+		slot_seq, index, ts, meta_len = SLOT_HEADER.unpack_from(buf, offset)
+		if slot_seq != seq:
+			return None
+		meta = bytes(buf[offset + SLOT_HEADER_SIZE:offset + SLOT_HEADER_SIZE + meta_len])
+		frame_offset = offset + SLOT_HEADER_SIZE + META_SIZE
+		frame = np.ndarray(self.shape, dtype=np.uint8, buffer=buf, offset=frame_offset).copy()
+		if SLOT_HEADER.unpack_from(buf, offset)[0] != seq:
+			# overwritten while copying
+			return None
+		try:
+			meta = json.loads(meta) if meta else {}
+		except ValueError:
+			meta = {}
+		return seq, frame, index, ts, meta
+
+	def wait_next(self, last_seq=0, timeout=1.0, poll=0.005):
+		deadline = time.monotonic() + timeout
+		while True:
+			result = self.read(last_seq)
+			if result is not None or time.monotonic() >= deadline:
+				return result
+			time.sleep(poll)
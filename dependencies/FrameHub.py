@@ -0,0 +1,76 @@
+import threading, cv2
+
+
+class FrameHub:
+	"""
+	Holds the latest captured frame for the web server. Each new frame gets a
+	sequence number and is JPEG-encoded at most once, by whichever client asks
+	for it first; every other client reuses those bytes. Clients block on a
+	condition variable until a newer frame is published.
+	"""
+	def __init__(self, quality=80):
+		self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+		self.cond = threading.Condition()
+		self.encode_lock = threading.Lock()
+		self.seq = 0
+		self.frame = None
+		self.meta = {}
+		self.jpeg = None
+		self.jpeg_seq = 0
+
+		# counters
+		self.clients = 0
+		self.encodes = 0
+
+	def publish(self, frame, meta=None):
+		with self.cond:
+			self.seq += 1
+			self.frame = frame
+			self.meta = meta or {}
+			self.cond.notify_all()
+
+	def latest(self):
+		with self.cond:
+			return self.frame
+
+	def clear(self):
+		with self.cond:
+			self.frame = None
+
+	def wait_next(self, last_seq, timeout=1.0):
+		"""
+		Wait for a frame newer than last_seq
+		:return: (seq, jpeg bytes), jpeg is None if nothing new arrived within timeout
+		"""
+		with self.cond:
+			if not self.cond.wait_for(lambda: self.seq > last_seq and self.frame is not None, timeout):
+				return last_seq, None
+			seq, frame = self.seq, self.frame
+
+		with self.encode_lock:
+			if self.jpeg_seq < seq:
+				flag, encoded = cv2.imencode(".jpg", frame, self.params)
+				if not flag:
+					return seq, None
+				self.jpeg = encoded.tobytes()
+				self.jpeg_seq = seq
+				self.encodes += 1
+			return self.jpeg_seq, self.jpeg
+
+	def stream(self):
+		"""
+		multipart/x-mixed-replace MJPEG generator for one client
+		"""
+		with self.cond:
+			self.clients += 1
+		try:
+			seq = 0
+			while True:
+				seq, jpeg = self.wait_next(seq)
+				if jpeg is None:
+					continue
+				yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' +
+					jpeg + b'\r\n')
+		finally:
+			with self.cond:
+				self.clients -= 1
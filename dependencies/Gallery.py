@@ -0,0 +1,363 @@
+import os, json, hashlib, contextlib, collections, functools, logging, time, re
+import numpy as np
+
+# add_face.py saves several images per person as <name>_photoN.jpg
+IDENTITY_SUFFIX = re.compile(r"_photo\d+$")
+EXTENSIONS = (".jpg", ".jpeg", ".png")
+# a writer refreshes the lock while it encodes, older locks were left by a crashed process
+STALE_LOCK = 30.0
+# readers go again with the newer manifest when its matrix was removed under them
+READ_RETRIES = 3
+
+GalleryState = collections.namedtuple("GalleryState", ["version", "names", "encodings", "files"])
+# file: image name the photo was saved as, box: (top, right, bottom, left) of the face, reason: why it was rejected
+EnrollResult = collections.namedtuple("EnrollResult", ["file", "ok", "reason", "box"])
+
+
+def identity_of(filename):
+	return IDENTITY_SUFFIX.sub("", filename)
+
+
+def _file_hash(path):
+	h = hashlib.sha1()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 16), b""):
+			h.update(chunk)
+	return h.hexdigest()
+
+
+def _encode_image(path):
+	# imported here so processes that only read the gallery (run.py, bot.py) don't load dlib
+	import cv2, face_recognition
+	img = cv2.imread(path)
+	if img is None:
+		return None
+	encodings = face_recognition.face_encodings(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+	if not encodings:
+		return None
+	return encodings[0]
+
+
+def check_image(data, min_face=80, min_sharpness=20.0, max_width=1280):
+	"""
+	Decode, quality check and encode one enrollment photo. Module level so
+	enroll_batch can run it in worker processes.
+	:param data: encoded image bytes
+	:param min_face: smallest face side in pixels
+	:param min_sharpness: variance of the Laplacian of the face, lower is blurrier
+	:param max_width: bigger photos are shrunk to this width to find and encode the face
+	:return: (jpeg bytes, encoding, face box, None) or (None, None, face box or None, reason)
+	"""
+	import cv2, face_recognition
+	img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+	if img is None:
+		return None, None, None, "not an image"
+	scale = min(1.0, max_width / img.shape[1])
+	small = cv2.resize(img, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else img
+	rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+	faces = face_recognition.face_locations(rgb)
+	if not faces:
+		return None, None, None, "no face detected"
+	if len(faces) > 1:
+		return None, None, None, f"{len(faces)} faces detected, use a photo of one person"
+	top, right, bottom, left = faces[0]
+	box = tuple(int(v / scale) for v in faces[0])
+	if min(bottom - top, right - left) / scale < min_face:
+		return None, None, box, "face too small, move closer to the camera"
+	sharpness = cv2.Laplacian(cv2.cvtColor(small[top:bottom, left:right], cv2.COLOR_BGR2GRAY), cv2.CV_64F).var()
+	if sharpness < min_sharpness:
+		return None, None, box, "photo too blurry"
+	encoding = face_recognition.face_encodings(rgb, faces)[0]
+	if data[:2] != b"\xff\xd8":
+		# saved as .jpg like every other photo
+		data = cv2.imencode(".jpg", img)[1].tobytes()
+	return data, encoding, box, None
+
+
+class Gallery:
+	"""
+	The known faces in images/, shared by every process. Writers (sync, enroll,
+	remove) encode only new or changed images and publish a new version: a
+	float32 matrix file with one row per face, grouped by identity, and a
+	manifest that is swapped in atomically. Readers map the matrix and only
+	have to stat the manifest to notice a new version.
+	Everything is kept in <images>_gallery/ so the images folder itself only
+	holds the photos.
+	"""
+	def __init__(self, images_path):
+		self.images_path = os.path.normpath(images_path)
+		self.path = self.images_path + "_gallery"
+		self.manifest_path = os.path.join(self.path, "manifest.json")
+		self.lock_path = os.path.join(self.path, "lock")
+		self.seen = None
+		self.last_stat = None
+		self.last_version = 0
+		self.folder_mtime = None
+
+	## readers
+
+	def _manifest(self):
+		try:
+			with open(self.manifest_path, "r") as f:
+				return json.load(f)
+		except (OSError, ValueError):
+			return {"version": 0, "matrix": None, "files": []}
+
+	def version(self):
+		"""
+		Published version, 0 before the first sync. Costs a stat unless the manifest was replaced.
+		"""
+		try:
+			stat = os.stat(self.manifest_path)
+		except OSError:
+			return 0
+		key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+		if key != self.last_stat:
+			self.last_stat = key
+			self.last_version = self._manifest()["version"]
+		return self.last_version
+
+	def changed(self):
+		"""
+		:return: True if a version was published since the last call
+		"""
+		version = self.version()
+		if version == self.seen:
+			return False
+		self.seen = version
+		return True
+
+	def read(self):
+		"""
+		The published gallery, encodings is a read-only memory map of the matrix file
+		:return: GalleryState
+		"""
+		for attempt in range(READ_RETRIES):
+			manifest = self._manifest()
+			names = [entry["name"] for entry in manifest["files"] if entry["row"] is not None]
+			if not names:
+				return GalleryState(manifest["version"], names, np.zeros((0, 128), dtype=np.float32), manifest["files"])
+			try:
+				encodings = np.memmap(os.path.join(self.path, manifest["matrix"]), dtype=np.float32, mode="r", shape=(len(names), 128))
+			except FileNotFoundError:
+				# two publishes since the manifest was read removed its matrix, the new manifest has one
+				if attempt == READ_RETRIES - 1:
+					raise
+				continue
+			return GalleryState(manifest["version"], names, encodings, manifest["files"])
+
+	def users(self):
+		"""
+		Image names (file names without extension) in the gallery
+		"""
+		files = self._manifest()["files"]
+		if not files and not os.path.exists(self.manifest_path):
+			# nothing published yet, list the folder without encoding anything
+			return [os.path.splitext(filename)[0] for filename in self._listing()]
+		return [entry["name"] for entry in files]
+
+	def image_path(self, name):
+		"""
+		:return: path of the image saved as name, or None
+		"""
+		for entry in self._manifest()["files"]:
+			if entry["name"] == name:
+				return os.path.join(self.images_path, entry["file"])
+		return None
+
+	## writers
+
+	def _listing(self):
+		if not os.path.isdir(self.images_path):
+			return []
+		return sorted(filename for filename in os.listdir(self.images_path) if filename.lower().endswith(EXTENSIONS))
+
+	def folder_changed(self):
+		"""
+		True if files were added to or removed from the images folder since the
+		last call, one stat of the folder instead of listing it
+		"""
+		try:
+			mtime = os.stat(self.images_path).st_mtime_ns
+		except OSError:
+			mtime = None
+		if mtime == self.folder_mtime:
+			return False
+		self.folder_mtime = mtime
+		return True
+
+	@contextlib.contextmanager
+	def _locked(self):
+		os.makedirs(self.path, exist_ok=True)
+		while True:
+			try:
+				fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+				break
+			except FileExistsError:
+				try:
+					if time.time() - os.path.getmtime(self.lock_path) > STALE_LOCK:
+						os.remove(self.lock_path)
+						continue
+				except OSError:
+					continue
+				time.sleep(0.05)
+		try:
+			yield
+		finally:
+			os.close(fd)
+			os.remove(self.lock_path)
+
+	def _publish(self, version, files, encodings):
+		matrix = f"encodings.{version}.f32"
+		with open(os.path.join(self.path, matrix), "wb") as f:
+			f.write(np.asarray(encodings, dtype=np.float32).reshape(-1, 128).tobytes())
+		tmp = self.manifest_path + ".tmp"
+		with open(tmp, "w") as f:
+			json.dump({"version": version, "matrix": matrix, "files": files}, f)
+		os.replace(tmp, self.manifest_path)
+		# readers may still map the last matrix, older ones can go (unless still mapped on Windows)
+		for filename in os.listdir(self.path):
+			if filename.startswith("encodings.") and filename not in (matrix, f"encodings.{version - 1}.f32"):
+				try:
+					os.remove(os.path.join(self.path, filename))
+				except OSError:
+					pass
+
+	def sync(self, known=None):
+		"""
+		Bring the published gallery in line with the images folder. Images whose
+		size and mtime (or content hash) are known keep their encoding, only new
+		or changed images are encoded.
+		:param known: {sha1 of the file: encoding} computed by the caller, used instead of encoding those files
+		:return: stats dict
+		"""
+		known = known or {}
+		start = time.perf_counter()
+		with self._locked():
+			# read under the lock, another process may have just published
+			old = self.read()
+			old_rows = {entry["file"]: entry for entry in old.files}
+			by_hash = {entry["hash"]: entry for entry in old.files}
+			files, encodings = [], []
+			hits = encoded = enrolled = 0
+			for filename in self._listing():
+				path = os.path.join(self.images_path, filename)
+				try:
+					stat = os.stat(path)
+				except OSError:
+					continue
+				entry = old_rows.get(filename)
+				if entry is None or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime_ns:
+					# size/mtime changed or new file, the content may still be known (touched or renamed file)
+					file_hash = _file_hash(path)
+					entry = by_hash.get(file_hash)
+					if entry is not None:
+						hits += 1
+					elif file_hash in known:
+						enrolled += 1
+						entry = {"hash": file_hash, "row": None, "encoding": known[file_hash]}
+					else:
+						encoding = _encode_image(path)
+						encoded += 1
+						if encoding is None:
+							print(f"no face detected on {filename}")
+						os.utime(self.lock_path)
+						entry = {"hash": file_hash, "row": None, "encoding": encoding}
+					entry = dict(entry, size=stat.st_size, mtime=stat.st_mtime_ns)
+				else:
+					hits += 1
+				entry = dict(entry, name=os.path.splitext(filename)[0], file=filename)
+				if "encoding" not in entry:
+					entry["encoding"] = old.encodings[entry["row"]] if entry["row"] is not None else None
+				files.append(entry)
+
+			# rows grouped by identity, the order Facerec.set_gallery matches in
+			files.sort(key=lambda entry: (identity_of(entry["name"]), entry["name"]))
+			for entry in files:
+				encoding = entry.pop("encoding")
+				entry["row"] = None
+				if encoding is not None:
+					entry["row"] = len(encodings)
+					encodings.append(encoding)
+
+			removed = len(set(old_rows) - {entry["file"] for entry in files})
+			version = old.version
+			if files != old.files or not os.path.exists(self.manifest_path):
+				version += 1
+				self._publish(version, files, encodings)
+
+		if files and not encodings:
+			logging.warning("no face detected in any of the images, please check your users folder")
+		elapsed = time.perf_counter() - start
+		stats = {"images": len(files), "cached": hits, "encoded": encoded, "removed": removed, "enrolled": enrolled, "seconds": elapsed, "version": version}
+		if version != old.version:
+			print("Gallery v{} published in {:.2f}s ({} cached, {} encoded, {} enrolled, {} removed)".format(version, elapsed, hits, encoded, enrolled, removed))
+		return stats
+
+	def _store(self, photos):
+		# photos: [(file name, jpeg bytes, encoding)], written and published together
+		os.makedirs(self.images_path, exist_ok=True)
+		known = {}
+		for filename, data, encoding in photos:
+			path = os.path.join(self.images_path, filename)
+			with open(path + ".part", "wb") as f:
+				f.write(data)
+			os.replace(path + ".part", path)
+			known[hashlib.sha1(data).hexdigest()] = encoding
+		self.sync(known)
+
+	def enroll(self, name, data, **quality):
+		"""
+		Check and encode a photo, then save it as images/<name>.jpg with its
+		encoding. Rejected photos are not saved.
+		:param data: encoded image bytes
+		:param quality: check_image thresholds
+		:return: EnrollResult
+		"""
+		jpeg, encoding, box, reason = check_image(data, **quality)
+		if reason is not None:
+			return EnrollResult(f"{name}.jpg", False, reason, box)
+		self._store([(f"{name}.jpg", jpeg, encoding)])
+		return EnrollResult(f"{name}.jpg", True, None, box)
+
+	def enroll_batch(self, people, executor=None, **quality):
+		"""
+		Enroll many photos, checked and encoded in parallel and published as one version.
+		Every photo is saved as <name>_photoN.jpg, numbered after the photos the person already has.
+		:param people: [(name, [image bytes, ...]), ...]
+		:param executor: concurrent.futures executor to encode on, one at a time if None
+		:return: list of EnrollResult, one per photo in order
+		"""
+		jobs = [(name, data) for name, photos in people for data in photos]
+		check = functools.partial(check_image, **quality)
+		checked = executor.map(check, [data for _, data in jobs]) if executor is not None else map(check, [data for _, data in jobs])
+		taken = set(self.users())
+		results, photos = [], []
+		for (name, _), (jpeg, encoding, box, reason) in zip(jobs, checked):
+			if reason is not None:
+				results.append(EnrollResult(None, False, reason, box))
+				continue
+			number = 1
+			while f"{name}_photo{number}" in taken:
+				number += 1
+			taken.add(f"{name}_photo{number}")
+			filename = f"{name}_photo{number}.jpg"
+			photos.append((filename, jpeg, encoding))
+			results.append(EnrollResult(filename, True, None, box))
+		if photos:
+			self._store(photos)
+		return results
+
+	def remove(self, name):
+		"""
+		Delete the images saved as name and publish the gallery without them
+		:return: number of files removed
+		"""
+		removed = 0
+		for filename in self._listing():
+			if os.path.splitext(filename)[0] == name:
+				os.remove(os.path.join(self.images_path, filename))
+				removed += 1
+		if removed:
+			self.sync()
+		return removed
@@ -0,0 +1,203 @@
+import numbers, os, json
+
+from dependencies.Motion import MODELS
+from dependencies.FaceDetectors import BACKENDS
+
+# only read by run.py and bot.py
+IGNORED = ("settings.discord_bot", "settings.debug", "camera.v_cam", "enrollment", "logs", "supervisor", "discord.bot_token")
+# applied by the running security system between frames
+LIVE = ("settings.speech", "settings.discord_notifications", "settings.motion_detection", "settings.webserver", "speech.dedupe_window", "speech.max_per_minute", "scheduler", "recorder.pre_roll")
+# rebuild every camera's face and presence stage
+INFERENCE = ("face.tolerance", "face.aggregate", "presence", "tracking")
+# per camera (the "camera" section with the camera's own overrides on top)
+SESSION_KEYS = ("body_inc", "face_inc", "motion_inc", "undetected_time")
+
+# what validate checks, everything the running system would choke on when applying it
+NUMBERS = ("face.tolerance", "speech.dedupe_window", "speech.max_per_minute", "scheduler.idle_interval", "scheduler.wake_frames",
+	"tracking.detect_interval", "tracking.max_misses", "tracking.reencode_below", "tracking.decay", "tracking.match_margin", "tracking.confirm",
+	"recorder.pre_roll", "recorder.queue_seconds")
+CAMERA_NUMBERS = SESSION_KEYS + ("capture_buffer",)
+MOTION_NUMBERS = ("width", "learning_rate", "threshold", "min_area", "min_score")
+CHOICES = {"face.aggregate": ("min", "mean"), "pipeline.mode": ("single", "process", "pool")}
+
+
+def _flatten(conf, prefix=""):
+	flat = {}
+	for key, value in conf.items():
+		if isinstance(value, dict) and value:
+			flat.update(_flatten(value, f"{prefix}{key}."))
+		else:
+			flat[prefix + key] = value
+	return flat
+
+
+def _matches(key, prefixes):
+	return any(key == prefix or key.startswith(prefix + ".") for prefix in prefixes)
+
+
+def camera_configs(config):
+	"""
+	Every camera's effective settings by name, the way main.py builds them:
+	its "cameras" entry over the "camera" section, its "motion" over "motion"
+	and its "face_detector" over face.detector. No "cameras" means just camera.main.
+	"""
+	cameras = config.get("cameras") or [{"name": "main", "source": config["camera"]["main"]}]
+	face_detector = config.get("face", {}).get("detector", {"backend": "hog"})
+	return {camera["name"]: {
+		"camera": dict(config["camera"], **camera),
+		"motion": dict(config.get("motion", {}), **camera.get("motion", {})),
+		"detector": dict(face_detector, **camera.get("face_detector", {})),
+	} for camera in cameras}
+
+
+def validate(config):
+	"""
+	Check a config before it is saved or applied
+	:raise ValueError: listing every invalid value
+	"""
+	errors = []
+	flat = _flatten({key: value for key, value in config.items() if key != "cameras"})
+	for key, value in flat.items():
+		if key.startswith("settings.") and not isinstance(value, bool):
+			errors.append(f"{key} must be true or false")
+		elif key in NUMBERS and (isinstance(value, bool) or not isinstance(value, numbers.Number)):
+			errors.append(f"{key} must be a number")
+		elif key in CHOICES and value not in CHOICES[key]:
+			errors.append(f"{key} must be one of {', '.join(CHOICES[key])}")
+	try:
+		cameras = camera_configs(config)
+	except (KeyError, TypeError, AttributeError) as e:
+		raise ValueError(f"camera settings are incomplete: {e!r}")
+	for name, camera in cameras.items():
+		for key in CAMERA_NUMBERS:
+			# the session settings have no defaults
+			value = camera["camera"].get(key, None if key in SESSION_KEYS else 0)
+			if isinstance(value, bool) or not isinstance(value, numbers.Number):
+				errors.append(f"{name}: {key} must be a number")
+		for key in MOTION_NUMBERS:
+			value = camera["motion"].get(key, 0)
+			if isinstance(value, bool) or not isinstance(value, numbers.Number):
+				errors.append(f"{name}: motion {key} must be a number")
+		if camera["motion"].get("model", "average") not in MODELS:
+			errors.append(f"{name}: motion model must be one of {', '.join(MODELS)}")
+		if camera["detector"].get("backend", "hog") not in BACKENDS:
+			errors.append(f"{name}: face detector must be one of {', '.join(BACKENDS)}")
+	if errors:
+		raise ValueError("; ".join(errors))
+
+
+class ConfigChange:
+	"""
+	What changed between two versions of config.json and what applying it takes.
+	:ivar live: keys the running system picks up between frames
+	:ivar cameras: camera name -> components of that camera to rebuild ("capture", "capture_buffer", "motion", "inference")
+	:ivar restart: keys only read at startup, the security system has to be restarted for them
+	"""
+	def __init__(self, old, new):
+		self.live = []
+		self.cameras = {}
+		self.restart = []
+
+		old_cameras, new_cameras = camera_configs(old), camera_configs(new)
+		# face and pose only run in this process in single mode with one camera
+		inference_live = new.get("pipeline", {}).get("mode", "single") == "single" and len(new_cameras) == 1
+		old_flat = _flatten({key: value for key, value in old.items() if key != "cameras"})
+		new_flat = _flatten({key: value for key, value in new.items() if key != "cameras"})
+		for key in sorted(set(old_flat) | set(new_flat)):
+			if old_flat.get(key) == new_flat.get(key) or _matches(key, IGNORED):
+				continue
+			if _matches(key, LIVE):
+				self.live.append(key)
+			elif _matches(key, INFERENCE):
+				if inference_live:
+					for name in new_cameras:
+						self._rebuild(name, "inference")
+				else:
+					self.restart.append(key)
+			elif not _matches(key, ("camera", "motion", "face.detector")):
+				self.restart.append(key)
+
+		if list(old_cameras) != list(new_cameras):
+			self.restart.append("cameras")
+			return
+		for name, new_camera in new_cameras.items():
+			old_camera = old_cameras[name]
+			prefix = f"cameras.{name}." if old.get("cameras") or new.get("cameras") else "camera."
+			for key in sorted(set(old_camera["camera"]) | set(new_camera["camera"])):
+				if old_camera["camera"].get(key) == new_camera["camera"].get(key) or key in ("main", "v_cam"):
+					continue
+				if key in SESSION_KEYS:
+					self.live.append(prefix + key)
+				elif key == "source":
+					self._rebuild(name, "capture")
+				elif key == "capture_buffer":
+					# the ring buffer is resized in place, the device stays open
+					self._rebuild(name, "capture_buffer")
+				else:
+					self.restart.append(prefix + key)
+			if old_camera["motion"] != new_camera["motion"]:
+				self._rebuild(name, "motion")
+			if old_camera["detector"] != new_camera["detector"]:
+				if inference_live:
+					self._rebuild(name, "inference")
+				else:
+					self.restart.append(prefix + "face_detector")
+		self.live = sorted(set(self.live))
+
+	def _rebuild(self, name, component):
+		self.cameras.setdefault(name, set()).add(component)
+
+	def __bool__(self):
+		return bool(self.live or self.cameras or self.restart)
+
+	def summary(self):
+		return {
+			"live": self.live,
+			"rebuilt": {name: sorted(components) for name, components in self.cameras.items()},
+			"restart": self.restart,
+		}
+
+
+class ConfigWatcher:
+	"""
+	Notices config.json being saved (by run.py's /api/save_config or by hand),
+	checked with a stat like the face gallery's manifest.
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.stamp = self._stamp()
+
+	def _stamp(self):
+		try:
+			st = os.stat(self.path)
+		except OSError:
+			return None
+		return st.st_mtime_ns, st.st_size
+
+	def changed(self):
+		stamp = self._stamp()
+		if stamp == self.stamp:
+			return False
+		self.stamp = stamp
+		return True
+
+	def load(self):
+		"""
+		:return: the config, or None if the file can't be read or isn't valid JSON
+		"""
+		try:
+			with open(self.path, "r") as f:
+				return json.load(f)
+		except (OSError, ValueError) as e:
+			print(f"Could not read {os.path.basename(self.path)}: {e}")
+			return None
+
+
+def save(path, config):
+	"""
+	Write config.json atomically, so the watcher never reads half of it
+	"""
+	tmp = path + ".tmp"
+	with open(tmp, "w") as f:
+		json.dump(config, f, indent=4)
+	os.replace(tmp, path)
@@ -0,0 +1,128 @@
+import collections, itertools, threading, time
+from datetime import datetime
+
+
+def level_of(message):
+	lower = message.lower()
+	if "error" in lower or "traceback" in lower or "exception" in lower:
+		return "error"
+	if "warn" in lower:
+		return "warning"
+	return "info"
+
+
+class LogRelay:
+	"""
+	Forwards child process output to the dashboard. Lines are queued and
+	sent as one batch every interval seconds (or as soon as max_batch are
+	waiting), a line repeating the previous one only bumps its count, and
+	beyond max_pending queued lines the rest are dropped and counted. The
+	last history records are kept for clients that connect later.
+	Records are dicts: id, ts, time, source, level, message, repeat and
+	data, the "[time] [source] message" line the dashboard shows.
+	:param emit: called with the list of records of each batch
+	"""
+	def __init__(self, emit, interval=0.25, max_batch=200, history=500, max_pending=2000):
+		self.emit = emit
+		self.interval = interval
+		self.max_batch = max_batch
+		self.max_pending = max_pending
+		self.history = collections.deque(maxlen=history)
+		self.pending = []
+		self.last = None
+		self.ids = itertools.count(1)
+		self.cond = threading.Condition()
+		self.running = True
+
+		# counters
+		self.lines = 0
+		self.sent = 0
+		self.collapsed = 0
+		self.dropped = 0
+
+		self.worker = threading.Thread(target=self._run, name="LogRelay", daemon=True)
+		self.worker.start()
+
+	def _record(self, message, source, level):
+		now = time.time()
+		record = {
+			"id": next(self.ids),
+			"ts": now,
+			"time": datetime.fromtimestamp(now).strftime("%H:%M:%S"),
+			"source": source,
+			"level": level or level_of(message),
+			"message": message,
+			"repeat": 1,
+		}
+		record["data"] = f"[{record['time']}] [{source}] {message}" if source else f"[{record['time']}] {message}"
+		return record
+
+	def add(self, message, source="", level=None):
+		"""
+		Queue one line, never blocks on the clients
+		"""
+		with self.cond:
+			self.lines += 1
+			last = self.last
+			repeat = last is not None and last["message"] == message and last["source"] == source
+			if repeat:
+				self.collapsed += 1
+				if self.pending and self.pending[-1] is last:
+					last["repeat"] += 1
+					return
+			# every new record counts, repeats of a line already sent included
+			if len(self.pending) >= self.max_pending:
+				self.dropped += 1
+				return
+			record = self._record(message, source, level)
+			if repeat:
+				# the line was already sent, repeats go out as one record with the count
+				record["repeat_of"] = last["id"]
+			self.pending.append(record)
+			self.last = record
+			if len(self.pending) >= self.max_batch:
+				self.cond.notify()
+
+	def _run(self):
+		reported = 0
+		while True:
+			with self.cond:
+				self.cond.wait_for(lambda: len(self.pending) >= self.max_batch or not self.running, timeout=self.interval)
+				batch, self.pending = self.pending, []
+				dropped = self.dropped
+				running = self.running
+			if dropped > reported:
+				batch.append(self._record(f"{dropped - reported} log lines dropped, output is coming in faster than it can be shown", "LOG RELAY", "warning"))
+				reported = dropped
+			for record in batch:
+				if "repeat_of" in record:
+					record["data"] += f" (repeated {record['repeat']} more times)"
+				elif record["repeat"] > 1:
+					record["data"] += f" (x{record['repeat']})"
+			if batch:
+				with self.cond:
+					self.history.extend(batch)
+				try:
+					self.emit(batch)
+				except Exception as e:
+					print(f"Log relay error: {e}")
+				self.sent += len(batch)
+			if not running:
+				return
+
+	def replay(self, since=0, level=None, source=None):
+		"""
+		Kept records newer than id since, optionally of one level/source
+		"""
+		with self.cond:
+			records = list(self.history)
+		return [r for r in records if r["id"] > since and (level is None or r["level"] == level) and (source is None or r["source"] == source)]
+
+	def stats(self):
+		return {"lines": self.lines, "sent": self.sent, "collapsed": self.collapsed, "dropped": self.dropped, "pending": len(self.pending)}
+
+	def close(self, timeout=2):
+		with self.cond:
+			self.running = False
+			self.cond.notify()
+		self.worker.join(timeout=timeout)
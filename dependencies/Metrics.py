@@ -0,0 +1,231 @@
+import bisect, collections, threading, json, time, os
+
+# histogram bucket upper bounds in seconds, shared by every stage
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PREFIX = "securehome"
+
+
+class Histogram:
+	"""
+	Cumulative bucket counts for Prometheus plus the last window samples,
+	which the p50/p95/p99 in the summary are taken from.
+	"""
+	def __init__(self, window=512):
+		self.counts = [0] * (len(BUCKETS) + 1)
+		self.sum = 0.0
+		self.count = 0
+		self.recent = collections.deque(maxlen=window)
+
+	def observe(self, value):
+		self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+		self.sum += value
+		self.count += 1
+		self.recent.append(value)
+
+	def snapshot(self):
+		recent = sorted(self.recent)
+		quantiles = {}
+		for q in (0.5, 0.95, 0.99):
+			quantiles[str(q)] = recent[min(len(recent) - 1, int(q * len(recent)))] if recent else 0.0
+		return {"buckets": list(self.counts), "sum": self.sum, "count": self.count, "quantiles": quantiles}
+
+
+class Metrics:
+	"""
+	Per-stage latency histograms, counters and gauges for one process,
+	optionally per camera (camera="" is the process as a whole).
+	observe()/inc() are cheap enough for the frame loop, flush() writes a
+	JSON snapshot for run.py at most once every interval seconds.
+	"""
+	def __init__(self, path=None, interval=1.0, window=512):
+		self.path = path
+		self.interval = interval
+		self.window = window
+		self.lock = threading.Lock()
+		self.histograms = {}
+		self.counters = {}
+		self.gauges = {}
+		self.started = time.time()
+		self.last_flush = 0.0
+
+	def observe(self, stage, seconds, camera=""):
+		with self.lock:
+			histogram = self.histograms.get((camera, stage))
+			if histogram is None:
+				histogram = self.histograms[(camera, stage)] = Histogram(self.window)
+			histogram.observe(seconds)
+
+	def inc(self, name, value=1, camera=""):
+		self.counters[(camera, name)] = self.counters.get((camera, name), 0) + value
+
+	def gauge(self, name, value, camera=""):
+		self.gauges[(camera, name)] = value
+
+	def collect(self, prefix, stats, gauges=(), camera=""):
+		"""
+		Copy a component's stats() into <prefix>_<key> counters, keys in gauges become gauges
+		"""
+		for key, value in stats.items():
+			if key in gauges:
+				self.gauges[(camera, f"{prefix}_{key}")] = value
+			else:
+				self.counters[(camera, f"{prefix}_{key}")] = value
+
+	def for_camera(self, camera):
+		return CameraMetrics(self, camera)
+
+	def due(self):
+		return self.path is not None and time.monotonic() - self.last_flush >= self.interval
+
+	def snapshot(self):
+		"""
+		JSON-able copy, histograms/counters/gauges are nested as {camera: {name: value}}
+		"""
+		snapshot = {"started": self.started, "updated": time.time(), "buckets": list(BUCKETS), "histograms": {}, "counters": {}, "gauges": {}}
+		with self.lock:
+			histograms = {key: h.snapshot() for key, h in self.histograms.items()}
+		for kind, values in (("histograms", histograms), ("counters", dict(self.counters)), ("gauges", dict(self.gauges))):
+			for (camera, name), value in values.items():
+				snapshot[kind].setdefault(camera, {})[name] = value
+		return snapshot
+
+	def flush(self, force=False):
+		"""
+		Atomically replace the snapshot file if interval has passed
+		:return: True if the file was written
+		"""
+		if self.path is None or not (force or self.due()):
+			return False
+		self.last_flush = time.monotonic()
+		tmp = self.path + ".tmp"
+		try:
+			with open(tmp, "w") as f:
+				json.dump(self.snapshot(), f)
+			os.replace(tmp, self.path)
+		except OSError:
+			# the reader has the file open (Windows), try again next interval
+			return False
+		return True
+
+
+class CameraMetrics:
+	"""
+	A camera's view of Metrics, everything recorded through it gets the camera label
+	"""
+	def __init__(self, metrics, camera):
+		self.metrics = metrics
+		self.camera = camera
+
+	def observe(self, stage, seconds):
+		self.metrics.observe(stage, seconds, self.camera)
+
+	def inc(self, name, value=1):
+		self.metrics.inc(name, value, self.camera)
+
+	def gauge(self, name, value):
+		self.metrics.gauge(name, value, self.camera)
+
+	def collect(self, prefix, stats, gauges=()):
+		self.metrics.collect(prefix, stats, gauges, self.camera)
+
+
+def load(path):
+	"""
+	Read a snapshot written by Metrics.flush, None if there is none yet
+	"""
+	try:
+		with open(path, "r") as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+
+def _fresh(snapshot, stale_after):
+	return snapshot is not None and time.time() - snapshot.get("updated", 0) < stale_after
+
+
+def _labels(camera, **extra):
+	labels = ([f'camera="{camera}"'] if camera else []) + [f'{key}="{value}"' for key, value in extra.items()]
+	return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _families(values):
+	# {camera: {name: value}} -> {name: [(camera, value)]}, Prometheus wants every series of a metric together
+	families = {}
+	for camera, named in sorted(values.items()):
+		for name, value in named.items():
+			families.setdefault(name, []).append((camera, value))
+	return sorted(families.items())
+
+
+def prometheus(snapshot, stale_after=5.0):
+	"""
+	Prometheus text exposition format (version 0.0.4) of a snapshot
+	"""
+	lines = [
+		f"# HELP {PREFIX}_up Whether main.py reported metrics in the last {stale_after:g} seconds",
+		f"# TYPE {PREFIX}_up gauge",
+		f"{PREFIX}_up {1 if _fresh(snapshot, stale_after) else 0}",
+	]
+	if snapshot is None:
+		return "\n".join(lines) + "\n"
+
+	name = f"{PREFIX}_stage_duration_seconds"
+	lines += [f"# HELP {name} Time spent per frame in each pipeline stage", f"# TYPE {name} histogram"]
+	bounds = [f"{b:g}" for b in snapshot["buckets"]] + ["+Inf"]
+	for stage, series in _families(snapshot["histograms"]):
+		for camera, h in series:
+			cumulative = 0
+			for le, count in zip(bounds, h["buckets"]):
+				cumulative += count
+				lines.append(f"{name}_bucket{_labels(camera, stage=stage, le=le)} {cumulative}")
+			lines.append(f"{name}_sum{_labels(camera, stage=stage)} {h['sum']}")
+			lines.append(f"{name}_count{_labels(camera, stage=stage)} {h['count']}")
+
+	for counter, series in _families(snapshot["counters"]):
+		lines.append(f"# TYPE {PREFIX}_{counter}_total counter")
+		lines += [f"{PREFIX}_{counter}_total{_labels(camera)} {value}" for camera, value in series]
+	for gauge, series in _families(snapshot["gauges"]):
+		lines.append(f"# TYPE {PREFIX}_{gauge} gauge")
+		lines += [f"{PREFIX}_{gauge}{_labels(camera)} {value}" for camera, value in series]
+	lines += [f"# TYPE {PREFIX}_start_time_seconds gauge", f"{PREFIX}_start_time_seconds {snapshot['started']}"]
+	return "\n".join(lines) + "\n"
+
+
+def _stages(histograms):
+	stages = {}
+	for stage, h in histograms.items():
+		q = h["quantiles"]
+		stages[stage] = {
+			"count": h["count"],
+			"p50": round(q["0.5"] * 1000, 2),
+			"p95": round(q["0.95"] * 1000, 2),
+			"p99": round(q["0.99"] * 1000, 2),
+		}
+	return stages
+
+
+def summary(snapshot, stale_after=5.0):
+	"""
+	Compact view for the dashboard: per-stage count and p50/p95/p99 in ms, counters and gauges,
+	process-wide at the top level and per camera under "cameras"
+	"""
+	if snapshot is None:
+		return {"up": False, "stages": {}, "counters": {}, "gauges": {}, "cameras": {}}
+	cameras = {}
+	for kind in ("histograms", "counters", "gauges"):
+		for camera in snapshot[kind]:
+			if camera:
+				cameras[camera] = {
+					"stages": _stages(snapshot["histograms"].get(camera, {})),
+					"counters": snapshot["counters"].get(camera, {}),
+					"gauges": snapshot["gauges"].get(camera, {}),
+				}
+	return {
+		"up": _fresh(snapshot, stale_after),
+		"updated": snapshot["updated"],
+		"stages": _stages(snapshot["histograms"].get("", {})),
+		"counters": snapshot["counters"].get("", {}),
+		"gauges": snapshot["gauges"].get("", {}),
+		"cameras": cameras,
+	}
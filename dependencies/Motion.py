@@ -0,0 +1,89 @@
+import collections, cv2
+import numpy as np
+
+# motion: something moved inside the zones, score: fraction of changed zone pixels,
+# boxes: (x, y, w, h) of the changed regions in full frame coordinates
+MotionResult = collections.namedtuple("MotionResult", ["motion", "score", "boxes"])
+MODELS = ("average", "mog2")
+
+
+class MotionDetector:
+	"""
+	Background subtraction on a downscaled grayscale frame.
+	model is "average" (running average background) or "mog2" (OpenCV MOG2).
+	Zones are polygons in 0-1 frame coordinates, e.g. [[0, 0], [0.5, 0], [0.5, 1], [0, 1]];
+	only include zones are watched (whole frame if none) and exclude zones are ignored.
+	"""
+	def __init__(self, width=320, model="average", learning_rate=0.05, threshold=25, min_area=5000, min_score=0.0, include=None, exclude=None):
+		if model not in MODELS:
+			raise ValueError(f"motion model must be 'average' or 'mog2', not {model!r}")
+		self.width = width
+		self.model = model
+		self.learning_rate = learning_rate
+		self.threshold = threshold
+		self.min_area = min_area
+		self.min_score = min_score
+		self.include = include or []
+		self.exclude = exclude or []
+
+		self.background = None
+		self.subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False) if model == "mog2" else None
+		self._mask_key = None
+		self.mask = None
+		self.mask_area = 0
+
+	def _build_mask(self, shape):
+		h, w = shape
+		def to_px(polygon):
+			return np.array([[int(x * w), int(y * h)] for x, y in polygon], dtype=np.int32)
+		if self.include:
+			mask = np.zeros((h, w), dtype=np.uint8)
+			cv2.fillPoly(mask, [to_px(p) for p in self.include], 255)
+		else:
+			mask = np.full((h, w), 255, dtype=np.uint8)
+		if self.exclude:
+			cv2.fillPoly(mask, [to_px(p) for p in self.exclude], 0)
+		self.mask = None if not self.include and not self.exclude else mask
+		self.mask_area = max(1, cv2.countNonZero(mask))
+
+	def reset(self):
+		self.background = None
+		if self.subtractor is not None:
+			self.subtractor = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+
+	def detect(self, frame):
+		scale = self.width / frame.shape[1]
+		size = (self.width, max(1, int(round(frame.shape[0] * scale))))
+		small = cv2.resize(frame, size, interpolation=cv2.INTER_LINEAR)
+		gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+		gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+		if self._mask_key != gray.shape:
+			self._mask_key = gray.shape
+			self._build_mask(gray.shape)
+
+		if self.model == "mog2":
+			fg = self.subtractor.apply(gray, learningRate=self.learning_rate)
+			_, fg = cv2.threshold(fg, 127, 255, cv2.THRESH_BINARY)
+		else:
+			if self.background is None:
+				self.background = gray.astype(np.float32)
+				return MotionResult(False, 0.0, [])
+			delta = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+			cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+			_, fg = cv2.threshold(delta, self.threshold, 255, cv2.THRESH_BINARY)
+
+		if self.mask is not None:
+			fg = cv2.bitwise_and(fg, self.mask)
+		fg = cv2.dilate(fg, None, iterations=1)
+		score = cv2.countNonZero(fg) / self.mask_area
+
+		contours, _ = cv2.findContours(fg, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+		min_area = self.min_area * scale * scale
+		boxes = []
+		for contour in contours:
+			if cv2.contourArea(contour) < min_area:
+				continue
+			x, y, w, h = cv2.boundingRect(contour)
+			boxes.append((int(x / scale), int(y / scale), int(w / scale), int(h / scale)))
+		return MotionResult(bool(boxes) and score >= self.min_score, score, boxes)
@@ -0,0 +1,439 @@
+import multiprocessing, collections, threading, queue, json, time
+import numpy as np
+from multiprocessing import shared_memory
+
+# Face and pose output for one frame, joined by frame index.
+# identity is the face tracker's verdict for the person on screen, None without tracking
+# timings maps stage name to seconds spent on this frame (face, face_detect, face_encode, pose)
+InferenceResult = collections.namedtuple("InferenceResult", ["index", "face_locations", "face_names", "body", "body_bbox", "identity", "timings"], defaults=[None])
+
+
+def empty_locations():
+	return np.zeros((0, 4), dtype=int)
+
+
+def face_stage(face_kwargs, tracking_kwargs, fr=None):
+	"""
+	Facerec, wrapped in a FaceTracker when tracking_kwargs is given
+	:param fr: existing Facerec (gallery) to use instead of a new one
+	"""
+	if fr is None:
+		from dependencies.Facerec import Facerec
+		fr = Facerec(**face_kwargs)
+	if tracking_kwargs is None:
+		return fr
+	from dependencies.Tracker import FaceTracker
+	return FaceTracker(fr, **tracking_kwargs)
+
+
+def load_facerec(face, images_path):
+	"""
+	New Facerec with the current gallery for a face stage, to hand to use_facerec
+	"""
+	return getattr(face, "fr", face).reloaded(images_path)
+
+
+def use_facerec(face, fr):
+	"""
+	Face stage matching with fr, a FaceTracker keeps its tracks but forgets their identities
+	"""
+	if hasattr(face, "use_facerec"):
+		face.use_facerec(fr)
+		return face
+	return fr
+
+
+def face_identity(face):
+	return face.identity() if hasattr(face, "identity") else None
+
+
+def run_face(face, frame):
+	"""
+	:return: (face_locations, face_names, identity, timings)
+	"""
+	start = time.perf_counter()
+	face_locations, face_names = face.detect_known_faces(frame)
+	elapsed = time.perf_counter() - start
+	# a FaceTracker keeps the Facerec it wraps in .fr
+	timings = getattr(face, "fr", face).take_timings()
+	timings["face"] = elapsed
+	return face_locations, face_names, face_identity(face), timings
+
+
+def run_pose(detector, frame, regions=(), face_locations=(), camera=""):
+	"""
+	:param detector: PresenceDetector
+	:param regions: motion boxes to look at first
+	:param face_locations: faces already found on the frame, a face confirms a person
+	:param camera: the frame's camera, for a detector shared between cameras
+	:return: (body bbox or None, seconds taken)
+	"""
+	start = time.perf_counter()
+	bbox = detector.detect(frame, regions, face_locations, camera)
+	return bbox, time.perf_counter() - start
+
+
+class InlineInference:
+	"""
+	Single-process fallback, runs face and pose one after another in collect().
+	face is a Facerec or FaceTracker, detector a PresenceDetector.
+	"""
+	def __init__(self, face, detector):
+		self.face = face
+		self.detector = detector
+		self.index = 0
+		self.pending = {}
+
+	def submit(self, frame, active=True, regions=()):
+		self.index += 1
+		self.pending[self.index] = (frame, regions)
+		return self.index
+
+	def collect(self, index):
+		frame, regions = self.pending.pop(index)
+		face_locations, face_names, identity, timings = run_face(self.face, frame)
+		bbox, timings["pose"] = run_pose(self.detector, frame, regions, face_locations)
+		return InferenceResult(index, face_locations, face_names, bbox is not None, bbox, identity, timings)
+
+	def load_faces(self, images_path):
+		"""
+		Load the gallery off the camera thread, use_faces() then swaps it in between frames
+		"""
+		return load_facerec(self.face, images_path)
+
+	def use_faces(self, fr):
+		self.face = use_facerec(self.face, fr)
+
+	def reload_faces(self, images_path):
+		# only from the camera thread, see load_faces
+		self.use_faces(self.load_faces(images_path))
+
+	def presence_stats(self):
+		return self.detector.stats()
+
+	def close(self):
+		self.pending.clear()
+		# MediaPipe graphs hold native threads and buffers until closed
+		self.detector.close()
+
+
+class SharedFrameSlots:
+	"""
+	Fixed number of frame-sized slots in one shared memory block.
+	"""
+	def __init__(self, shape, count, name=None):
+		self.shape = tuple(shape)
+		self.count = count
+		size = int(np.prod(self.shape)) * count
+		if name is None:
+			self.shm = shared_memory.SharedMemory(create=True, size=size)
+			self.owner = True
+		else:
+			self.shm = shared_memory.SharedMemory(name=name)
+			self.owner = False
+		self.array = np.ndarray((count,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+	@property
+	def name(self):
+		return self.shm.name
+
+	def close(self):
+		del self.array
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+
+
+def _face_worker(tasks, results, shm_name, shape, count, images_path, face_kwargs, tracking_kwargs):
+	face = face_stage(face_kwargs, tracking_kwargs)
+	# main.py publishes the gallery, the workers only map it
+	face.load_encoding_images(images_path, sync=False)
+	slots = SharedFrameSlots(shape, count, name=shm_name)
+	try:
+		while True:
+			task = tasks.get()
+			if task is None:
+				break
+			if task[0] == "reload":
+				face.load_encoding_images(task[1], sync=False)
+				continue
+			_, index, slot = task
+			results.put(("face", index, *run_face(face, slots.array[slot])))
+	finally:
+		slots.close()
+
+
+def _pose_worker(tasks, results, shm_name, shape, count, pose_kwargs):
+	from dependencies.Presence import PresenceDetector
+	detector = PresenceDetector(**pose_kwargs)
+	slots = SharedFrameSlots(shape, count, name=shm_name)
+	try:
+		while True:
+			task = tasks.get()
+			if task is None:
+				break
+			_, index, slot, regions, face_locations = task
+			results.put(("pose", index, *run_pose(detector, slots.array[slot], regions, face_locations)))
+	finally:
+		slots.close()
+
+
+class ProcessInference:
+	"""
+	Runs face recognition and pose detection in two worker processes at the
+	same time. Frames are copied once into shared memory slots, workers get
+	(frame index, slot) and results are joined per frame index.
+	"""
+	def __init__(self, shape, images_path, face_kwargs=None, pose_kwargs=None, slots=4, tracking_kwargs=None):
+		self.ctx = multiprocessing.get_context("spawn")
+		self.slots = SharedFrameSlots(shape, slots)
+		self.free = list(range(slots))
+		self.in_flight = {}
+		self.partial = {}
+		self.done = {}
+		self.index = 0
+		self.last_faces = []
+		self.results = self.ctx.Queue()
+		self.face_tasks = self.ctx.Queue()
+		self.pose_tasks = self.ctx.Queue()
+		self.workers = [
+			self.ctx.Process(target=_face_worker, name="FaceWorker", daemon=True,
+				args=(self.face_tasks, self.results, self.slots.name, self.slots.shape, slots, images_path, face_kwargs or {}, tracking_kwargs)),
+			self.ctx.Process(target=_pose_worker, name="PoseWorker", daemon=True,
+				args=(self.pose_tasks, self.results, self.slots.name, self.slots.shape, slots, pose_kwargs or {})),
+		]
+		for worker in self.workers:
+			worker.start()
+
+	def _receive(self, timeout):
+		try:
+			kind, index, *payload = self.results.get(timeout=timeout)
+		except queue.Empty:
+			for worker in self.workers:
+				if not worker.is_alive():
+					raise RuntimeError(f"{worker.name} exited with code {worker.exitcode}")
+			return
+		part = self.partial.setdefault(index, {})
+		part[kind] = payload
+		if len(part) == 2:
+			del self.partial[index]
+			self.free.append(self.in_flight.pop(index))
+			face_locations, face_names, identity, timings = part["face"]
+			bbox, timings["pose"] = part["pose"]
+			self.done[index] = InferenceResult(index, face_locations, face_names, bbox is not None, bbox, identity, timings)
+			self.last_faces = [tuple(int(v) for v in loc) for loc in face_locations]
+
+	def submit(self, frame, active=True, regions=()):
+		if frame.shape != self.slots.shape:
+			raise ValueError(f"frame shape {frame.shape} does not match pipeline slots {self.slots.shape}")
+		while not self.free:
+			self._receive(timeout=1.0)
+		slot = self.free.pop()
+		self.index += 1
+		np.copyto(self.slots.array[slot], frame)
+		self.in_flight[self.index] = slot
+		self.face_tasks.put(("frame", self.index, slot))
+		# face and pose run at the same time, the presence check goes by the faces of the last frame
+		self.pose_tasks.put(("frame", self.index, slot, list(regions), self.last_faces))
+		return self.index
+
+	def collect(self, index):
+		while index not in self.done:
+			self._receive(timeout=1.0)
+		return self.done.pop(index)
+
+	def reload_faces(self, images_path):
+		self.face_tasks.put(("reload", images_path))
+
+	def presence_stats(self):
+		# counted in the pose worker process
+		return {}
+
+	def close(self):
+		self.face_tasks.put(None)
+		self.pose_tasks.put(None)
+		for worker in self.workers:
+			worker.join(timeout=5)
+			if worker.is_alive():
+				worker.terminate()
+		self.slots.close()
+
+
+class InferencePool:
+	"""
+	Face and pose workers shared by several cameras, all matching against
+	one gallery (Facerec). Every worker thread has its own face detector
+	and presence model and the camera comes with each job, so eight cameras
+	load the models once per worker, not once per camera. What follows one
+	camera's frames stays per camera: its FaceTracker, its face detector
+	settings and the presence detector's run of hits.
+	Each camera has at most one frame waiting, a free worker takes the frame
+	of an active camera (motion or an open session) before idle ones and,
+	among equals, the camera that was served longest ago.
+	"""
+	def __init__(self, images_path, face_kwargs=None, pose_kwargs=None, workers=2, tracking_kwargs=None):
+		from dependencies.Facerec import Facerec
+		from dependencies.Presence import PresenceDetector
+		self.face_kwargs = face_kwargs or {}
+		self.pose_kwargs = pose_kwargs or {}
+		self.tracking_kwargs = tracking_kwargs
+		self.fr = Facerec(**self.face_kwargs)
+		self.fr.load_encoding_images(images_path, sync=False)
+		self.cond = threading.Condition()
+		# camera -> FaceTracker, None without tracking
+		self.faces = {}
+		# camera -> FaceDetectors config
+		self.detectors = {}
+		# camera -> client token, results for a camera released meanwhile are dropped
+		self.clients = {}
+		# cameras whose tracker has to forget its identities, the gallery changed
+		self.reloads = set()
+		self.waiting = {}
+		self.served = {}
+		self.results = {}
+		self.running = True
+
+		# counters
+		self.jobs = collections.Counter()
+
+		# frames of every camera take turns on a worker, so no pose landmark tracking between frames
+		self.presence = [PresenceDetector(video=False, **self.pose_kwargs) for _ in range(workers)]
+		self.workers = [threading.Thread(target=self._work, args=(presence,), name=f"InferenceWorker-{i}", daemon=True)
+			for i, presence in enumerate(self.presence)]
+		for worker in self.workers:
+			worker.start()
+
+	def client(self, camera, detector=None):
+		"""
+		:param detector: FaceDetectors config for this camera, defaults to face_kwargs["detector"]
+		"""
+		token = object()
+		with self.cond:
+			self.faces[camera] = face_stage(self.face_kwargs, self.tracking_kwargs, fr=self.fr) if self.tracking_kwargs is not None else None
+			self.detectors[camera] = detector if detector is not None else self.face_kwargs.get("detector")
+			self.clients[camera] = token
+			self.served[camera] = 0.0
+		return PoolClient(self, camera)
+
+	def _work(self, presence):
+		# this worker's Facerec per detector config, detectors are not shared between worker threads
+		base, frs = None, {}
+		while True:
+			with self.cond:
+				self.cond.wait_for(lambda: self.waiting or not self.running)
+				if not self.running:
+					return
+				camera = min(self.waiting, key=lambda c: (not self.waiting[c][2], self.served[c]))
+				index, frame, _, regions = self.waiting.pop(camera)
+				self.served[camera] = time.monotonic()
+				token = self.clients[camera]
+				face = self.faces[camera]
+				detector = self.detectors[camera]
+				reload = camera in self.reloads
+				self.reloads.discard(camera)
+				if self.fr is not base:
+					# a newer gallery, keep the detectors already built
+					base, frs = self.fr, {key: self.fr.with_detector(fr.detector) for key, fr in frs.items()}
+			try:
+				key = json.dumps(detector, sort_keys=True)
+				if key not in frs:
+					frs[key] = base.with_detector(detector)
+				fr = frs[key]
+				if face is None:
+					face = fr
+				elif reload:
+					face.use_facerec(fr)
+				else:
+					# only one job per camera at a time, no other worker is on this tracker
+					face.fr = fr
+				face_locations, face_names, identity, timings = run_face(face, frame)
+				bbox, timings["pose"] = run_pose(presence, frame, regions, face_locations, camera)
+				result = InferenceResult(index, face_locations, face_names, bbox is not None, bbox, identity, timings)
+			except Exception as e:
+				result = e
+			with self.cond:
+				if self.clients.get(camera) is token:
+					self.jobs[camera] += 1
+					self.results[camera] = result
+					self.cond.notify_all()
+
+	def submit(self, camera, index, frame, active, regions=()):
+		with self.cond:
+			self.waiting[camera] = (index, frame, active, regions)
+			self.cond.notify_all()
+
+	def collect(self, camera, index):
+		with self.cond:
+			while self.running:
+				result = self.results.get(camera)
+				if result is not None and (isinstance(result, Exception) or result.index == index):
+					del self.results[camera]
+					if isinstance(result, Exception):
+						raise result
+					return result
+				self.cond.wait(timeout=1.0)
+		raise RuntimeError("inference pool closed")
+
+	def reload_faces(self, images_path):
+		"""
+		Load the gallery into a new Facerec, every worker switches to it with its next job
+		"""
+		fr = self.fr.reloaded(images_path)
+		with self.cond:
+			self.fr = fr
+			self.reloads.update(self.faces)
+
+	def presence_stats(self, camera):
+		stats = collections.Counter()
+		for presence in self.presence:
+			stats.update(presence.stats(camera))
+		return dict(stats)
+
+	def release(self, camera):
+		with self.cond:
+			self.faces.pop(camera, None)
+			self.detectors.pop(camera, None)
+			self.clients.pop(camera, None)
+			self.reloads.discard(camera)
+			self.waiting.pop(camera, None)
+			self.results.pop(camera, None)
+
+	def stats(self):
+		with self.cond:
+			return {"waiting": len(self.waiting), "jobs": dict(self.jobs)}
+
+	def close(self):
+		with self.cond:
+			self.running = False
+			self.cond.notify_all()
+		for worker in self.workers:
+			worker.join(timeout=5)
+		for presence in self.presence:
+			presence.close()
+
+
+class PoolClient:
+	"""
+	One camera's handle on an InferencePool, used like InlineInference.
+	"""
+	def __init__(self, pool, camera):
+		self.pool = pool
+		self.camera = camera
+		self.index = 0
+
+	def submit(self, frame, active=True, regions=()):
+		self.index += 1
+		self.pool.submit(self.camera, self.index, frame, active, regions)
+		return self.index
+
+	def collect(self, index):
+		return self.pool.collect(self.camera, index)
+
+	def reload_faces(self, images_path):
+		self.pool.reload_faces(images_path)
+
+	def presence_stats(self):
+		return self.pool.presence_stats(self.camera)
+
+	def close(self):
+		self.pool.release(self.camera)
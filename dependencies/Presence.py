@@ -0,0 +1,131 @@
+import collections, cv2
+import numpy as np
+
+# landmarks 17-22 are the fingers, left out of the box like cvzone's bboxWithHands=False
+BODY_LANDMARKS = [i for i in range(33) if not 17 <= i <= 22]
+
+
+class PresenceDetector:
+	"""
+	Answers "is there a person" for the body counter without full pose
+	estimation on every full resolution frame. In order:
+	- a face found on the frame already confirms a person, pose is skipped (skip_on_face)
+	- otherwise the lightest MediaPipe pose model (model_complexity) runs on
+	  the motion regions, or on the whole frame downscaled to width
+	- a miss right after a hit is retried with the full pose model on the
+	  full frame (escalate), so the lite model dropping a frame doesn't break
+	  the run of frames body_inc counts
+	:param width: frame width the light pass runs at
+	:param motion_regions: crop to the motion boxes when they cover less than half the frame
+	:param video: whole frames are one video stream, False when the frames of several cameras take turns
+	"""
+	def __init__(self, width=320, model_complexity=0, detection_con=0.5, track_con=0.5, motion_regions=True, skip_on_face=True, escalate=True, video=True):
+		import mediapipe as mp
+		self.mp_pose = mp.solutions.pose
+		self.width = width
+		self.model_complexity = model_complexity
+		self.detection_con = detection_con
+		self.track_con = track_con
+		self.motion_regions = motion_regions
+		self.skip_on_face = skip_on_face
+		self.escalate = escalate
+		# whole frames are a video stream (landmarks tracked between frames), crops move around so each is a still
+		self.stream_mode = video
+		self.video = self._pose(static=not video, complexity=model_complexity)
+		self.stills = None
+		self.full = None
+		# per stream (camera), a shared detector keeps each camera's run of hits apart
+		self.last_seen = {}
+
+		# counters, per stream
+		self.counts = collections.defaultdict(collections.Counter)
+
+	def _pose(self, static, complexity):
+		return self.mp_pose.Pose(static_image_mode=static, model_complexity=complexity, smooth_landmarks=not static,
+			min_detection_confidence=self.detection_con, min_tracking_confidence=self.track_con)
+
+	@staticmethod
+	def _bbox(pose, rgb, offset=(0, 0), scale=1.0):
+		"""
+		Body box (x, y, w, h) in full frame coordinates, or None
+		"""
+		landmarks = pose.process(rgb).pose_landmarks
+		if landmarks is None:
+			return None
+		height, width = rgb.shape[:2]
+		points = np.array([(landmarks.landmark[i].x * width, landmarks.landmark[i].y * height) for i in BODY_LANDMARKS])
+		x1, y1 = points.min(axis=0)
+		x2, y2 = points.max(axis=0)
+		return (int(offset[0] + x1 / scale), int(offset[1] + y1 / scale), int((x2 - x1) / scale), int((y2 - y1) / scale))
+
+	@staticmethod
+	def _from_face(face_locations, shape):
+		# the body under the biggest face, for the box drawn on the feed
+		top, right, bottom, left = max(face_locations, key=lambda f: (f[2] - f[0]) * (f[1] - f[3]))
+		w = right - left
+		x = max(0, left - w)
+		return (int(x), int(top), int(min(shape[1], right + w) - x), int(shape[0] - top))
+
+	def _region(self, regions, shape):
+		if not self.motion_regions or not len(regions):
+			return None
+		boxes = np.array(regions)
+		x1, y1 = boxes[:, 0].min(), boxes[:, 1].min()
+		x2, y2 = (boxes[:, 0] + boxes[:, 2]).max(), (boxes[:, 1] + boxes[:, 3]).max()
+		# a little margin, the motion box often stops at the moving limb
+		pad_x, pad_y = (x2 - x1) // 4, (y2 - y1) // 4
+		x1, y1 = max(0, x1 - pad_x), max(0, y1 - pad_y)
+		x2, y2 = min(shape[1], x2 + pad_x), min(shape[0], y2 + pad_y)
+		if (x2 - x1) * (y2 - y1) * 2 > shape[0] * shape[1]:
+			return None
+		return int(x1), int(y1), int(x2), int(y2)
+
+	def detect(self, frame, regions=(), face_locations=(), stream=""):
+		"""
+		:param frame: BGR frame
+		:param regions: motion boxes (x, y, w, h) in frame coordinates
+		:param face_locations: faces found on this frame, (top, right, bottom, left)
+		:param stream: camera the frame is from
+		:return: body box (x, y, w, h) or None
+		"""
+		counts = self.counts[stream]
+		counts["frames"] += 1
+		if self.skip_on_face and len(face_locations):
+			counts["face_skips"] += 1
+			self.last_seen[stream] = True
+			return self._from_face(face_locations, frame.shape)
+
+		region = self._region(regions, frame.shape)
+		if region is not None:
+			counts["region_runs"] += 1
+			x1, y1, x2, y2 = region
+			crop = frame[y1:y2, x1:x2]
+			scale = min(1.0, self.width / crop.shape[1])
+			if self.stills is None:
+				self.stills = self._pose(static=True, complexity=self.model_complexity)
+			bbox = self._bbox(self.stills, cv2.cvtColor(cv2.resize(crop, (0, 0), fx=scale, fy=scale), cv2.COLOR_BGR2RGB), (x1, y1), scale)
+		else:
+			scale = self.width / frame.shape[1]
+			small = cv2.resize(frame, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+			bbox = self._bbox(self.video, cv2.cvtColor(small, cv2.COLOR_BGR2RGB), scale=scale)
+
+		if bbox is None and self.last_seen.get(stream) and self.escalate:
+			counts["escalations"] += 1
+			if self.full is None:
+				self.full = self._pose(static=not self.stream_mode, complexity=1)
+			bbox = self._bbox(self.full, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+		self.last_seen[stream] = bbox is not None
+		return bbox
+
+	def forget(self, stream):
+		self.last_seen.pop(stream, None)
+		self.counts.pop(stream, None)
+
+	def stats(self, stream=""):
+		counts = self.counts.get(stream, {})
+		return {key: counts.get(key, 0) for key in ("frames", "face_skips", "region_runs", "escalations")}
+
+	def close(self):
+		for pose in (self.video, self.stills, self.full):
+			if pose is not None:
+				pose.close()
@@ -0,0 +1,126 @@
+import threading, queue, collections, itertools, time, os, cv2
+
+
+class Recorder:
+	"""
+	Session recorder. Frames are pushed every loop iteration, while idle the
+	last pre_roll seconds are kept in memory and flushed into the clip when a
+	session starts. Writing happens on a background thread fed by a bounded
+	queue, frames are repeated or dropped by their timestamps so the clip
+	plays back in real time at the camera's frame rate, whether the loop runs
+	slower or faster than that.
+	:param fps: the camera's frame rate, the clips' and the most frames per second both buffers hold
+	:param queue_seconds: seconds of video that can wait to be written before frames are dropped
+	"""
+	def __init__(self, pre_roll=3.0, fps=30, queue_seconds=1.0, fourcc="MJPG"):
+		self.pre_roll_seconds = pre_roll
+		self.camera_fps = float(fps)
+		self.fps = float(fps)
+		# full frames, 2.7MB each at 720p, so neither buffer may grow with a fast loop
+		self.queue_size = max(1, int(queue_seconds * fps))
+		self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+		self.pre_roll = collections.deque(maxlen=max(1, int(pre_roll * fps)))
+		self.queue = None
+		# every clip still being written, a stopped clip finishes while the next one records
+		self.threads = []
+		self.session = None
+		self.path = None
+		self._last_ts = None
+
+		# counters
+		self.dropped = 0
+		self.skipped = 0
+		self.clips = 0
+
+	@property
+	def recording(self):
+		return self.queue is not None
+
+	def push(self, frame, timestamp=None):
+		ts = time.time() if timestamp is None else timestamp
+		if self._last_ts is not None and ts > self._last_ts:
+			# smoothed loop rate, used for the next clip's fps
+			self.fps = 0.9 * self.fps + 0.1 * (1.0 / (ts - self._last_ts))
+		self._last_ts = ts
+
+		if self.queue is not None:
+			try:
+				self.queue.put_nowait((ts, frame))
+			except queue.Full:
+				self.dropped += 1
+		elif self.pre_roll_seconds > 0:
+			self.pre_roll.append((ts, frame))
+			while self.pre_roll and self.pre_roll[0][0] < ts - self.pre_roll_seconds:
+				self.pre_roll.popleft()
+
+	def set_pre_roll(self, seconds):
+		"""
+		Keep seconds of frames from now on, from the camera thread
+		"""
+		self.pre_roll_seconds = seconds
+		self.pre_roll = collections.deque(self.pre_roll, maxlen=max(1, int(seconds * self.camera_fps)))
+
+	def start(self, path):
+		"""
+		Open a new clip at path starting with the pre-roll frames
+		"""
+		if self.queue is not None:
+			return
+		self.path = path
+		self.queue = queue.Queue(maxsize=self.queue_size)
+		initial = list(self.pre_roll)
+		self.pre_roll.clear()
+		fps = max(1.0, round(self.camera_fps, 1))
+		self.session = {"on_finished": None}
+		self.threads = [thread for thread in self.threads if thread.is_alive()]
+		thread = threading.Thread(target=self._write, args=(path, fps, initial, self.queue, self.session), name="Recorder", daemon=True)
+		thread.start()
+		self.threads.append(thread)
+
+	def stop(self, on_finished=None):
+		"""
+		Finish the current clip without blocking, on_finished(path) is called
+		from the writer thread once the file is closed
+		"""
+		if self.queue is None:
+			return None
+		q, path = self.queue, self.path
+		self.session["on_finished"] = on_finished
+		self.queue = None
+		self.session = None
+		q.put(None)
+		return path
+
+	def _write(self, path, fps, initial, q, session):
+		os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+		writer = None
+		t0 = None
+		written = 0
+		for ts, frame in itertools.chain(initial, iter(q.get, None)):
+			if writer is None:
+				h, w = frame.shape[:2]
+				writer = cv2.VideoWriter(path, self.fourcc, fps, (w, h))
+				t0 = ts
+			target = int((ts - t0) * fps) + 1
+			if target - written > 2 * fps:
+				# the loop stalled, don't pad the clip with seconds of the same frame
+				t0 = ts - written / fps
+				target = written + 1
+			if target <= written:
+				# ahead of the clip's frame rate, written anyway it would play back too slowly
+				self.skipped += 1
+				continue
+			while written < target:
+				writer.write(frame)
+				written += 1
+		if writer is not None:
+			writer.release()
+			self.clips += 1
+		if session["on_finished"] is not None and writer is not None:
+			session["on_finished"](path)
+
+	def close(self):
+		self.stop()
+		for thread in self.threads:
+			thread.join(timeout=10)
+		self.threads = []
@@ -0,0 +1,45 @@
+class InferenceScheduler:
+	"""
+	Decides per frame whether the face and pose detectors should run.
+	They run on every frame while a detection session is open, wake up on
+	motion for wake_frames frames, and only run every idle_interval frames
+	(never if 0) while the scene is static.
+	"""
+	def __init__(self, enabled=True, idle_interval=15, wake_frames=30):
+		self.enabled = enabled
+		self.idle_interval = idle_interval
+		self.wake_frames = wake_frames
+		self.wake = 0
+		self.idle_count = 0
+
+		# counters
+		self.ran = 0
+		self.skipped = 0
+
+	def should_run(self, motion, session_open):
+		"""
+		:param motion: motion above the contour area threshold on this frame
+		:param session_open: a body/face was seen and the undetected_time reset has not happened yet
+		:return: True if face and pose inference should run on this frame
+		"""
+		if not self.enabled or session_open:
+			run = True
+		elif motion:
+			self.wake = self.wake_frames
+			run = True
+		elif self.wake > 0:
+			self.wake -= 1
+			run = True
+		else:
+			self.idle_count += 1
+			run = self.idle_interval > 0 and self.idle_count >= self.idle_interval
+
+		if run:
+			self.idle_count = 0
+			self.ran += 1
+		else:
+			self.skipped += 1
+		return run
+
+	def stats(self):
+		return {"ran": self.ran, "skipped": self.skipped}
@@ -0,0 +1,76 @@
+import threading, queue, os, cv2
+
+
+class SnapshotWriter:
+	"""
+	JPEG-encodes and writes snapshots on a few worker threads so the frame
+	loop never waits on the disk. The encoded bytes can be handed to a
+	callback (e.g. the webhook) before the file is written, so nothing has
+	to read the file back. Directories are created once and remembered.
+	"""
+	def __init__(self, workers=2, quality=95, queue_size=32):
+		self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+		self.queue = queue.Queue(maxsize=queue_size)
+		self.lock = threading.Lock()
+		self.dirs = set()
+
+		# counters
+		self.written = 0
+		self.failed = 0
+		self.dropped = 0
+
+		self.workers = [threading.Thread(target=self._run, name=f"SnapshotWriter-{i}", daemon=True) for i in range(workers)]
+		for worker in self.workers:
+			worker.start()
+
+	def save(self, frame, path, on_encoded=None):
+		"""
+		Queue frame to be written to path, never blocks. The frame is not
+		copied, the caller must not draw on it afterwards.
+		:param on_encoded: called with (file name, JPEG bytes) from a worker thread
+		:return: False if the queue was full and the snapshot was dropped
+		"""
+		try:
+			self.queue.put_nowait((frame, path, on_encoded))
+		except queue.Full:
+			self.dropped += 1
+			print(f"Snapshot queue full, dropped {os.path.basename(path)}")
+			return False
+		return True
+
+	def _ensure_dir(self, directory):
+		if directory in self.dirs:
+			return
+		os.makedirs(directory, exist_ok=True)
+		with self.lock:
+			self.dirs.add(directory)
+
+	def _run(self):
+		while True:
+			job = self.queue.get()
+			if job is None:
+				break
+			frame, path, on_encoded = job
+			try:
+				flag, encoded = cv2.imencode(".jpg", frame, self.params)
+				if not flag:
+					raise ValueError("JPEG encoding failed")
+				jpeg = encoded.tobytes()
+				if on_encoded is not None:
+					on_encoded(os.path.basename(path), jpeg)
+				self._ensure_dir(os.path.dirname(path))
+				with open(path, "wb") as f:
+					f.write(jpeg)
+				self.written += 1
+			except Exception as e:
+				self.failed += 1
+				print(f"Snapshot {path} failed: {e}")
+
+	def stats(self):
+		return {"queue_depth": self.queue.qsize(), "written": self.written, "failed": self.failed, "dropped": self.dropped}
+
+	def close(self, timeout=5):
+		for _ in self.workers:
+			self.queue.put(None)
+		for worker in self.workers:
+			worker.join(timeout=timeout)
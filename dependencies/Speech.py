@@ -0,0 +1,182 @@
+import threading, queue, collections, hashlib, shutil, subprocess, socket, time, sys, os
+
+
+class SpeechService:
+	"""
+	One long-lived text to speech worker. Announcements are queued and
+	spoken one at a time, a phrase that is already waiting or was spoken in
+	the last dedupe_window seconds is dropped, and so is anything beyond
+	max_per_minute. Phrases given up front are rendered to WAV files in
+	cache_dir once (when the worker is idle) and played back from there,
+	everything else goes through pyttsx3 directly.
+	main.py owns the only one, other processes hand it text with speak_remote.
+	"""
+	def __init__(self, enabled=True, phrases=(), cache_dir=None, dedupe_window=10.0, max_per_minute=12, queue_size=16):
+		self.enabled = enabled
+		self.cache_dir = cache_dir
+		self.dedupe_window = dedupe_window
+		self.max_per_minute = max_per_minute
+		self.queue = queue.Queue(maxsize=queue_size)
+		self.lock = threading.Lock()
+		self.pending = set()
+		self.last_spoken = {}
+		self.recent = collections.deque()
+		self.to_render = list(dict.fromkeys(phrases)) if cache_dir else []
+		self.engine = None
+		self.sock = None
+
+		# counters
+		self.spoken = 0
+		self.cached = 0
+		self.deduped = 0
+		self.limited = 0
+
+		self.worker = threading.Thread(target=self._run, name="SpeechService", daemon=True)
+		self.worker.start()
+
+	def say(self, text):
+		"""
+		Queue text to be spoken, never blocks
+		:return: False if it was dropped as a duplicate or over the rate limit
+		"""
+		print(text)
+		if not self.enabled:
+			return False
+		now = time.monotonic()
+		with self.lock:
+			if text in self.pending or now - self.last_spoken.get(text, -self.dedupe_window) < self.dedupe_window:
+				self.deduped += 1
+				return False
+			while self.recent and now - self.recent[0] > 60:
+				self.recent.popleft()
+			if self.max_per_minute and len(self.recent) >= self.max_per_minute:
+				self.limited += 1
+				return False
+			try:
+				self.queue.put_nowait(text)
+			except queue.Full:
+				self.limited += 1
+				return False
+			self.pending.add(text)
+			self.recent.append(now)
+		return True
+
+	def cache_path(self, text):
+		return os.path.join(self.cache_dir, hashlib.sha1(text.encode()).hexdigest()[:16] + ".wav")
+
+	def _init_engine(self):
+		if self.engine is None:
+			# created on the worker thread, pyttsx3 engines must stay on the thread that made them
+			import pyttsx3
+			self.engine = pyttsx3.init()
+		return self.engine
+
+	def _render(self, text):
+		path = self.cache_path(text)
+		if os.path.exists(path):
+			return
+		os.makedirs(self.cache_dir, exist_ok=True)
+		engine = self._init_engine()
+		engine.save_to_file(text, path + ".tmp")
+		engine.runAndWait()
+		if os.path.exists(path + ".tmp") and os.path.getsize(path + ".tmp") > 0:
+			os.replace(path + ".tmp", path)
+
+	def _play(self, path):
+		if sys.platform == "win32":
+			import winsound
+			winsound.PlaySound(path, winsound.SND_FILENAME)
+			return True
+		player = shutil.which("aplay") or shutil.which("paplay") or shutil.which("afplay")
+		if player is None:
+			return False
+		return subprocess.run([player, path], capture_output=True).returncode == 0
+
+	def _speak(self, text):
+		if self.cache_dir is not None:
+			path = self.cache_path(text)
+			if os.path.exists(path) and self._play(path):
+				self.cached += 1
+				return
+		engine = self._init_engine()
+		engine.say(text)
+		engine.runAndWait()
+
+	def _run(self):
+		while True:
+			try:
+				# render the fixed phrases while there is nothing to say
+				text = self.queue.get(timeout=0.5 if self.to_render else None)
+			except queue.Empty:
+				if not self.enabled:
+					# no pyttsx3 engine while speech is off, rendered once it is turned on
+					continue
+				phrase = self.to_render.pop(0)
+				try:
+					self._render(phrase)
+				except Exception as e:
+					print(f"Speech cache error: {e}")
+				continue
+			if text is None:
+				break
+			try:
+				self._speak(text)
+				self.spoken += 1
+			except Exception as e:
+				print(f"Speech error: {e}")
+			with self.lock:
+				self.pending.discard(text)
+				self.last_spoken[text] = time.monotonic()
+
+	def listen(self, port):
+		"""
+		Take text to say from other processes (run.py's /api/speak) on a local UDP port
+		"""
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind(("127.0.0.1", port))
+		threading.Thread(target=self._listen, name="SpeechService-listen", daemon=True).start()
+
+	def _listen(self):
+		while True:
+			try:
+				data, address = self.sock.recvfrom(4096)
+			except OSError:
+				return
+			try:
+				text = data.decode()
+			except UnicodeDecodeError:
+				continue
+			if not self.enabled:
+				reply = "disabled"
+			else:
+				reply = "queued" if self.say(text) else "dropped"
+			try:
+				self.sock.sendto(reply.encode(), address)
+			except OSError:
+				pass
+
+	def stats(self):
+		return {"queue_depth": self.queue.qsize(), "spoken": self.spoken, "cached": self.cached, "deduped": self.deduped, "limited": self.limited}
+
+	def close(self, timeout=5):
+		if self.sock is not None:
+			self.sock.close()
+		try:
+			self.queue.put(None, timeout=timeout)
+		except queue.Full:
+			return
+		self.worker.join(timeout=timeout)
+
+
+def speak_remote(text, port, timeout=1.0):
+	"""
+	Hand text to main.py's SpeechService
+	:return: "queued", "dropped" (duplicate or over the rate limit), "disabled", or None if main.py didn't answer
+	"""
+	with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+		sock.settimeout(timeout)
+		try:
+			sock.sendto(text.encode()[:4096], ("127.0.0.1", port))
+			return sock.recv(64).decode()
+		except OSError:
+			return None
@@ -0,0 +1,109 @@
+import threading, contextlib, time
+import numpy as np
+
+from dependencies.Pipeline import InferenceResult, empty_locations
+
+
+class StartupProfile:
+	"""
+	Timeline of the security system's start, in seconds since started (a
+	time.perf_counter() taken before the heavy imports). Stages have a start
+	and an end and may overlap, they run in parallel; milestones (first
+	frame, detection ready) are the moment they were first reached.
+	Both can be per camera.
+	"""
+	def __init__(self, started):
+		self.started = started
+		self.lock = threading.Lock()
+		self.stages = {}
+		self.milestones = {}
+		self.reported = False
+
+	def _now(self):
+		return time.perf_counter() - self.started
+
+	@contextlib.contextmanager
+	def stage(self, name, camera=""):
+		start = self._now()
+		try:
+			yield
+		finally:
+			with self.lock:
+				self.stages[(camera, name)] = (start, self._now())
+
+	def run(self, name, function, *args, camera=""):
+		"""
+		function(*args) timed as a stage, for handing to an executor
+		"""
+		with self.stage(name, camera):
+			return function(*args)
+
+	def mark(self, name, camera=""):
+		if (camera, name) in self.milestones:
+			return
+		with self.lock:
+			self.milestones.setdefault((camera, name), self._now())
+
+	def reached(self, name, cameras):
+		return all((camera, name) in self.milestones for camera in cameras)
+
+	def combine(self, name, cameras):
+		"""
+		The process wide milestone, reached when the last camera reached it
+		"""
+		with self.lock:
+			self.milestones[("", name)] = max(self.milestones[(camera, name)] for camera in cameras)
+
+	def report(self):
+		"""
+		Lines of the timeline, in the order things finished
+		"""
+		with self.lock:
+			rows = [(end, f"{camera + ' ' if camera else ''}{name}", f"{start:6.2f} -> {end:6.2f}s  ({end - start:.2f}s)") for (camera, name), (start, end) in self.stages.items()]
+			rows += [(at, f"{camera + ' ' if camera else ''}{name}", f"{at:6.2f}s") for (camera, name), at in self.milestones.items()]
+		width = max((len(label) for _, label, _ in rows), default=0)
+		return [f"  {label:<{width}}  {timing}" for _, label, timing in sorted(rows)]
+
+	def to_metrics(self, metrics):
+		"""
+		startup_<stage>_seconds gauges: how long each stage took, and for
+		milestones how long after the start they were reached
+		"""
+		with self.lock:
+			for (camera, name), (start, end) in self.stages.items():
+				metrics.gauge(f"startup_{name}_seconds", round(end - start, 3), camera)
+			for (camera, name), at in self.milestones.items():
+				metrics.gauge(f"startup_{name}_seconds", round(at, 3), camera)
+
+
+class WarmingInference:
+	"""
+	Stands in for a camera's inference handle while the face and pose models
+	are still loading: the camera already runs capture, motion and recording,
+	face and pose report nothing until the real handle is swapped in.
+	"""
+	def submit(self, frame, active=True, regions=()):
+		return None
+
+	def collect(self, index):
+		return InferenceResult(None, empty_locations(), [], False, None, None)
+
+	def reload_faces(self, images_path):
+		pass
+
+	def presence_stats(self):
+		return {}
+
+	def close(self):
+		pass
+
+
+def warm_up(inference, shape=(720, 1280, 3)):
+	"""
+	Run one blank frame through a new inference handle, the first call of
+	each model sets up its graph and buffers and would otherwise delay the
+	first real detection
+	"""
+	index = inference.submit(np.zeros(shape, dtype=np.uint8), active=True)
+	if index is not None:
+		inference.collect(index)
@@ -0,0 +1,183 @@
+import collections
+
+# A side effect for the detection loop to carry out:
+#   speak         text to announce
+#   snapshot      save the frame as <prefix>_<time>.jpg, then send notify = (event, *args) with its path
+#   record_start  open a new recording
+#   record_stop   finish the recording, send it if notify = ("recording",)
+#   reset         the session ended
+# event/identity name what happened for the event store (motion, person, no_face, intruder, face, unknown, login)
+Action = collections.namedtuple("Action", ["kind", "text", "prefix", "notify", "event", "identity"], defaults=[None, None, None, None, None])
+
+# every fixed text a speak action can carry, for the speech cache
+PHRASES = (
+	"Motion detected",
+	"Person detected initiate face detection",
+	"Initiate face detection now you are already on camera",
+	"Face not detected",
+	"Intruder detected",
+	"Face detected look into the camera for reconition",
+	"Unknown face detected",
+)
+
+
+def c_face(facelist: list):
+	faces = {}
+	for face in facelist:
+		try:
+			faces[face]+=1
+		except KeyError:
+			faces[face] = 0
+	highest = 0
+	highest_n = None
+	for val in faces:
+		if faces[val] > highest:
+			highest = faces[val]
+			highest_n = val
+
+	return highest_n
+
+
+class DetectionSession:
+	"""
+	The per-camera notification state machine. Fed the motion/face/body
+	verdict for every frame, it counts frames, decides when to record, speak,
+	snapshot and notify, and resets after undetected_time quiet frames.
+	It has no I/O of its own, update() returns the Actions to carry out.
+	"""
+	def __init__(self, body_inc, face_inc, motion_inc, undetected_time, motion_detection=True, notifications=True):
+		self.body_inc = body_inc
+		self.face_inc = face_inc
+		self.motion_inc = motion_inc
+		self.undetected_time = undetected_time
+		self.motion_detection = motion_detection
+		self.notifications = notifications
+		self.reset()
+
+	def reset(self):
+		self.motion_c = 0
+		self.face_det = []
+		self.face_identity = None
+		self.face_c = 0
+		self.body_c = 0
+		self.prev = False
+		self.f_reset = False
+		self.intruder = True
+		self.detected = False
+		self.undetected_c = 0
+		self.just_ran = []
+		self.name = None
+
+	@property
+	def open(self):
+		"""
+		True between the first body/face hit and the undetected_time reset
+		"""
+		return self.prev
+
+	def update(self, motion, face_names, body, identity=None):
+		"""
+		:param motion: motion on this frame
+		:param face_names: names of the faces on this frame
+		:param body: a body was detected on this frame
+		:param identity: face tracker identity, replaces voting over face_names when not None
+		:return: list of Actions
+		"""
+		actions = []
+		face = len(face_names) > 0
+		if motion:
+			self.motion_c+=1
+		if face:
+			self.name = face_names[-1]
+			self.face_c+=1
+			self.face_det.append(self.name)
+			self.face_identity = identity
+		if body:
+			self.body_c+=1
+
+		## recorder
+		if body or face:
+			self.prev = True
+		if (self.body_c == 1 or (self.face_c == 1 and not self.f_reset)) and "recorder" not in self.just_ran:
+			actions.append(Action("record_start"))
+			self.just_ran.append("recorder")
+
+		## reset
+		if not body and not face and not motion and self.prev:
+			self.undetected_c+=1
+
+		if self.undetected_c == self.undetected_time:
+			send = self.intruder and (self.body_c > 5 or self.face_c > 5) and self.notifications
+			actions.append(Action("record_stop", notify=("recording",) if send else None))
+			actions.append(Action("reset"))
+			self.reset()
+
+		## notification
+		if self.motion_detection and self.motion_c == self.motion_inc and "motion" not in self.just_ran:
+			if not self.f_reset:
+				actions.append(Action("speak", "Motion detected", event="motion"))
+			self.just_ran.append("motion")
+
+
+		if self.body_c == self.body_inc and self.face_c == 0 and "body_1" not in self.just_ran:
+			if not self.f_reset:
+				actions.append(Action("speak", "Person detected initiate face detection"))
+			actions.append(Action("snapshot", prefix="body", event="person"))
+			self.just_ran.append("body_1")
+
+
+		elif self.body_c == self.body_inc*2 and self.face_c == 0 and "body_2" not in self.just_ran:
+			if not self.f_reset:
+				actions.append(Action("speak", "Initiate face detection now you are already on camera"))
+			actions.append(Action("snapshot", prefix="body_1", event="person"))
+			self.just_ran.append("body_2")
+
+
+		elif self.body_c == self.body_inc*3 and self.face_c == 0 and "body_3" not in self.just_ran:
+			if not self.f_reset:
+				actions.append(Action("speak", "Face not detected"))
+			actions.append(Action("snapshot", prefix="body_nf", event="no_face"))
+			self.just_ran.append("body_3")
+
+
+		elif self.body_c == self.body_inc*4 and self.face_c == 0 and "body_4" not in self.just_ran:
+			notify = ("intruder",) if not self.f_reset and self.notifications else None
+			actions.append(Action("snapshot", prefix="body_nf2", notify=notify, event="intruder"))
+			if not self.f_reset:
+				actions.append(Action("speak", "Intruder detected"))
+			self.just_ran.append("body_4")
+
+
+		elif self.face_c == 1 and "face_1" not in self.just_ran:
+			if not self.f_reset:
+				actions.append(Action("speak", "Face detected look into the camera for reconition"))
+			if self.name == "Unknown":
+				actions.append(Action("snapshot", prefix="unknown_face", event="face"))
+			self.just_ran.append("face_1")
+
+
+		elif self.face_c == self.face_inc:
+			# the tracked identity replaces per-frame name voting when tracking is on
+			d_face = self.face_identity if self.face_identity is not None else c_face(self.face_det)
+			# no name was seen twice, fall back to the last one seen like before the vote
+			name = d_face = d_face if d_face is not None else self.name
+			if d_face == "Unknown":
+				notify = ("unknown",) if not self.f_reset and self.notifications else None
+				actions.append(Action("snapshot", prefix=f"verification_{name}_face", notify=notify, event="unknown", identity=name))
+				if not self.f_reset:
+					actions.append(Action("speak", "Unknown face detected"))
+				self.face_c = 0
+				self.f_reset = True
+
+
+			elif not self.detected:
+				notify = ("login", name) if (not self.f_reset or self.intruder) and self.notifications else None
+				actions.append(Action("snapshot", prefix=f"verification_{name}_face", notify=notify, event="login", identity=name))
+				if not self.f_reset or self.intruder:
+					actions.append(Action("speak", f"Welcome, {name}"))
+				self.face_c = 0
+				self.detected = True
+				self.intruder = False
+				self.f_reset = True
+
+		return actions
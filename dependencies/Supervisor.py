@@ -0,0 +1,262 @@
+import collections, threading, subprocess, socket, signal, time, sys, os
+from datetime import datetime
+
+# the supervisor hands its heartbeat port to the children in this variable
+HEARTBEAT_ENV = "SECUREHOME_HEARTBEAT"
+
+
+class Heartbeat:
+	"""
+	Tells run.py's supervisor a camera loop is still getting through frames,
+	one UDP datagram per camera at most every interval seconds. Does nothing
+	when the process wasn't started by the supervisor.
+	"""
+	def __init__(self, interval=0.5):
+		port = os.environ.get(HEARTBEAT_ENV)
+		self.address = ("127.0.0.1", int(port)) if port else None
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if self.address else None
+		self.interval = interval
+		self.last = {}
+
+	def beat(self, name):
+		if self.sock is None:
+			return
+		now = time.monotonic()
+		if now - self.last.get(name, -self.interval) < self.interval:
+			return
+		self.last[name] = now
+		try:
+			self.sock.sendto(f"{os.getpid()} {name}".encode(), self.address)
+		except OSError:
+			pass
+
+
+class Child:
+	"""
+	One supervised script and its state
+	"""
+	def __init__(self, name, script, label, heartbeat, tail):
+		self.name = name
+		self.script = script
+		self.label = label
+		self.heartbeat = heartbeat
+		self.process = None
+		self.wanted = False
+		self.started = 0.0
+		self.beats = {}
+		self.next_start = None
+		self.backoff = 0.0
+		self.restarts = 0
+		self.tail = collections.deque(maxlen=tail)
+
+	def running(self):
+		return self.process is not None and self.process.poll() is None
+
+
+class Supervisor:
+	"""
+	Starts main.py and bot.py, restarts them when they exit or, for children
+	sending a Heartbeat, when a camera loop stops getting through frames for
+	heartbeat_timeout seconds. Restarts wait backoff seconds, doubling up to
+	max_backoff while the child keeps failing within stable_after seconds of
+	starting. Every restart is kept in history and the last lines the child
+	printed are written to crash_dir.
+	:param on_line: called with (line, label) for every line of output, and (message, "SUPERVISOR", level) for its own
+	:param startup_grace: seconds a child gets to send its first heartbeat, it loads models and opens cameras first
+	:param stop_timeout: seconds a child gets to shut down before it is killed
+	"""
+	def __init__(self, on_line, heartbeat_port=8041, heartbeat_timeout=5.0, startup_grace=60.0, backoff=1.0, max_backoff=60.0,
+			stable_after=60.0, stop_timeout=5.0, history=50, crash_dir=None, tail=200):
+		self.on_line = on_line
+		self.heartbeat_timeout = heartbeat_timeout
+		self.startup_grace = startup_grace
+		self.base_backoff = backoff
+		self.max_backoff = max_backoff
+		self.stable_after = stable_after
+		self.stop_timeout = stop_timeout
+		self.crash_dir = crash_dir
+		self.tail = tail
+		self.history = collections.deque(maxlen=history)
+		self.children = {}
+		self.lock = threading.RLock()
+		self.heartbeat_port = heartbeat_port
+		self.sock = None
+		self.running = False
+
+	def _serve(self):
+		# bound on the first start, a Supervisor that never started anything doesn't hold the port
+		self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+		self.sock.bind(("127.0.0.1", self.heartbeat_port))
+		self.sock.settimeout(0.5)
+		self.port = self.sock.getsockname()[1]
+		self.running = True
+		threading.Thread(target=self._listen, name="Supervisor-heartbeat", daemon=True).start()
+		threading.Thread(target=self._watch, name="Supervisor", daemon=True).start()
+
+	def add(self, name, script, label, heartbeat=False):
+		self.children[name] = Child(name, script, label, heartbeat, self.tail)
+
+	def _log(self, message, level="info"):
+		self.on_line(message, "SUPERVISOR", level)
+
+	def _launch(self, child):
+		env = dict(os.environ, PYTHONUNBUFFERED="1")
+		if child.heartbeat:
+			env[HEARTBEAT_ENV] = str(self.port)
+		# own process group on Windows so it can be sent CTRL_BREAK instead of being killed outright
+		flags = subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0
+		child.process = subprocess.Popen([sys.executable, child.script], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+			universal_newlines=True, bufsize=1, env=env, creationflags=flags)
+		child.started = time.monotonic()
+		child.beats = {}
+		child.next_start = None
+		threading.Thread(target=self._read, args=(child, child.process), name=f"Supervisor-{child.name}", daemon=True).start()
+
+	def _read(self, child, process):
+		try:
+			# until the pipe closes, so the last lines before an exit are not lost
+			for line in process.stdout:
+				line = line.rstrip()
+				if line:
+					child.tail.append(line)
+					self.on_line(line, child.label)
+		except Exception as e:
+			self._log(f"Error monitoring {child.label}: {e}", "error")
+
+	def _terminate(self, process):
+		"""
+		Ask the process to shut down (its finally blocks close the cameras and
+		recordings), kill it after stop_timeout
+		"""
+		if process is None or process.poll() is not None:
+			return
+		try:
+			process.send_signal(signal.CTRL_BREAK_EVENT if os.name == "nt" else signal.SIGTERM)
+			process.wait(timeout=self.stop_timeout)
+		except subprocess.TimeoutExpired:
+			process.kill()
+			process.wait()
+
+	def start(self, name):
+		with self.lock:
+			if not self.running:
+				self._serve()
+			child = self.children[name]
+			child.wanted = True
+			child.backoff = 0.0
+			if not child.running():
+				self._launch(child)
+
+	def stop(self, name):
+		with self.lock:
+			child = self.children[name]
+			child.wanted = False
+			child.next_start = None
+			self._terminate(child.process)
+
+	def restart(self, name):
+		with self.lock:
+			self.stop(name)
+			self.start(name)
+
+	def is_running(self, name):
+		return self.children[name].running()
+
+	def _listen(self):
+		while self.running:
+			try:
+				data, _ = self.sock.recvfrom(256)
+				pid, camera = data.decode().split(" ", 1)
+			except (socket.timeout, ValueError, UnicodeDecodeError):
+				continue
+			except OSError:
+				return
+			now = time.monotonic()
+			for child in self.children.values():
+				# a late beat from the process that was just replaced doesn't count
+				if child.process is not None and str(child.process.pid) == pid:
+					child.beats[camera] = now
+
+	def _stalled(self, child, now):
+		if not child.heartbeat:
+			return None
+		if not child.beats:
+			if now - child.started > self.startup_grace:
+				return f"no heartbeat {self.startup_grace:.0f}s after starting"
+			return None
+		stale = [camera for camera, beat in child.beats.items() if now - beat > self.heartbeat_timeout]
+		if stale:
+			return f"camera {', '.join(stale)} got no frames for {self.heartbeat_timeout:.0f}s"
+		return None
+
+	def _failed(self, child, reason, now):
+		child.restarts += 1
+		# failing again soon after starting backs off further, a child that ran for a while starts over
+		if now - child.started < self.stable_after:
+			child.backoff = min(self.max_backoff, child.backoff * 2 or self.base_backoff)
+		else:
+			child.backoff = self.base_backoff
+		child.next_start = now + child.backoff
+		crash_log = None
+		if self.crash_dir is not None:
+			crash_log = os.path.join(self.crash_dir, f"{child.name}_{datetime.now().strftime('%d-%m-%Y_%H-%M-%S')}_{child.restarts}.log")
+			try:
+				os.makedirs(self.crash_dir, exist_ok=True)
+				with open(crash_log, "w") as f:
+					f.write(f"{reason}\n\n" + "\n".join(child.tail) + "\n")
+			except OSError:
+				crash_log = None
+		self.history.append({
+			"time": time.time(),
+			"child": child.name,
+			"reason": reason,
+			"exit_code": child.process.returncode,
+			"uptime": round(now - child.started, 1),
+			"restart_in": child.backoff,
+			"crash_log": crash_log,
+		})
+		self._log(f"{child.label} {reason}, restarting in {child.backoff:g}s", "error")
+
+	def _watch(self):
+		while self.running:
+			time.sleep(0.5)
+			for child in list(self.children.values()):
+				with self.lock:
+					if not child.wanted:
+						continue
+					now = time.monotonic()
+					if child.next_start is not None:
+						if now >= child.next_start:
+							child.tail.clear()
+							self._launch(child)
+						continue
+					if child.process.poll() is not None:
+						self._failed(child, f"exited with code {child.process.returncode}", now)
+						continue
+					reason = self._stalled(child, now)
+					if reason is not None:
+						self._terminate(child.process)
+						self._failed(child, reason, now)
+
+	def status(self):
+		now = time.monotonic()
+		children = {}
+		for name, child in self.children.items():
+			running = child.running()
+			children[name] = {
+				"wanted": child.wanted,
+				"running": running,
+				"pid": child.process.pid if running else None,
+				"uptime": round(now - child.started, 1) if running else None,
+				"restarts": child.restarts,
+				"restart_in": round(max(0.0, child.next_start - now), 1) if child.next_start is not None else None,
+				"heartbeats": {camera: round(now - beat, 2) for camera, beat in child.beats.items()} if running else {},
+			}
+		return {"children": children, "history": list(self.history)}
+
+	def close(self):
+		self.running = False
+		for name in self.children:
+			self.stop(name)
+		if self.sock is not None:
+			self.sock.close()
@@ -0,0 +1,214 @@
+import collections, itertools, time, cv2
+
+
+def iou(a, b):
+	"""
+	Intersection over union of two (top, right, bottom, left) boxes
+	"""
+	top, bottom = max(a[0], b[0]), min(a[2], b[2])
+	left, right = max(a[3], b[3]), min(a[1], b[1])
+	inter = max(0, bottom - top) * max(0, right - left)
+	area_a = (a[2] - a[0]) * (a[1] - a[3])
+	area_b = (b[2] - b[0]) * (b[1] - b[3])
+	union = area_a + area_b - inter
+	return inter / union if union > 0 else 0.0
+
+
+def create_cv_tracker():
+	"""
+	Cheapest OpenCV single object tracker available (MOSSE/KCF need opencv-contrib),
+	or None, in which case boxes are held between detections.
+	"""
+	for module, name in (("legacy", "TrackerMOSSE_create"), (None, "TrackerMOSSE_create"), ("legacy", "TrackerKCF_create"), (None, "TrackerKCF_create")):
+		owner = getattr(cv2, module, None) if module else cv2
+		factory = getattr(owner, name, None)
+		if factory is not None:
+			return factory()
+	return None
+
+
+class Track:
+	_ids = itertools.count(1)
+
+	def __init__(self, box, confirm=3):
+		self.id = next(Track._ids)
+		self.box = box
+		self.name = "Unknown"
+		self.votes = collections.Counter()
+		# the last encodings, the identity is confirmed once they all agree
+		self.recent = collections.deque(maxlen=confirm)
+		self.confirmed = None
+		self.confidence = 0.0
+		self.misses = 0
+		self.cv_tracker = None
+
+	def vote(self, name):
+		self.votes[name] += 1
+		self.recent.append(name)
+		if len(self.recent) == self.recent.maxlen and len(set(self.recent)) == 1:
+			self.confirmed = name
+		# until confirmed the latest encoding, one blurred first frame doesn't stick
+		self.name = self.confirmed if self.confirmed is not None else name
+
+	def forget(self):
+		self.confidence = 0.0
+		self.votes.clear()
+		self.recent.clear()
+		self.confirmed = None
+		self.name = "Unknown"
+
+
+class FaceTracker:
+	"""
+	Follows faces between detections so each person is encoded once per track
+	instead of once per frame. Full face detection runs every detect_interval
+	frames, when there are no tracks or when a track is lost. A track is only
+	re-encoded when its confidence drops below reencode_below. Encoding sets
+	it from how clearly the face matched: 1 when the distance is at least
+	match_margin under the tolerance, proportionally less when closer to it
+	and 0 for "Unknown" or a track whose identity isn't confirmed yet (the
+	last confirm encodings agreeing), so those are encoded again on the next
+	frame. It decays every frame and is scaled by the overlap when a
+	detection matches the track by less than iou_keep.
+	A track's name is its confirmed identity, until then its latest encoding.
+	Drop-in for Facerec.detect_known_faces.
+	"""
+	def __init__(self, fr, detect_interval=5, max_misses=2, reencode_below=0.5, decay=0.95, match_margin=0.1, confirm=3, iou_match=0.3, iou_keep=0.5, max_gap=1.0):
+		self.fr = fr
+		self.detect_interval = detect_interval
+		self.max_misses = max_misses
+		self.reencode_below = reencode_below
+		self.decay = decay
+		self.match_margin = match_margin
+		self.confirm = confirm
+		self.iou_match = iou_match
+		self.iou_keep = iou_keep
+		self.max_gap = max_gap
+		self.tracks = []
+		self.since_detect = 0
+		self.last_update = 0.0
+
+		# counters
+		self.frames = 0
+		self.detections = 0
+		self.encodes = 0
+
+	def load_encoding_images(self, images_path, sync=True):
+		self.fr.load_encoding_images(images_path, sync)
+		self._forget_identities()
+
+	def use_facerec(self, fr):
+		"""
+		Match with fr (a Facerec with a newer gallery) from the next frame on
+		"""
+		self.fr = fr
+		self._forget_identities()
+
+	def _forget_identities(self):
+		# the gallery changed, every track has to be identified again
+		for track in self.tracks:
+			track.forget()
+
+	def _start_cv_tracker(self, track, rgb):
+		track.cv_tracker = create_cv_tracker()
+		if track.cv_tracker is not None:
+			top, right, bottom, left = track.box
+			track.cv_tracker.init(rgb, (left, top, right - left, bottom - top))
+
+	def _follow(self, rgb):
+		"""
+		Move tracks with their OpenCV trackers, returns True if any track was lost
+		"""
+		lost = False
+		for track in self.tracks:
+			if track.cv_tracker is None:
+				continue
+			ok, (x, y, w, h) = track.cv_tracker.update(rgb)
+			if ok:
+				track.box = (int(y), int(x + w), int(y + h), int(x))
+			else:
+				lost = True
+		return lost
+
+	def _associate(self, detections):
+		pairs = sorted(((iou(t.box, d), ti, di) for ti, t in enumerate(self.tracks) for di, d in enumerate(detections)), reverse=True)
+		used_tracks, used_dets, matches = set(), set(), []
+		for overlap, ti, di in pairs:
+			if overlap < self.iou_match:
+				break
+			if ti in used_tracks or di in used_dets:
+				continue
+			used_tracks.add(ti)
+			used_dets.add(di)
+			matches.append((self.tracks[ti], detections[di], overlap))
+		unmatched_tracks = [t for i, t in enumerate(self.tracks) if i not in used_tracks]
+		new_detections = [d for i, d in enumerate(detections) if i not in used_dets]
+		return matches, unmatched_tracks, new_detections
+
+	def _detect(self, rgb):
+		self.detections += 1
+		self.since_detect = 0
+		detections = [tuple(int(v) for v in loc) for loc in self.fr.locate_faces(rgb)]
+		matches, unmatched_tracks, new_detections = self._associate(detections)
+
+		for track, box, overlap in matches:
+			track.box = box
+			track.misses = 0
+			if overlap < self.iou_keep:
+				# the box jumped, it may have moved onto someone else
+				track.confidence *= overlap
+			self._start_cv_tracker(track, rgb)
+		for track in unmatched_tracks:
+			track.misses += 1
+		self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+		for box in new_detections:
+			track = Track(box, self.confirm)
+			self._start_cv_tracker(track, rgb)
+			self.tracks.append(track)
+
+	def _encode(self, rgb):
+		stale = [t for t in self.tracks if t.misses == 0 and t.confidence < self.reencode_below]
+		if not stale:
+			return
+		self.encodes += len(stale)
+		encodings = self.fr.encode_faces(rgb, [t.box for t in stale])
+		names, distances = self.fr.match_encodings(encodings)
+		for track, name, distance in zip(stale, names, distances):
+			track.vote(name)
+			if name == "Unknown" or track.confirmed is None:
+				track.confidence = 0.0
+			else:
+				track.confidence = min(1.0, float(self.fr.tolerance - distance) / self.match_margin)
+
+	def detect_known_faces(self, frame):
+		now = time.monotonic()
+		if now - self.last_update > self.max_gap:
+			# frames were skipped, old boxes say nothing about this frame
+			self.tracks = []
+		self.last_update = now
+		self.frames += 1
+		self.since_detect += 1
+
+		rgb = self.fr.prepare_frame(frame)
+		lost = self._follow(rgb)
+		if lost or not self.tracks or self.since_detect >= self.detect_interval:
+			self._detect(rgb)
+		self._encode(rgb)
+
+		visible = [t for t in self.tracks if t.misses == 0]
+		for track in self.tracks:
+			track.confidence *= self.decay
+		return self.fr.scale_locations([t.box for t in visible]), [t.name for t in visible]
+
+	def identity(self):
+		"""
+		Confirmed identity of the longest identified track on screen, None if
+		no track has one yet
+		"""
+		confirmed = [t for t in self.tracks if t.confirmed is not None]
+		if not confirmed:
+			return None
+		return max(confirmed, key=lambda t: sum(t.votes.values())).confirmed
+
+	def stats(self):
+		return {"frames": self.frames, "detections": self.detections, "encodes": self.encodes, "tracks": len(self.tracks)}
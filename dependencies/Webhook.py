@@ -1,74 +1,151 @@
-from discord_webhook import DiscordWebhook, DiscordEmbed
-import subprocess, threading, os
+import subprocess, threading, os, queue, time, json, requests
+
+USERNAME = "Security Cam"
+AVATAR_URL = "https://omtoi101.com/resources/security_logo.png"
 
 
 class WebhookBuilder:
-		def __init__(self, url, dir) -> None:
+		"""
+		Discord webhook notifier. Events are queued and delivered one at a time
+		by a single worker thread over a pooled HTTP session, the embed and its
+		image go out in one multipart request and failed deliveries are retried
+		with exponential backoff (honouring Discord's retry_after on 429).
+		The url can point at any HTTP server, e.g. a local stand-in for tests.
+		"""
+		def __init__(self, url, dir, retries=4, backoff=1.0, max_backoff=30.0, timeout=30, queue_size=100, metrics=None) -> None:
 			self.url = url
 			self.dir = dir
-			self.webhook = DiscordWebhook(url=self.url, username="Security Cam", avatar_url="https://omtoi101.com/resources/security_logo.png",  rate_limit_retry=True)
-			self.embed = DiscordEmbed(title="Security Bot", color="404040")
-			self.embed.set_author(name="Security Cam", url="https://github.com/omtoi101", icon_url="https://omtoi101.com/resources/security_logo.png")
-		def add_image(self, path) -> DiscordWebhook:
-			self.file_webhook = DiscordWebhook(url=self.url, username="Security Cam", avatar_url="https://omtoi101.com/resources/security_logo.png",  rate_limit_retry=True)
-			_, filename = os.path.split(path)
-			with open(path, "rb") as f:
-				self.file_webhook.add_file(file=f.read(), filename=filename)
-			return self.file_webhook
+			self.retries = retries
+			self.backoff = backoff
+			self.max_backoff = max_backoff
+			self.timeout = timeout
+			self.session = requests.Session()
+			# optional Metrics, gets the queued-to-delivered time of every event
+			self.metrics = metrics
+			self.queue = queue.Queue(maxsize=queue_size)
+
+			# counters
+			self.sent = 0
+			self.failed = 0
+			self.retried = 0
+			self.dropped = 0
+			self.last_latency = 0.0
+			self.total_latency = 0.0
+
+			self.worker = threading.Thread(target=self._run, name="WebhookDispatcher", daemon=True)
+			self.worker.start()
+
+		def _embed(self, title, color, filename=None):
+			embed = {
+				"title": title,
+				"color": int(color, 16),
+				"author": {"name": USERNAME, "url": "https://github.com/omtoi101", "icon_url": AVATAR_URL},
+			}
+			if filename is not None:
+				embed["image"] = {"url": f"attachment://{filename}"}
+			return embed
+
+		def _post(self, payload, attachment=None):
+			"""
+			Send one webhook message, retrying connection errors, 429 and 5xx
+			:param attachment: path of a file to upload with the message, or (file name, bytes) already in memory
+			:return: the last response, or None if the server was never reached
+			"""
+			payload = dict(payload, username=USERNAME, avatar_url=AVATAR_URL)
+			response = None
+			for attempt in range(self.retries + 1):
+				delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+				try:
+					if attachment is None:
+						response = self.session.post(self.url, json=payload, timeout=self.timeout)
+					elif isinstance(attachment, tuple):
+						response = self.session.post(self.url, data={"payload_json": json.dumps(payload)}, files={"files[0]": attachment}, timeout=self.timeout)
+					else:
+						_, filename = os.path.split(attachment)
+						with open(attachment, "rb") as f:
+							response = self.session.post(self.url, data={"payload_json": json.dumps(payload)}, files={"files[0]": (filename, f)}, timeout=self.timeout)
+				except requests.RequestException as e:
+					print(f"Webhook error: {e}")
+				else:
+					if response.status_code < 400:
+						return response
+					if response.status_code == 429:
+						try:
+							delay = float(response.json().get("retry_after", delay))
+						except ValueError:
+							delay = float(response.headers.get("Retry-After", delay))
+					elif response.status_code < 500:
+						return response
+				if attempt < self.retries:
+					self.retried += 1
+					time.sleep(delay)
+			return response
+
+		def _alert(self, title, color, img):
+			# img is a path or (file name, JPEG bytes) from the SnapshotWriter
+			filename = img[0] if isinstance(img, tuple) else os.path.basename(img)
+			return self._post({"embeds": [self._embed(title, color, filename)]}, img)
+
 		def convert_avi_to_mp4(self, avi_file_path, output_name):
 			#print('ffmpeg -i "{input}" -ac 2 -b:v 2000k -c:a aac -c:v libx264 -b:a 160k -vprofile high -bf 0 -strict experimental -f mp4 "{output}" -y'.format(input = avi_file_path, output = output_name))
 			subprocess.run('ffmpeg -i "{input}" -ac 2 -b:v 2000k -c:a aac -c:v libx264 -b:a 160k -vprofile high -bf 0 -strict experimental -f mp4 "{output}" -y'.format(input = avi_file_path, output = output_name),capture_output=True)
 		def add_recording(self, path):
-			self.newpath = os.path.join(self.dir, r"clipped\output.mp4")
-			self.convert_avi_to_mp4(path, self.newpath)
-			self.vid_webhook = DiscordWebhook(url=self.url, username="Security Cam", avatar_url="https://omtoi101.com/resources/security_logo.png",  rate_limit_retry=True)
-			_, self.filename = os.path.split(self.newpath)
-			with open(self.newpath, "rb") as f:
-				self.vid_webhook.add_file(file=f.read(), filename=self.filename)
-			self.ret = self.vid_webhook.execute()
-			#self.ret_json = json.dumps(self.ret.json)
-			if str(self.ret) != "<Response [200]>":
-				self.vid_webhook.remove_files()
-				self.vid_webhook.content = "Video file too big, view hard copy."
-				self.vid_webhook.execute()
+			newpath = os.path.join(self.dir, r"clipped\output.mp4")
+			self.convert_avi_to_mp4(path, newpath)
+			response = self._post({}, newpath)
+			if response is not None and response.status_code == 413:
+				response = self._post({"content": "Video file too big, view hard copy."})
+			return response
 		def intruder(self, img):
-			self.webhook.add_embed(self.embed)
-			self.embed.set_title("INTRUDER DETECTED")
-			self.embed.set_color("FF0000")
-			self.response = self.webhook.execute()
-			self.add_image(img).execute()
+			return self._alert("INTRUDER DETECTED", "FF0000", img)
 		def u_face(self, img):
-			self.webhook.add_embed(self.embed)
-			self.embed.set_title("UNKNOWN FACE DETECTED")
-			self.embed.set_color("EE4B2B")
-			self.response = self.webhook.execute()
-			self.add_image(img).execute()
+			return self._alert("UNKNOWN FACE DETECTED", "EE4B2B", img)
 		def logged_in(self, user, img):
-			self.webhook.add_embed(self.embed)
-			self.embed.set_title(f"{str(user).upper()} LOGGED IN")
-			self.embed.set_color("00FF00")
-			self.response = self.webhook.execute()
-			self.add_image(img).execute()
+			return self._alert(f"{str(user).upper()} LOGGED IN", "00FF00", img)
+
 		def thread(self, action = ("login", "intruder", "unknown", "recording"), *args):
-			self.__init__(self.url, self.dir)
-			if action == "login":
-				self.arglist = []
-				for arg in args:
-					self.arglist.append(arg)
-				self.t = threading.Thread(target=self.logged_in, args=self.arglist).start()
-			elif action == "intruder":
-				self.arglist = []
-				for arg in args:
-					self.arglist.append(arg)
-				self.t = threading.Thread(target=self.intruder, args=self.arglist).start()
-			elif action == "unknown":
-				self.arglist = []
-				for arg in args:
-					self.arglist.append(arg)
-				self.t = threading.Thread(target=self.u_face, args=self.arglist).start()
-			elif action == "recording":
-				self.arglist = []
-				for arg in args:
-					self.arglist.append(arg)
-				self.t = threading.Thread(target=self.add_recording, args=self.arglist).start()
-	
\ No newline at end of file
+			"""
+			Queue an event for delivery, never blocks the caller
+			"""
+			try:
+				self.queue.put_nowait((action, args, time.monotonic()))
+			except queue.Full:
+				self.dropped += 1
+				print(f"Webhook queue full, dropped {action} event")
+
+		def _run(self):
+			handlers = {"login": self.logged_in, "intruder": self.intruder, "unknown": self.u_face, "recording": self.add_recording}
+			while True:
+				job = self.queue.get()
+				if job is None:
+					break
+				action, args, queued = job
+				try:
+					response = handlers[action](*args)
+				except Exception as e:
+					response = None
+					print(f"Webhook {action} failed: {e}")
+				if response is not None and response.status_code < 400:
+					self.sent += 1
+				else:
+					self.failed += 1
+				self.last_latency = time.monotonic() - queued
+				self.total_latency += self.last_latency
+				if self.metrics is not None:
+					self.metrics.observe("webhook", self.last_latency)
+
+		def stats(self):
+			delivered = self.sent + self.failed
+			return {
+				"queue_depth": self.queue.qsize(),
+				"sent": self.sent,
+				"failed": self.failed,
+				"retried": self.retried,
+				"dropped": self.dropped,
+				"last_latency": self.last_latency,
+				"avg_latency": self.total_latency / delivered if delivered else 0.0,
+			}
+
+		def close(self, timeout=10):
+			self.queue.put(None)
+			self.worker.join(timeout=timeout)
@@ -1,30 +1,44 @@
-import os, cv2, pyttsx3, pyvirtualcam, multiprocessing, logging, sys, traceback, json, colorama
-from cvzone.PoseModule import PoseDetector
-from pyvirtualcam import PixelFormat
-from datetime import datetime
+import time
+# the startup profile counts from here, before the heavy imports
+startup_started = time.perf_counter()
+import os, cv2, multiprocessing, logging, sys, traceback, json, colorama, contextlib, signal, importlib
+from concurrent.futures import ThreadPoolExecutor
+from dependencies.Presence import PresenceDetector
 
 from dependencies.Webhook import WebhookBuilder
-from dependencies.Facerec import Facerec
+from dependencies.Capture import FrameGrabber
+from dependencies.Pipeline import InlineInference, ProcessInference, InferencePool, face_stage
+from dependencies.Scheduler import InferenceScheduler
+from dependencies.Motion import MotionDetector
+from dependencies.Recorder import Recorder
+from dependencies.FrameBus import FrameBusPublisher
+from dependencies.StateMachine import DetectionSession, PHRASES
+from dependencies.Metrics import Metrics
+from dependencies.Camera import CameraUnit
+from dependencies.Speech import SpeechService
+from dependencies.Events import EventStore
+from dependencies.Snapshot import SnapshotWriter
+from dependencies.Gallery import Gallery
+from dependencies.LiveConfig import ConfigWatcher, ConfigChange, camera_configs, validate
+from dependencies.Supervisor import Heartbeat
+from dependencies.Startup import StartupProfile, WarmingInference, warm_up
 
 colorama.init()
 
-os.makedirs(os.path.join(os.path.dirname(__file__), "logs\\"), exist_ok=True)
+os.makedirs(os.path.join(os.path.dirname(__file__), "logs"), exist_ok=True)
 logger = logging.getLogger('logger')
-fh = logging.FileHandler(os.path.join(os.path.dirname(__file__), r"logs\s_cam.log"))
+fh = logging.FileHandler(os.path.join(os.path.dirname(__file__), "logs", "s_cam.log"))
 logger.addHandler(fh)
 def exc_handler(exctype, value, tb):
     logger.exception(''.join(traceback.format_exception(exctype, value, tb)))
 sys.excepthook = exc_handler
 
-with open(os.path.join(os.path.dirname(__file__), "config.json"), "r") as conf_file:
+config_path = os.path.join(os.path.dirname(__file__), "config.json")
+with open(config_path, "r") as conf_file:
     config = json.load(conf_file)
 
 
 ## SETTINGS:
-body_inc = config["camera"]["body_inc"]
-face_inc = config["camera"]["face_inc"]
-motion_inc = config["camera"]["motion_inc"]
-undetected_time = config["camera"]["undetected_time"]
 motion_detection = config["settings"]["motion_detection"]
 speech = config["settings"]["speech"]
 webserver = config["settings"]["webserver"]
@@ -35,272 +49,397 @@ notifications = config["settings"]["discord_notifications"]
 url = config.get("discord", {}).get("webhook_url", "")
 
 cam_n = config["camera"]["main"]
-fallback_fps = config["camera"]["fallback_fps"]
-
-
-
-
+# every entry is {"name", "source"} plus any "camera" settings or a "motion" section to override for that camera,
+# an empty list means just camera.main
+cameras = config.get("cameras") or [{"name": "main", "source": cam_n}]
+face_tolerance = config.get("face", {}).get("tolerance", 0.6)
+face_aggregate = config.get("face", {}).get("aggregate", "min")
+face_detector = config.get("face", {}).get("detector", {"backend": "hog"})
+pipeline_mode = config.get("pipeline", {}).get("mode", "single")
+pipeline_slots = config.get("pipeline", {}).get("slots", 4)
+pipeline_workers = config.get("pipeline", {}).get("workers", 2)
+scheduler_conf = config.get("scheduler", {})
+recorder_conf = config.get("recorder", {})
+stream_conf = config.get("stream", {})
+stream_transport = stream_conf.get("transport", "bus")
+metrics_conf = config.get("metrics", {})
+speech_conf = config.get("speech", {})
+events_conf = config.get("events", {})
+
+
+def pose_settings(config):
+	# person presence for the body counter, see dependencies/Presence.py
+	presence_conf = config.get("presence", {})
+	return {
+		"width": presence_conf.get("width", 320),
+		"model_complexity": presence_conf.get("model_complexity", 0),
+		"motion_regions": presence_conf.get("motion_regions", True),
+		"skip_on_face": presence_conf.get("skip_on_face", True),
+		"escalate": presence_conf.get("escalate", True),
+	}
+
+def tracking_settings(config):
+	tracking_conf = config.get("tracking", {})
+	if not tracking_conf.get("enabled", True):
+		return None
+	return {
+		"detect_interval": tracking_conf.get("detect_interval", 5),
+		"max_misses": tracking_conf.get("max_misses", 2),
+		"reencode_below": tracking_conf.get("reencode_below", 0.5),
+		"decay": tracking_conf.get("decay", 0.95),
+		"match_margin": tracking_conf.get("match_margin", 0.1),
+		"confirm": tracking_conf.get("confirm", 3),
+	}
+
+def make_capture(camera_conf):
+	return FrameGrabber(camera_conf["source"], 1280, 720, buffer_size=camera_conf.get("capture_buffer", 4)).start()
+
+def make_motion(camera_motion):
+	return MotionDetector(
+		width=camera_motion.get("width", 320),
+		model=camera_motion.get("model", "average"),
+		learning_rate=camera_motion.get("learning_rate", 0.05),
+		threshold=camera_motion.get("threshold", 25),
+		min_area=camera_motion.get("min_area", 5000),
+		min_score=camera_motion.get("min_score", 0.0),
+		include=camera_motion.get("zones", {}).get("include"),
+		exclude=camera_motion.get("zones", {}).get("exclude"))
+
+def make_inline_inference(config, detector, images_dir, gallery_ready=None):
+	"""
+	:param gallery_ready: future of the gallery sync at startup, the models load while it runs
+	"""
+	face = config.get("face", {})
+	face_rec = face_stage({"tolerance": face.get("tolerance", 0.6), "aggregate": face.get("aggregate", "min"), "detector": detector}, tracking_settings(config))
+	presence = PresenceDetector(**pose_settings(config))
+	if gallery_ready is not None:
+		gallery_ready.result()
+	face_rec.load_encoding_images(images_dir, sync=False)
+	return InlineInference(face_rec, presence)
+
+def apply_config(change, config, units, speech_service, streams, inline, images_dir):
+	"""
+	Hand a saved config to the running cameras. Thresholds and toggles are
+	set between frames, a camera's capture, motion detector or (inline)
+	face and pose stage is rebuilt next to the running one and swapped in,
+	anything else is only reported as needing a restart.
+	:param streams: camera name -> its publish function, for the webserver toggle
+	:param inline: face and pose run on the camera threads (single mode, one camera)
+	"""
+	settings = config["settings"]
+	speech_service.enabled = settings["speech"]
+	speech_service.dedupe_window = config.get("speech", {}).get("dedupe_window", 10)
+	speech_service.max_per_minute = config.get("speech", {}).get("max_per_minute", 12)
+	scheduler_conf = config.get("scheduler", {})
+	pre_roll = config.get("recorder", {}).get("pre_roll", 3)
+	restart = list(change.restart)
+	if settings["webserver"] and not streams:
+		restart.append("settings.webserver")
+
+	cameras = camera_configs(config)
+	for unit in units:
+		camera = cameras[unit.name]
+		camera_conf = camera["camera"]
+
+		def update(unit=unit, camera_conf=camera_conf):
+			session = unit.session
+			session.body_inc = camera_conf["body_inc"]
+			session.face_inc = camera_conf["face_inc"]
+			session.motion_inc = camera_conf["motion_inc"]
+			session.undetected_time = camera_conf["undetected_time"]
+			session.motion_detection = settings["motion_detection"]
+			session.notifications = settings["discord_notifications"]
+			unit.scheduler.enabled = scheduler_conf.get("enabled", True)
+			unit.scheduler.idle_interval = scheduler_conf.get("idle_interval", 15)
+			unit.scheduler.wake_frames = scheduler_conf.get("wake_frames", 30)
+			unit.publish = streams.get(unit.name) if settings["webserver"] else None
+			if unit.recorder.pre_roll_seconds != pre_roll:
+				unit.recorder.set_pre_roll(pre_roll)
+		unit.between_frames(update)
+
+		# new components are built here while the camera keeps running on the old ones
+		components = change.cameras.get(unit.name, ())
+		if "capture" in components:
+			if str(unit.cap.source) == str(camera_conf["source"]):
+				# most webcams can't be opened twice, close it on the camera thread first
+				def reopen_capture(unit=unit, camera_conf=camera_conf):
+					unit.cap.release()
+					unit.cap = make_capture(camera_conf)
+				unit.between_frames(reopen_capture)
+			else:
+				# another device, opened here while the camera keeps running on the old one
+				cap = make_capture(camera_conf)
+				def swap_capture(unit=unit, cap=cap):
+					old, unit.cap = unit.cap, cap
+					old.release()
+				unit.between_frames(swap_capture)
+		elif "capture_buffer" in components:
+			unit.between_frames(lambda unit=unit, size=camera_conf.get("capture_buffer", 4): unit.cap.resize(size))
+		if "motion" in components:
+			unit.between_frames(lambda unit=unit, detector=make_motion(camera["motion"]): setattr(unit, "motion_detector", detector))
+		if "inference" in components:
+			if inline:
+				inference = make_inline_inference(config, camera["detector"], images_dir)
+				def swap_inference(unit=unit, inference=inference):
+					old, unit.inference = unit.inference, inference
+					old.close()
+				unit.between_frames(swap_inference)
+			else:
+				restart.append(f"{unit.name} face/presence")
 
+	applied = change.live + [f"{name} {', '.join(sorted(components))}" for name, components in change.cameras.items()]
+	if applied:
+		print(f"Config applied: {'; '.join(applied)}")
+	if restart:
+		print(f"Config saved, restart the security system for: {', '.join(restart)}")
 
 
-# text to speech
-engine = pyttsx3.init()
-def speak(text):
-	print(text)
-	if speech:
-		engine.say(text)
-		engine.runAndWait()
-	
 
 # mainloop
 if __name__ == '__main__':
 	multiprocessing.freeze_support()
-	cap = cv2.VideoCapture(cam_n)
-	cap.set(3, 1280)
-	cap.set(4, 720)
-	detector = PoseDetector(detectionCon=0.5, trackCon=0.5)
-	
-	
-	webhook = WebhookBuilder(url, os.path.dirname(__file__))
-	fr = Facerec()
-	fr.load_encoding_images(os.path.join(os.path.dirname(__file__), r".\images"))
-
-
-	frame_width = int( cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-	frame_height =int( cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-	fps = cap.get(cv2.CAP_PROP_FPS)
-	if fps == 0.0:
-		fps = fallback_fps
-	size = (frame_width, frame_height)
-
-	# initializing variables
-	motion_c = 0
-	face_det = []
-	face_c = 0
-	body_c = 0
-	prev = False
-	f_reset = False
-	intruder = True
-	detected = False
-	img_thread = None
-	undetected_c = 0
-	just_ran = []
-	v_path = None
-	check_frame_index = 0
-	face_list = os.listdir(os.path.join(os.path.dirname(__file__), "images\\"))
-
-	def c_face(facelist: list):
-		faces = {}
-		for face in facelist:
-			try:
-				faces[face]+=1
-			except KeyError:
-				faces[face] = 0
-		highest = 0
-		highest_n = None
-		for val in faces:
-			if faces[val] > highest:
-				highest = faces[val]
-				highest_n = val
-			
-		return highest_n
-
-
-
-
-
-	with pyvirtualcam.Camera(frame_width, frame_height, fps, fmt=PixelFormat.BGR) as cam:
-		while True:
-			check_frame_index+=1
-			if check_frame_index == 50:
-				check_frame_index = 0
-				if face_list != os.listdir(os.path.join(os.path.dirname(__file__), "images\\")):
-					face_list = os.listdir(os.path.join(os.path.dirname(__file__), "images\\"))
-					fr.load_encoding_images
-					fr.load_encoding_images(os.path.join(os.path.dirname(__file__), r".\images"))
-					print("Reloaded faces")
-
-			ret1, frame = cap.read()
-			ret2, frame2 = cap.read()
-			if not ret1 or not ret2:
-				print("Error: Could not read frames from camera.")
-			else:
-				diff = cv2.absdiff(frame, frame2)
-				gray = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-			blur = cv2.GaussianBlur(gray, (5,5), 0)
-			_, thresh = cv2.threshold(blur, 20, 255, cv2.THRESH_BINARY)
-			dilated = cv2.dilate(thresh, None, iterations=3)
-			contours, _ = cv2.findContours(dilated, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-			for contour in contours:
-				(x, y, w, h) = cv2.boundingRect(contour)
-
-				if cv2.contourArea(contour) < 5000:
-					continue
-				cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 225, 225), 1)
-				cv2.putText(frame, "Status: {}".format('Movement'), (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 225, 225), 2)
-
-			frame = cv2.resize(frame, (1280, 720))
-			_, frame2 = cap.read()
-			if contours != ():
-				motion_c+=1
-				motion = True
-			else:
-				motion = False
-
-			
-
-			## face
-			face_locations, face_names = fr.detect_known_faces(frame)
-			for face_loc, name in zip(face_locations, face_names):
-				if name == "Unknown":
-					color = (0, 0, 225)
-				else:
-					color = (0, 225, 0)
-				y1, x2, y2, x1 = face_loc[0], face_loc[1], face_loc[2], face_loc[3]
-
-				cv2.putText(frame, name,(x1, y1 - 10), cv2.FONT_HERSHEY_DUPLEX, 1, color, 1)
-				cv2.rectangle(frame, (x1, y1), (x2, y2), color, 1)
-			if face_locations.size > 0:
-				face_c+=1
-				face = True
-				face_det.append(name)
-			else:
-				face = False
-			
-		
-			
-			## body
-			img = detector.findPose(frame, draw=False)
-			_, bboxInfo = detector.findPosition(img, bboxWithHands=False)
-			if bboxInfo != {}:
-				body = True
-				body_c+=1
+	# run.py's supervisor stops the system with SIGTERM (CTRL_BREAK on Windows), unwind through the finally below
+	def shutdown(signum, frame):
+		sys.exit(0)
+	signal.signal(signal.SIGTERM, shutdown)
+	if hasattr(signal, "SIGBREAK"):
+		signal.signal(signal.SIGBREAK, shutdown)
+	# every camera loop reports in after each frame, so a hung camera gets the process restarted
+	heartbeat = Heartbeat()
+	# time to first frame and to first detection, printed and exported as startup_* gauges
+	profile = StartupProfile(startup_started)
+	profile.mark("imports")
+	def frame_done(name):
+		heartbeat.beat(name)
+		profile.mark("first_frame", name)
+	# stage timings and counters, read by run.py for /api/metrics
+	metrics = Metrics(
+		os.path.join(os.path.dirname(__file__), "logs", "metrics.json") if metrics_conf.get("enabled", True) else None,
+		interval=metrics_conf.get("interval", 1.0),
+		window=metrics_conf.get("window", 512))
+	webhook = WebhookBuilder(url, os.path.dirname(__file__), metrics=metrics)
+	images_dir = os.path.join(os.path.dirname(__file__), "images")
+	face_kwargs = {"tolerance": face_tolerance, "aggregate": face_aggregate, "detector": face_detector}
+	pose_kwargs = pose_settings(config)
+	tracking_kwargs = tracking_settings(config)
+	camera_conf_by_name = camera_configs(config)
+	multi_camera = len(cameras) > 1
+	use_pool = multi_camera or pipeline_mode == "pool"
+
+	# the cameras open first and run capture, motion and recording right away, while the
+	# gallery sync, model imports and model loading run next to them and are swapped in when warm
+	loader = ThreadPoolExecutor(max_workers=2 * len(cameras) + 3, thread_name_prefix="Startup")
+	opening = {name: loader.submit(profile.run, "camera_open", make_capture, camera["camera"], camera=name) for name, camera in camera_conf_by_name.items()}
+
+	# encode what was added to images/ while nothing was running, every reader then maps the published gallery
+	gallery = Gallery(images_dir)
+	def sync_gallery():
+		gallery.sync()
+		gallery.folder_changed()
+		gallery.changed()
+	gallery_ready = loader.submit(profile.run, "gallery", sync_gallery)
+	if pipeline_mode != "process" or use_pool:
+		# dlib and MediaPipe take seconds to import, they load side by side (the face/pose processes import their own)
+		for module in ("face_recognition", "mediapipe"):
+			loader.submit(profile.run, f"import_{module}", importlib.import_module, module)
+
+	pool_ready = None
+	if use_pool:
+		# one gallery and one set of face/pose workers for every camera
+		def make_pool():
+			gallery_ready.result()
+			return InferencePool(images_dir, face_kwargs, pose_kwargs, workers=pipeline_workers, tracking_kwargs=tracking_kwargs)
+		pool_ready = loader.submit(profile.run, "pool", make_pool)
+
+	def load_inference(name, camera):
+		# a camera can pick its own detector backend, see "face_detector" in the cameras list
+		with profile.stage("models", name):
+			if use_pool:
+				inference = pool_ready.result().client(name, camera["detector"])
+			elif pipeline_mode == "process":
+				# face and pose run in their own processes, frames shared through shared memory
+				gallery_ready.result()
+				inference = ProcessInference((720, 1280, 3), images_dir, dict(face_kwargs, detector=camera["detector"]), pose_kwargs, slots=pipeline_slots, tracking_kwargs=tracking_kwargs)
 			else:
-				body = False
-				
-
-
-
-
-			## recorder
-			now = datetime.now()
-			file_t = now.strftime("%d-%m-%Y_%H-%M-%S")
-			path_t = now.strftime("%d-%m-%Y_%H")
-			path = os.path.join(os.path.dirname(__file__), fr".\clipped\{path_t}")
-			if body or face:
-				prev = True
-			if body_c == 1 or (face_c == 1 and not f_reset) and "recorder" not in just_ran:
-				result = cv2.VideoWriter(fr"{path}\recording_{file_t}.avi",  
-							cv2.VideoWriter_fourcc(*'MJPG'),  
-							10, size)
-				v_path = fr"{path}\recording_{file_t}.avi"
-				just_ran.append("recorder")
-			if body_c > 5 or face_c > 5:
-				result.write(frame)
-
-
-			## reset
-			if not body and not face and not motion and prev:
-				undetected_c+=1
-			
-
-			if undetected_c == undetected_time:
-				if intruder and (body_c > 5 or face_c > 5) and notifications:
-					webhook.thread("recording", v_path)
-				print("Camera reset.")
-				undetected_c = 0
-				f_reset = False
-				detected = False
-				intruder = True
-				face_c = 0
-				face_det = []
-				prev = False
-				body_c = 0
-				motion_c = 0
-				just_ran = []
-			
-			
-			## files
-			if not os.path.exists(path):
-				os.makedirs(path)
-			
-			
-			## notification
-			if motion_detection and motion_c == motion_inc and "motion" not in just_ran:
-				if not f_reset:
-					multiprocessing.Process(target=speak, args=["Motion detected"], daemon=True).start()
-				just_ran.append("motion")
-			
-			
-			if body_c == body_inc and face_c == 0 and "body_1" not in just_ran:
-				if not f_reset:
-					multiprocessing.Process(target=speak, args=["Person detected initiate face detection"], daemon=True).start()
-				cv2.imwrite(rf"{path}\body_{file_t}.jpg", frame)
-				just_ran.append("body_1")
-			
-			
-			elif body_c == body_inc*2 and face_c == 0 and "body_2" not in just_ran:
-				if not f_reset:
-					multiprocessing.Process(target=speak, args=["Initiate face detection now you are already on camera"], daemon=True).start()
-				cv2.imwrite(rf"{path}\body_1_{file_t}.jpg", frame)
-				just_ran.append("body_2")
-			
-			
-			elif body_c == body_inc*3 and face_c == 0 and "body_3" not in just_ran:
-				if not f_reset:
-					multiprocessing.Process(target=speak, args=["Face not detected"], daemon=True).start()
-				cv2.imwrite(rf"{path}\body_nf_{file_t}.jpg", frame)
-				just_ran.append("body_3")
-			
-			
-			elif body_c == body_inc*4 and face_c == 0 and "body_4" not in just_ran:
-				cv2.imwrite(rf"{path}\body_nf2_{file_t}.jpg", frame)
-				if not f_reset:
-					multiprocessing.Process(target=speak, args=["Intruder detected"], daemon=True).start()
-					if notifications:
-						webhook.thread("intruder", rf"{path}\body_nf2_{file_t}.jpg")
-				
-				just_ran.append("body_4")
-			
-			
-			elif face_c == 1 and "face_1" not in just_ran:
-				if not f_reset:
-					multiprocessing.Process(target=speak, args=["Face detected look into the camera for reconition"], daemon=True).start()
-				if name == "Unknown":
-					cv2.imwrite(rf"{path}\unknown_face_{file_t}.jpg", frame)
-				just_ran.append("face_1")
-			
-
-			elif face_c == face_inc:
-				d_face = c_face(face_det)
-				if d_face == "Unknown":
-					cv2.imwrite(rf"{path}\verification_{name}_face_{file_t}.jpg", frame)
-					if not f_reset:
-						multiprocessing.Process(target=speak, args=["Unknown face detected"], daemon=True).start()
-						if notifications:
-							webhook.thread("unknown", rf"{path}\verification_{name}_face_{file_t}.jpg")
-					face_c = 0
-					f_reset = True
-
-
-				elif not detected:
-					cv2.imwrite(rf"{path}\verification_{name}_face_{file_t}.jpg", frame)
-					if not f_reset or intruder:
-						multiprocessing.Process(target=speak, args=[f"Welcome, {name}"], daemon=True).start()
-						if notifications:
-							webhook.thread("login", name, rf"{path}\verification_{name}_face_{file_t}.jpg")
-					face_c = 0
-					detected = True
-					intruder = False
-					f_reset = True
-			
-			
-			if webserver:
-				img = cv2.resize(img, (640, 480))
+				inference = make_inline_inference(config, camera["detector"], images_dir, gallery_ready)
+		with profile.stage("warm_up", name):
+			warm_up(inference)
+		return inference
+	loading = {name: loader.submit(load_inference, name, camera) for name, camera in camera_conf_by_name.items()}
+	pool = None
+
+	# detections, snapshots and clips are indexed in events.db for run.py's /api/events
+	events = None
+	if events_conf.get("enabled", True):
+		events = EventStore(os.path.join(os.path.dirname(__file__), "events.db"))
+		if events.created and events_conf.get("backfill", True):
+			# index what earlier runs left in clipped/ once, when the database is new
+			events.backfill(os.path.join(os.path.dirname(__file__), "clipped"), camera="" if multi_camera else cameras[0]["name"])
+
+	# snapshots are encoded and written off the frame loop
+	snapshots = SnapshotWriter(workers=config.get("snapshots", {}).get("workers", 2))
+
+	# text to speech, one worker for every camera
+	labels = [f"{camera['name']}: " if multi_camera else "" for camera in cameras]
+	speech_service = SpeechService(
+		enabled=speech,
+		phrases=[label + phrase for label in labels for phrase in PHRASES],
+		cache_dir=os.path.join(os.path.dirname(__file__), "cache", "speech") if speech_conf.get("cache", True) else None,
+		dedupe_window=speech_conf.get("dedupe_window", 10),
+		max_per_minute=speech_conf.get("max_per_minute", 12))
+	try:
+		# run.py's /api/speak is said by this service too, one voice for both
+		speech_service.listen(speech_conf.get("port", 8042))
+	except OSError as e:
+		print(f"Speech port unavailable, announcements from the dashboard won't be spoken: {e}")
+
+	# face and pose run on the camera thread, the only mode where a config change can rebuild them in place
+	inline = not use_pool and pipeline_mode != "process"
+	units = []
+	for name, camera in camera_conf_by_name.items():
+		camera_conf = camera["camera"]
+		cap = opening[name].result()
+		# face and pose are swapped in once loaded
+		inference = WarmingInference()
+		motion_detector = make_motion(camera["motion"])
+		scheduler = InferenceScheduler(
+			enabled=scheduler_conf.get("enabled", True),
+			idle_interval=scheduler_conf.get("idle_interval", 15),
+			wake_frames=scheduler_conf.get("wake_frames", 30))
+
+		fps = cap.get(cv2.CAP_PROP_FPS)
+		if fps == 0.0:
+			fps = camera_conf["fallback_fps"]
+		recorder = Recorder(
+			pre_roll=recorder_conf.get("pre_roll", 3),
+			fps=fps,
+			queue_seconds=recorder_conf.get("queue_seconds", 1))
+		session = DetectionSession(camera_conf["body_inc"], camera_conf["face_inc"], camera_conf["motion_inc"], camera_conf["undetected_time"], motion_detection, notifications)
+
+		clip_dir = os.path.join(os.path.dirname(__file__), "clipped")
+		if multi_camera:
+			clip_dir = os.path.join(clip_dir, name)
+		units.append(CameraUnit(name, cap, inference, motion_detector, scheduler, session, recorder, metrics.for_camera(name),
+			clip_dir, speech_service.say, webhook, snapshots, label=f"{name}: " if multi_camera else "", events=events, heartbeat=frame_done))
+
+
+	# processed frames go to run.py over the shared memory frame bus, or through a virtual camera
+	buses = []
+	# every camera's publish function, kept for turning the webserver stream off and back on
+	streams = {}
+	output = contextlib.nullcontext()
+	if webserver and stream_transport == "bus":
+		# run.py only shows the first camera, the others would copy every frame into a bus nobody reads
+		bus = FrameBusPublisher(stream_conf.get("name", "securehome_frames"), (720, 1280, 3), slots=stream_conf.get("slots", 3))
+		buses.append(bus)
+		units[0].publish = lambda frame, captured, meta, bus=bus: bus.publish(frame, captured.index, captured.timestamp, meta)
+	elif webserver:
+		import pyvirtualcam
+		from pyvirtualcam import PixelFormat
+		cap = units[0].cap
+		fps = cap.get(cv2.CAP_PROP_FPS) or config["camera"]["fallback_fps"]
+		output = pyvirtualcam.Camera(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), fps, fmt=PixelFormat.BGR)
+
+	with output as cam:
+		if cam is not None:
+			# the virtual camera only carries the first camera
+			def send(frame, captured, meta):
+				img = cv2.resize(frame, (640, 480))
 				cam.send(img)
 				cam.sleep_until_next_frame()
+			units[0].publish = send
+		streams = {unit.name: unit.publish for unit in units if unit.publish is not None}
+
+		# settings saved from the dashboard (or by hand) are applied without a restart where possible
+		config_watcher = ConfigWatcher(config_path)
+		for unit in units:
+			unit.start()
+			profile.mark("capture_started", unit.name)
+		# each camera gets its face and pose stage between two frames once it is loaded and warm
+		for unit in units:
+			def swap_in(future, unit=unit):
+				if future.exception() is None:
+					def swap(inference=future.result()):
+						unit.inference = inference
+						profile.mark("detection_ready", unit.name)
+					unit.between_frames(swap)
+			loading[unit.name].add_done_callback(swap_in)
+		ready = False
+		try:
+			while True:
+				time.sleep(1.0)
+				for unit in units:
+					if unit.error is not None:
+						raise unit.error
+
+				if not ready and all(future.done() for future in loading.values()):
+					# a model that failed to load stops the system like a camera error
+					for future in loading.values():
+						future.result()
+					pool = pool_ready.result() if pool_ready is not None else None
+					loader.shutdown(wait=False)
+					ready = True
+				if not profile.reported and profile.reached("detection_ready", [unit.name for unit in units]):
+					profile.reported = True
+					profile.combine("detection_ready", [unit.name for unit in units])
+					print("Startup:\n" + "\n".join(profile.report()))
+					profile.to_metrics(metrics)
+
+				# photos copied into images/ by hand, run.py, bot.py and add_face.py publish their own
+				# both wait for the startup gallery sync and models
+				if ready and gallery.folder_changed():
+					gallery.sync()
+				if ready and gallery.changed():
+					if pool is not None:
+						pool.reload_faces(images_dir)
+					elif hasattr(units[0].inference, "load_faces"):
+						# loaded here, swapped in by the camera thread between two frames
+						inference = units[0].inference
+						fr = inference.load_faces(images_dir)
+						units[0].between_frames(lambda inference=inference, fr=fr: inference.use_faces(fr))
+					else:
+						units[0].inference.reload_faces(images_dir)
+					print("Reloaded faces")
 
-	cap.release()
-	cv2.destroyAllWindows()
-
-
+				if ready and config_watcher.changed():
+					new_config = config_watcher.load()
+					if new_config is not None:
+						try:
+							validate(new_config)
+							change = ConfigChange(config, new_config)
+							if change:
+								apply_config(change, new_config, units, speech_service, streams, inline, images_dir)
+							config = new_config
+						except Exception as e:
+							# keep running on the config in use, the next save is compared against it
+							print(f"Config not applied, keeping the current one: {e}")
+
+				for unit in units:
+					unit.report()
+				if pool is not None:
+					metrics.gauge("pool_waiting", pool.stats()["waiting"])
+				metrics.collect("webhook", webhook.stats(), gauges=("queue_depth", "last_latency", "avg_latency"))
+				metrics.collect("speech", speech_service.stats(), gauges=("queue_depth",))
+				metrics.collect("snapshots", snapshots.stats(), gauges=("queue_depth",))
+				if events is not None:
+					metrics.collect("events", events.stats(), gauges=("queue_depth",))
+				metrics.flush()
+		finally:
+			loader.shutdown(wait=False, cancel_futures=True)
+			for unit in units:
+				unit.close()
+				# loaded but not swapped in yet
+				future = loading[unit.name]
+				if future.done() and future.exception() is None and future.result() is not unit.inference:
+					future.result().close()
+			if pool_ready is not None and pool_ready.done() and pool_ready.exception() is None:
+				pool_ready.result().close()
+			for bus in buses:
+				bus.close()
+			# snapshots first, their webhook notifications are queued from the writer threads
+			snapshots.close()
+			webhook.close()
+			speech_service.close()
+			if events is not None:
+				events.close()
+			cv2.destroyAllWindows()
@@ -1,8 +1,18 @@
-import threading, time, cv2, logging, sys, traceback, os, json, colorama, subprocess
+import threading, time, cv2, logging, sys, traceback, os, json, colorama
 from flask import Response, Flask, render_template, jsonify, request, send_from_directory
 from flask_socketio import SocketIO, emit
 from datetime import datetime
 
+from dependencies.FrameHub import FrameHub
+from dependencies.FrameBus import FrameBusSubscriber
+from dependencies import Metrics
+from dependencies.Speech import speak_remote
+from dependencies import Events
+from dependencies.Gallery import Gallery
+from dependencies.LogRelay import LogRelay
+from dependencies import LiveConfig
+from dependencies.Supervisor import Supervisor
+
 colorama.init()
 
 os.makedirs(os.path.join(os.path.dirname(__file__), "logs"), exist_ok=True)
@@ -18,7 +28,9 @@ with open(os.path.join(os.path.dirname(__file__), "config.json"), "r") as conf_f
 
 
 
-outputFrame = None
+# latest frame, JPEG-encoded once and shared by every /video_feed client
+hub = FrameHub()
+# guards cap while the camera is reloaded
 lock = threading.Lock()
 system_status = {
     'security': False,
@@ -26,16 +38,19 @@ system_status = {
     'webserver': True
 }
 
-cap = cv2.VideoCapture(config["camera"]["v_cam"])
+# frames come from main.py over the shared memory frame bus, or from its virtual camera
+stream_transport = config.get("stream", {}).get("transport", "bus")
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'security_system_key'
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-time.sleep(2.0)
+# threading mode so /video_feed clients can block on the frame hub's condition variable
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
 
-# Global process references
-security_process = None
-bot_process = None
+# known faces, published for main.py as they are added or deleted
+gallery = Gallery(os.path.join(os.path.dirname(__file__), "images"))
+# photos are checked and encoded when they are enrolled, batches on a pool of worker processes
+enrollment_conf = config.get("enrollment", {})
+enroll_quality = {key: enrollment_conf[key] for key in ("min_face", "min_sharpness") if key in enrollment_conf}
+enroll_pool = None
 
 @app.route("/")
 def index():
@@ -43,29 +58,90 @@ def index():
 
 @app.route("/api/status")
 def get_status():
-    global security_process, bot_process
-    
     # Update status based on actual process states
-    system_status['security'] = security_process is not None and security_process.poll() is None
-    system_status['discord_bot'] = bot_process is not None and bot_process.poll() is None
+    system_status['security'] = supervisor.is_running("security")
+    system_status['discord_bot'] = supervisor.is_running("discord_bot")
     
-    return jsonify(system_status)
+    # detection metadata of the latest streamed frame (frame bus only)
+    return jsonify(dict(system_status, detections=hub.meta))
+
+# written by main.py about once a second
+metrics_path = os.path.join(os.path.dirname(__file__), "logs", "metrics.json")
+
+@app.route("/api/metrics")
+def get_metrics():
+    # Prometheus text exposition format
+    return Response(Metrics.prometheus(Metrics.load(metrics_path)), mimetype="text/plain; version=0.0.4")
+
+@app.route("/api/metrics/summary")
+def get_metrics_summary():
+    return jsonify(Metrics.summary(Metrics.load(metrics_path)))
+
+# written by main.py's event store
+events_path = os.path.join(os.path.dirname(__file__), "events.db")
+clipped_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), "clipped"))
+
+@app.route("/api/events")
+def get_events():
+    """
+    Detection history, newest first. Filters: kind, camera, identity, since/until (unix time),
+    pages of limit (max 500) events continue from the previous page's "next"
+    """
+    if not os.path.exists(events_path):
+        return jsonify({"success": True, "events": [], "next": None})
+    try:
+        since = request.args.get("since", type=float)
+        until = request.args.get("until", type=float)
+        limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+        conn = Events.connect(events_path, readonly=True)
+        try:
+            events, next_cursor = Events.query(conn, kind=request.args.get("kind"), camera=request.args.get("camera"),
+                identity=request.args.get("identity"), since=since, until=until, cursor=request.args.get("cursor"), limit=limit)
+        finally:
+            conn.close()
+        for event in events:
+            event["media_url"] = f"/api/events/{event['id']}/media" if event["media"] else None
+        return jsonify({"success": True, "events": events, "next": next_cursor})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+@app.route("/api/events/<int:event_id>/media")
+def get_event_media(event_id):
+    if not os.path.exists(events_path):
+        return '', 404
+    conn = Events.connect(events_path, readonly=True)
+    try:
+        row = conn.execute("SELECT media FROM events WHERE id = ?", (event_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None or not row["media"]:
+        return '', 404
+    # only serve files from clipped/
+    media = os.path.realpath(row["media"])
+    try:
+        # a prefix check would also let clipped_old/ through
+        inside = os.path.commonpath([media, clipped_dir]) == clipped_dir
+    except ValueError:
+        # another drive on Windows
+        inside = False
+    if inside and os.path.exists(media):
+        return send_from_directory(os.path.dirname(media), os.path.basename(media))
+    return '', 404
 
 @app.route("/api/screenshot", methods=['POST'])
 def take_screenshot():
-    global outputFrame, lock
     try:
-        with lock:
-            if outputFrame is not None:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                screenshot_dir = os.path.join(os.path.dirname(__file__), "screenshots")
-                os.makedirs(screenshot_dir, exist_ok=True)
-                filename = f"screenshot_{timestamp}.jpg"
-                filepath = os.path.join(screenshot_dir, filename)
-                cv2.imwrite(filepath, outputFrame)
-                return jsonify({"success": True, "filename": filename, "path": filepath})
-            else:
-                return jsonify({"success": False, "error": "No frame available"})
+        outputFrame = hub.latest()
+        if outputFrame is not None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            screenshot_dir = os.path.join(os.path.dirname(__file__), "screenshots")
+            os.makedirs(screenshot_dir, exist_ok=True)
+            filename = f"screenshot_{timestamp}.jpg"
+            filepath = os.path.join(screenshot_dir, filename)
+            cv2.imwrite(filepath, outputFrame)
+            return jsonify({"success": True, "filename": filename, "path": filepath})
+        else:
+            return jsonify({"success": False, "error": "No frame available"})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
@@ -100,17 +176,27 @@ def save_config():
         with open(backup_path, "w") as backup_file:
             json.dump(current_config, backup_file, indent=4)
         
-        # Save new config
-        with open(os.path.join(os.path.dirname(__file__), "config.json"), "w") as conf_file:
-            json.dump(new_config, conf_file, indent=4)
+        # the security system applies what it can between frames, the rest waits for a restart
+        try:
+            LiveConfig.validate(new_config)
+            change = LiveConfig.ConfigChange(current_config, new_config).summary()
+        except ValueError as e:
+            return jsonify({"success": False, "error": f"Invalid configuration: {e}"})
+        except (KeyError, TypeError, AttributeError) as e:
+            return jsonify({"success": False, "error": f"Invalid configuration: {e!r}"})
         
-        return jsonify({"success": True, "message": "Configuration saved successfully"})
+        # Save new config, atomically since the running security system watches the file
+        LiveConfig.save(os.path.join(os.path.dirname(__file__), "config.json"), new_config)
+        message = "Configuration saved successfully"
+        if change["restart"]:
+            message += ", restart the system for: " + ", ".join(change["restart"])
+        return jsonify({"success": True, "message": message, "changes": change})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
 @app.route("/api/reload_camera", methods=['POST'])
 def reload_camera():
-    global cap, outputFrame, lock
+    global cap, bus, stream_transport
     with open(os.path.join(os.path.dirname(__file__), "config.json"), "r") as conf_file:
         config = json.load(conf_file)
     try:
@@ -118,6 +204,15 @@ def reload_camera():
             # Release current camera
             if cap:
                 cap.release()
+                cap = None
+            stream_transport = config.get("stream", {}).get("transport", "bus")
+            if stream_transport == "bus":
+                bus.detach()
+                bus = FrameBusSubscriber(config.get("stream", {}).get("name", "securehome_frames"))
+                hub.clear()
+                if bus.wait_next(timeout=2.0) is not None:
+                    return jsonify({"success": True, "message": "Frame bus reattached"})
+                return jsonify({"success": False, "error": "No frames on the frame bus, is the security system running?"})
             
             # Small delay to ensure camera is released
             time.sleep(1)
@@ -128,7 +223,7 @@ def reload_camera():
             cap.set(4, 720)   # Height
             
             # Clear current frame
-            outputFrame = None
+            hub.clear()
             
             # Test if camera is working
             ret, test_frame = cap.read()
@@ -142,63 +237,36 @@ def reload_camera():
 
 @app.route("/api/control/<action>", methods=['POST'])
 def system_control(action):
-    global security_process, bot_process, system_status
+    global system_status
     with open(os.path.join(os.path.dirname(__file__), "config.json"), "r") as conf_file:
         config = json.load(conf_file)
     try:
         if action == "start":
             # Start security system
-            if not security_process or security_process.poll() is not None:
-                security_process = subprocess.Popen([
-                    'python', os.path.join(os.path.dirname(__file__), 'main.py')
-                ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-                universal_newlines=True, bufsize=1)
-                system_status['security'] = True
-                
-                # Start log monitoring
-                threading.Thread(target=monitor_process_output, 
-                               args=(security_process, 'SECURITY SYSTEM'), daemon=True).start()
+            supervisor.start("security")
+            system_status['security'] = True
             
             # Start Discord bot if enabled
             if config["settings"]["discord_bot"]:
-                if not bot_process or bot_process.poll() is not None:
-                    bot_process = subprocess.Popen([
-                        'python', os.path.join(os.path.dirname(__file__), 'bot.py')
-                    ], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-                    universal_newlines=True, bufsize=1)
-                    system_status['discord_bot'] = True
-                    
-                    threading.Thread(target=monitor_process_output, 
-                                   args=(bot_process, 'DISCORD BOT'), daemon=True).start()
+                supervisor.start("discord_bot")
+                system_status['discord_bot'] = True
             
             return jsonify({"success": True, "message": "System started"})
             
         elif action == "stop":
-            # Stop security system
-            if security_process and security_process.poll() is None:
-                security_process.terminate()
-                try:
-                    security_process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    security_process.kill()
-                system_status['security'] = False
+            # each one gets stop_timeout seconds to close its cameras and recordings before it is killed
+            supervisor.stop("security")
+            system_status['security'] = False
             
             # Stop Discord bot
-            if bot_process and bot_process.poll() is None:
-                bot_process.terminate()
-                try:
-                    bot_process.wait(timeout=5)
-                except subprocess.TimeoutExpired:
-                    bot_process.kill()
-                system_status['discord_bot'] = False
+            supervisor.stop("discord_bot")
+            system_status['discord_bot'] = False
             
             return jsonify({"success": True, "message": "System stopped"})
             
         elif action == "restart":
-            # Stop first
+            # stop returns once the processes have exited, no need to wait before starting again
             system_control("stop")
-            time.sleep(2)
-            # Then start
             return system_control("start")
             
         else:
@@ -247,30 +315,51 @@ def api_add_user():
             return jsonify({"success": False, "error": "Missing name or image"})
         # Decode base64 image
         import base64
-        from PIL import Image
-        from io import BytesIO
         img_bytes = base64.b64decode(img_data.split(',')[1])
-        img = Image.open(BytesIO(img_bytes))
-        # Save image
-        images_dir = os.path.join(os.path.dirname(__file__), "images")
-        os.makedirs(images_dir, exist_ok=True)
-        img.save(os.path.join(images_dir, f"{name}.jpg"))
+        # checked and encoded once here, main.py picks the encoding up from the gallery
+        result = gallery.enroll(name, img_bytes, **enroll_quality)
+        if not result.ok:
+            return jsonify({"success": False, "error": f"Photo rejected: {result.reason}"})
         return jsonify({"success": True, "message": "User added successfully"})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+@app.route("/api/enroll_batch", methods=['POST'])
+def api_enroll_batch():
+    """
+    Many photos per person at once, either JSON {"people": [{"name": ..., "images": [base64, ...]}, ...]}
+    or a multipart form where every file's field name is the person's name
+    """
+    global enroll_pool
+    try:
+        import base64
+        from werkzeug.utils import secure_filename
+        people = {}
+        # names end up as file names in images/, nothing that could leave the folder
+        if request.files:
+            for name, file in request.files.items(multi=True):
+                people.setdefault(secure_filename(name), []).append(file.read())
+        else:
+            data = request.get_json() or {}
+            for person in data.get("people", []):
+                people.setdefault(secure_filename(person.get("name") or ""), []).extend(base64.b64decode(image.split(',')[-1]) for image in person.get("images") or [])
+        if not people or not all(people) or not all(people.values()):
+            return jsonify({"success": False, "error": "Missing names or images"})
+        if enroll_pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            enroll_pool = ProcessPoolExecutor(max_workers=enrollment_conf.get("workers") or None)
+        names = [name for name, photos in people.items() for _ in photos]
+        results = gallery.enroll_batch(list(people.items()), executor=enroll_pool, **enroll_quality)
+        photos = [{"name": name, "file": result.file, "ok": result.ok, "reason": result.reason} for name, result in zip(names, results)]
+        added = sum(result.ok for result in results)
+        return jsonify({"success": True, "added": added, "rejected": len(results) - added, "photos": photos})
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
 @app.route("/api/list_users", methods=['GET'])
 def list_users():
     try:
-        images_dir = os.path.join(os.path.dirname(__file__), "images")
-        if not os.path.exists(images_dir):
-            return jsonify({"success": True, "users": []})
-        users = []
-        for filename in os.listdir(images_dir):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                user = os.path.splitext(filename)[0]
-                if user:
-                    users.append({"name": user})
+        users = [{"name": user} for user in gallery.users() if user]
         return jsonify({"success": True, "users": users})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
@@ -294,15 +383,7 @@ def delete_user():
         name = data.get("name")
         if not name:
             return jsonify({"success": False, "error": "Missing user name"})
-        images_dir = os.path.join(os.path.dirname(__file__), "images")
-        deleted = False
-        for ext in ["jpg", "jpeg", "png"]:
-            filename = f"{name}.{ext}"
-            filepath = os.path.join(images_dir, filename)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                deleted = True
-        if deleted:
+        if gallery.remove(name):
             return jsonify({"success": True, "message": f"User '{name}' deleted"})
         else:
             return jsonify({"success": False, "error": "User image not found"})
@@ -316,71 +397,103 @@ def api_speak():
         message = data.get("message", "").strip()
         if not message:
             return jsonify({"success": False, "error": "No message provided"})
-        import pyttsx3
-        engine = pyttsx3.init()
-        engine.say(message)
-        engine.runAndWait()
+        # spoken by main.py's speech service, so announcements and the dashboard never talk over each other
+        reply = speak_remote(message, config.get("speech", {}).get("port", 8042))
+        if reply is None:
+            return jsonify({"success": False, "error": "The security system is not running"})
+        if reply == "disabled":
+            return jsonify({"success": False, "error": "Speech is turned off in the settings"})
+        if reply != "queued":
+            return jsonify({"success": False, "error": "Message was just spoken or too many messages, try again shortly"})
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
-def monitor_process_output(process, service_name):
-    """Monitor process output and send to frontend"""
-    try:
-        while process.poll() is None:
-            line = process.stdout.readline()
-            if line:
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                log_entry = f"[{timestamp}] [{service_name}] {line.strip()}"
-                socketio.emit('log', {'data': log_entry})
-    except Exception as e:
-        error_msg = f"Error monitoring {service_name}: {str(e)}"
-        socketio.emit('log', {'data': error_msg})
+@app.route("/api/supervisor")
+def get_supervisor():
+    """
+    State of main.py and bot.py: running, uptime, restarts, seconds since each camera's last heartbeat,
+    and the restart history with the crash log of each
+    """
+    return jsonify(dict(supervisor.status(), success=True))
+
+@app.route("/api/logs")
+def get_logs():
+    """
+    Recent output of the security system and bot, filters: since (record id), level, source
+    """
+    records = log_relay.replay(since=request.args.get("since", 0, type=int),
+        level=request.args.get("level"), source=request.args.get("source"))
+    return jsonify({"success": True, "records": records, "stats": log_relay.stats()})
 
 def getframe():
-    global outputFrame, lock
+    seq = 0
     while True:
         try:
-            ret, img = cap.read()
-            if ret and img is not None:
+            if stream_transport == "bus":
                 with lock:
-                    outputFrame = img
+                    frame = bus.wait_next(seq, timeout=0.5)
+                if frame is not None:
+                    seq, img, _, _, meta = frame
+                    hub.publish(img, meta)
+                continue
+            with lock:
+                ret, img = cap.read()
+            if ret and img is not None:
+                hub.publish(img)
         except Exception as e:
             print(f"Frame capture error: {e}")
         time.sleep(0.033)  # ~30 FPS
 
-def generate():
-    global outputFrame, lock
-    while True:
-        with lock:
-            if outputFrame is None:
-                continue
-            try:
-                (flag, encodedImage) = cv2.imencode(".jpg", outputFrame)
-                if not flag:
-                    continue
-            except Exception as e:
-                print(f"Encoding error: {e}")
-                continue
-        yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + 
-            bytearray(encodedImage) + b'\r\n')
-
 @app.route("/video_feed")
 def video_feed():
-    return Response(generate(),
+    return Response(hub.stream(),
         mimetype="multipart/x-mixed-replace; boundary=frame")
 
 @socketio.on('connect')
 def handle_connect():
     emit('log', {'data': '[SYSTEM] Connected to SecureHome Dashboard'})
+    # what was logged before this client connected
+    emit('logs', {'records': log_relay.replay(), 'replay': True})
 
 if __name__ == '__main__':
+    # everything that opens devices or starts threads, the enrollment worker processes import this module again
+    bus = FrameBusSubscriber(config.get("stream", {}).get("name", "securehome_frames"))
+    cap = cv2.VideoCapture(config["camera"]["v_cam"]) if stream_transport == "vcam" else None
+
+    time.sleep(2.0)
+
+    # output of main.py and bot.py, sent to the dashboard in batches and kept for clients connecting later
+    logs_conf = config.get("logs", {})
+    log_relay = LogRelay(lambda records: socketio.emit('logs', {'records': records}),
+        interval=logs_conf.get("interval", 0.25),
+        history=logs_conf.get("history", 500),
+        max_pending=logs_conf.get("max_pending", 2000))
+
+    # main.py and bot.py, restarted when they exit or main.py's cameras stop getting frames
+    supervisor_conf = config.get("supervisor", {})
+    supervisor = Supervisor(log_relay.add,
+        heartbeat_port=supervisor_conf.get("heartbeat_port", 8041),
+        heartbeat_timeout=supervisor_conf.get("heartbeat_timeout", 5),
+        startup_grace=supervisor_conf.get("startup_grace", 60),
+        backoff=supervisor_conf.get("backoff", 1),
+        max_backoff=supervisor_conf.get("max_backoff", 60),
+        stable_after=supervisor_conf.get("stable_after", 60),
+        stop_timeout=supervisor_conf.get("stop_timeout", 5),
+        crash_dir=os.path.join(os.path.dirname(__file__), "logs", "crashes"))
+    supervisor.add("security", os.path.join(os.path.dirname(__file__), "main.py"), "SECURITY SYSTEM", heartbeat=True)
+    supervisor.add("discord_bot", os.path.join(os.path.dirname(__file__), "bot.py"), "DISCORD BOT")
+
     # Start frame capture thread
     t = threading.Thread(target=getframe)
     t.daemon = True
     t.start()
     
     # Start the Flask-SocketIO server
-    socketio.run(app, host="0.0.0.0", port=8040, debug=False)
+    try:
+        socketio.run(app, host="0.0.0.0", port=8040, debug=False, allow_unsafe_werkzeug=True)
+    finally:
+        # main.py and bot.py don't outlive the dashboard that restarts them
+        supervisor.close()
 
 cv2.destroyAllWindows()
\ No newline at end of file